@@ -1,19 +1,68 @@
 import streamlit as st
 import os
-import subprocess
-import uuid
 import time
-from io import BytesIO
 import sys
 
+import pandas as pd
+
+# modules目录下的脚本既可以命令行运行，也可以在app中直接导入
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+if MODULES_DIR not in sys.path:
+    sys.path.insert(0, MODULES_DIR)
+
+from jobs import JobManager, JobQueueFull, preview_key, summary_key
+from pipeline import result_file_key
+from preview import PreviewReader
+from profiles import DEFAULT_PROFILE, PROFILES
+from readers import xls_supported
+from store import ResultStore, run_periodically
+from writers import DEFAULT_FORMAT, MIME_TYPES, OUTPUT_FORMATS, available_formats
+
 # 确保临时目录存在
 os.makedirs('temp_files', exist_ok=True)
 TEMP_DIR = 'temp_files'
-processed_files = {}  # 存储处理后的文件映射
+# 处理结果按上传内容寻址保存在磁盘上，应用重启后仍可命中
+RESULTS_DIR = os.path.join(TEMP_DIR, 'results')
+# 同时处理的任务数和最多排队的任务数
+MAX_RUNNING_JOBS = 2
+MAX_QUEUED_JOBS = 8
+# 任务进行中时页面自动刷新的间隔（秒）
+POLL_INTERVAL = 1.0
+# 在内存中保留的下载内容数量和时间（秒），页面刷新时不再重复读取结果文件
+DOWNLOAD_CACHE_ENTRIES = 8
+DOWNLOAD_CACHE_TTL = 3600
+# 结果预览每页可选的行数
+PREVIEW_PAGE_SIZES = [20, 50, 100, 200]
+# 上传文件允许的类型：读取.xls需要xlrd，未安装时不接受.xls
+UPLOAD_TYPES = ["xlsx", "xls", "csv"] if xls_supported() else ["xlsx", "csv"]
+
+
+@st.cache_resource
+def get_result_store():
+    """整个应用进程共用一个结果仓库；结果ID自带扩展名（不同输出格式分别缓存）"""
+    return ResultStore(RESULTS_DIR, suffix="")
+
+
+@st.cache_resource
+def get_job_manager():
+    """
+    整个应用进程共用一个任务管理器，并只启动一次后台清理线程；
+    任务在内存中处理，只有处理结果写入结果仓库
+    """
+    store = get_result_store()
+    manager = JobManager(None, store=store, max_running=MAX_RUNNING_JOBS, max_queued=MAX_QUEUED_JOBS)
+
+    def cleanup():
+        store.evict()
+        manager.prune()
+        clean_temp_files()
+
+    run_periodically(cleanup)
+    return manager
 
 
 def clean_temp_files(max_age=3600):
-    """清理过期临时文件（默认1小时）"""
+    """清理过期临时文件（默认1小时），结果仓库目录由仓库自己清理"""
     now = time.time()
     for filename in os.listdir(TEMP_DIR):
         file_path = os.path.join(TEMP_DIR, filename)
@@ -24,94 +73,181 @@ def clean_temp_files(max_age=3600):
                 pass
 
 
-def process_file(uploaded_file1, uploaded_file2):
-    """处理上传的文件，按顺序执行两个处理脚本"""
+def process_file(uploaded_file1, uploaded_file2, streaming=False, output_format=DEFAULT_FORMAT, summary=False,
+                 profile=DEFAULT_PROFILE):
+    """
+    提交处理任务：每个任务在独立的工作目录中按顺序执行新01、新02两个处理阶段，
+    在后台线程中运行，页面通过任务ID轮询状态；summary 为True时同时输出异常汇总；
+    profile 为处理配置（月报格式，见profiles.PROFILES）；
+    同时生成结果预览缓存，页面翻页时不再读取整个结果文件
+
+    返回:
+        命中结果缓存时为 {"status": "success", "file_id": ..., "cached": True}
+        提交成功时为 {"status": "queued", "job_id": ...}
+        失败时为 {"status": "error", "error": ...}
+    """
     try:
-        # 保存第一个上传的文件（使用唯一文件名避免覆盖）
-        original_path = os.path.join(TEMP_DIR, f"月报_xin01_1.xlsx")
-        with open(original_path, "wb") as f:
-            f.write(uploaded_file1.getbuffer())
-        
-        # 保存第二个上传的文件（员工信息文件）
-        employee_info_path = os.path.join(TEMP_DIR, f"员工信息_xin01_2.xlsx")
-        with open(employee_info_path, "wb") as f:
-            f.write(uploaded_file2.getbuffer())
-
-        # 定义脚本及对应的参数，已更新为新脚本名称
-        scripts = [
-            {
-                "path": "新01.py",
-                "args": [original_path, employee_info_path]  # 新01.py需要的参数
-            },
-            {
-                "path": "新02.py",
-                "args": []  # 新02.py的参数将在第一个脚本执行后生成
-            }
-        ]
-
-        # 执行第一个脚本（新01.py）
-        script0_path = os.path.join("modules", scripts[0]["path"])
-        intermediate_path = os.path.join(TEMP_DIR, f"处理月报_xin01_3.xlsx")
-        # 完整参数：[Python解释器, 脚本路径, 输入文件, 员工信息文件, 中间输出文件]
-        script0_args = [sys.executable, script0_path] + scripts[0]["args"] + ["",intermediate_path]
-        
-        result1 = subprocess.run(
-            script0_args,
-            capture_output=True,
-            text=True,
-            check=True  # 启用检查，返回非0状态码时抛出异常
-        )
+        # 上传内容直接交给后台任务，不再写入临时文件
+        report_data = uploaded_file1.getvalue()
+        employee_data = uploaded_file2.getvalue()
 
-        # 检查中间文件是否生成
-        if not os.path.exists(intermediate_path):
-            return {"status": "error", "error": f"新01.py未生成中间文件: {intermediate_path}"}
-
-        # 执行第二个脚本（新02.py）
-        script1_path = os.path.join("modules", scripts[1]["path"])
-        final_path = os.path.join(TEMP_DIR, f"原始数据.xlsx")
-        # 完整参数：[Python解释器, 脚本路径, 中间文件, 最终输出文件]
-        script1_args = [sys.executable, script1_path] + [intermediate_path] + [final_path]
-        
-        result2 = subprocess.run(
-            script1_args,
-            capture_output=True,
-            text=True,
-            check=True  # 启用检查，返回非0状态码时抛出异常
+        # 相同的月报和员工信息（且规则、流水线版本未变）直接返回已缓存的结果
+        file_id = result_file_key(report_data, employee_data, streaming=streaming, output_format=output_format,
+                                  profile=profile)
+        store = get_result_store()
+        if (store.get(file_id) and store.get(preview_key(file_id))
+                and (not summary or store.get(summary_key(file_id)))):
+            print(f"命中结果缓存: {file_id}")
+            return {"status": "success", "file_id": file_id, "cached": True}
+
+        # 融合模式在内存中完成两组替换，不再写出和重新读取中间文件
+        # 流式模式逐行读写，适用于超大月报
+        job = get_job_manager().submit(
+            report_data, employee_data,
+            key=file_id, fused=True, streaming=streaming, rule_hits=True, output_format=output_format,
+            summary=summary, preview=True, profile=profile,
         )
+        return {"status": "queued", "job_id": job.job_id}
 
-        # 检查最终文件是否生成
-        if not os.path.exists(final_path):
-            raise FileNotFoundError(f"新02.py未生成最终文件: {final_path}")
-        
-        print(f"生成的文件路径: {final_path}")
-        print(f"文件是否存在: {os.path.exists(final_path)}")
-        # 存储结果并返回
-        file_id = str(uuid.uuid4())
-        processed_files[file_id] = final_path
-        return {"status": "success", "file_id": file_id}
-       
-
-
-    except subprocess.CalledProcessError as e:
-        # 捕获脚本执行失败的异常（返回码非0）
-        return {"status": "error", "error": 
-                f"脚本执行失败（返回码：{e.returncode}）\n"
-                f"命令：{' '.join(e.cmd)}\n"
-                f"错误输出：{e.stderr}"}
+    except JobQueueFull as e:
+        return {"status": "error", "error": str(e)}
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
 
+def show_job_status(job_id):
+    """
+    显示任务状态；任务结束时把结果写入session_state并返回True，否则返回False
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        st.session_state["job_id"] = None
+        st.warning("处理任务不存在或已过期，请重新提交")
+        return True
+
+    if job.active:
+        progress = job.progress
+        if job.status == "queued":
+            st.progress(0.0, text="排队中，请稍候...")
+        elif progress["total"]:
+            st.progress(
+                progress["done"] / progress["total"],
+                text=f"{progress['stage']}：正在处理工作表 {progress['sheet']}"
+                     f"（{progress['done']}/{progress['total']}）",
+            )
+        else:
+            st.progress(0.0, text="正在读取文件...")
+        return False
+
+    result = job.result
+    st.session_state["job_id"] = None
+    st.session_state["process_result"] = result
+    if result["status"] == "success":
+        st.session_state["processed_file_id"] = job.key
+        st.success(f"文件处理完成！耗时 {result.get('elapsed', 0):.1f} 秒")
+    else:
+        st.error(f"处理失败: {result['error']}")
+    return True
+
+
+def show_run_report(report):
+    """在可折叠面板中显示运行报告：各阶段/工作表的耗时和内存、规则命中次数"""
+    with st.expander("运行报告（耗时、内存、规则命中）", expanded=False):
+        stats = report.get("stats") or {}
+        # 内存为处理期间采样的进程常驻内存，同时运行的其他任务也计算在内
+        peak_mb = (report.get("peak_rss") or 0) / 1024 / 1024
+        start_mb = (report.get("start_rss") or 0) / 1024 / 1024
+        st.write(f"总耗时 {report.get('elapsed', 0):.2f} 秒，"
+                 f"进程内存 {start_mb:.0f} MB → 处理期间峰值 {peak_mb:.0f} MB，"
+                 f"工作表 {stats.get('sheets', 0)} 个，数据行 {stats.get('rows', 0)} 行，"
+                 f"匹配员工 {stats.get('matched', 0)} 人，清洗单元格 {stats.get('cells', 0)} 个")
+
+        for stage, detail in report.get("stages", {}).items():
+            elapsed = detail.get("elapsed") or 0
+            st.markdown(f"**{stage}**（{elapsed:.2f} 秒）")
+            timings = detail.get("timings") or {}
+            if timings:
+                st.dataframe(
+                    pd.DataFrame({"步骤": list(timings), "耗时(秒)": [round(v, 3) for v in timings.values()]}),
+                    hide_index=True,
+                )
+            sheets = detail.get("sheets") or []
+            if sheets:
+                sheet_df = pd.DataFrame(sheets)
+                sheet_df["peak_rss"] = (sheet_df["peak_rss"].fillna(0) / 1024 / 1024).round(1)
+                sheet_df["elapsed"] = sheet_df["elapsed"].round(3)
+                st.dataframe(sheet_df.rename(columns={
+                    "sheet": "工作表", "elapsed": "耗时(秒)", "peak_rss": "峰值内存(MB)", "rows": "行数",
+                    "matched": "匹配人数", "cells": "单元格数", "distinct": "不同取值", "changed": "替换单元格数",
+                    "skipped": "跳过规则单元格数", "reused": "沿用上次结果单元格数",
+                    "unmatched": "未匹配姓名数", "ambiguous": "重名姓名数",
+                }), hide_index=True)
+            for name, hits in (detail.get("rule_hits") or {}).items():
+                hit_df = pd.DataFrame({"规则": list(hits), "命中单元格数": list(hits.values())})
+                st.caption(name)
+                st.dataframe(hit_df.sort_values("命中单元格数", ascending=False), hide_index=True)
+
+
+@st.cache_resource(max_entries=DOWNLOAD_CACHE_ENTRIES, ttl=DOWNLOAD_CACHE_TTL, show_spinner=False)
+def load_processed_file(file_id):
+    """按结果ID缓存下载内容（所有会话共用），结果不存在时抛出异常（异常不会被缓存）"""
+    file_path = get_result_store().get(file_id)
+    if file_path is None:
+        raise FileNotFoundError(file_id)
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
 def get_processed_file(file_id):
-    """获取处理后的文件数据"""
-    if file_id not in processed_files:
-        return None
-    file_path = processed_files[file_id]
-    if not os.path.exists(file_path):
+    """获取处理后的文件数据（bytes），不存在或已过期时返回None"""
+    try:
+        return load_processed_file(file_id)
+    except OSError:
+        # 已过期或读取前刚好被后台清理
         return None
 
-    with open(file_path, "rb") as f:
-        return BytesIO(f.read())
+
+@st.cache_resource(max_entries=DOWNLOAD_CACHE_ENTRIES, ttl=DOWNLOAD_CACHE_TTL, show_spinner=False)
+def load_preview(file_id):
+    """
+    按结果ID缓存预览读取器（所有会话共用）：只读取索引，翻页时按块读取，
+    每个读取器最多在内存中保留 PREVIEW_CACHED_CHUNKS 块；不存在时抛出异常（异常不会被缓存）
+    """
+    file_path = get_result_store().get(preview_key(file_id))
+    if file_path is None:
+        raise FileNotFoundError(file_id)
+    return PreviewReader(file_path)
+
+
+def show_preview(file_id):
+    """分页预览处理结果：选择工作表，按姓名或部门筛选，每次只读取当前页"""
+    try:
+        reader = load_preview(file_id)
+    except (OSError, ValueError):
+        # 没有预览缓存（如旧的缓存结果）或已被清理
+        return
+    if not reader.sheet_names:
+        return
+
+    with st.expander("预览处理结果", expanded=False):
+        col1, col2, col3 = st.columns([2, 2, 1])
+        sheet_name = col1.selectbox("工作表", reader.sheet_names, key="preview_sheet")
+        text = col2.text_input("按姓名或部门筛选", key="preview_filter").strip()
+        page_size = col3.selectbox("每页行数", PREVIEW_PAGE_SIZES, key="preview_page_size")
+
+        rows = reader.matching_rows(sheet_name, text)
+        pages = max(1, -(-len(rows) // page_size))
+        # 筛选条件变化后页数可能变少，页码超出时回到最后一页
+        if st.session_state.get("preview_page", 1) > pages:
+            st.session_state["preview_page"] = pages
+        page = int(st.number_input("页码", min_value=1, max_value=pages, step=1, key="preview_page"))
+        try:
+            df = reader.page(sheet_name, rows[(page - 1) * page_size:page * page_size])
+        except OSError:
+            st.warning("预览缓存已过期")
+            return
+        st.dataframe(df, hide_index=True)
+        st.caption(f"共 {len(rows)} 行，第 {page}/{pages} 页")
 
 
 def main():
@@ -126,8 +262,8 @@ def main():
         st.session_state["uploaded_file1"] = None
     if "uploaded_file2" not in st.session_state:
         st.session_state["uploaded_file2"] = None
-    if "processing" not in st.session_state:
-        st.session_state["processing"] = False
+    if "job_id" not in st.session_state:
+        st.session_state["job_id"] = None
     if "processed_file_id" not in st.session_state:
         st.session_state["processed_file_id"] = None
     if "process_result" not in st.session_state:
@@ -140,14 +276,14 @@ def main():
     # 第一个文件上传区域
     uploaded_file1 = st.file_uploader(
         "选择需要处理的月报文件",
-        type=["xlsx", "xls", "csv"],
+        type=UPLOAD_TYPES,
         key="file_uploader1"
     )
 
     # 第二个文件上传区域
     uploaded_file2 = st.file_uploader(
         "选择员工信息文件（包含姓名、员工ID、部门）",
-        type=["xlsx", "xls", "csv"],
+        type=UPLOAD_TYPES,
         key="file_uploader2"
     )
 
@@ -157,54 +293,93 @@ def main():
         st.session_state["uploaded_file2"] = uploaded_file2
         st.success(f"文件上传成功: {uploaded_file1.name} 和 {uploaded_file2.name}")
 
+        profile = st.selectbox(
+            "月报格式",
+            list(PROFILES),
+            format_func=lambda name: PROFILES[name].label,
+            key="profile"
+        )
+        streaming = st.checkbox(
+            "低内存模式（逐行读写，适用于超大月报，输出不保留表头样式）",
+            key="streaming_mode"
+        )
+        output_format = st.selectbox(
+            "输出格式",
+            # 所需依赖未安装的格式（如没有pyarrow时的Parquet）不提供
+            list(available_formats()),
+            format_func=lambda name: OUTPUT_FORMATS[name][1],
+            key="output_format"
+        )
+        summary = st.checkbox(
+            "同时输出异常汇总（按员工统计迟到/早退/旷工的次数和分钟数、缺卡次数）",
+            key="summary_mode"
+        )
+
         # 处理按钮
         if st.button(
                "开始处理文件",
-                disabled=st.session_state["processing"] or (st.session_state["processed_file_id"] is not None)
+                disabled=(st.session_state["job_id"] is not None) or (st.session_state["processed_file_id"] is not None)
             ):
-            st.session_state["processing"] = True
             st.session_state["processed_file_id"] = None
 
-            # 显示处理状态
-            with st.spinner("正在处理文件，请稍候..."):
-                # 传入两个文件进行处理
-                result = process_file(uploaded_file1, uploaded_file2)
-                st.session_state["process_result"] = result
-                st.session_state["processing"] = False
-
-                if result["status"] == "success":
-                    st.session_state["processed_file_id"] = result["file_id"]
-                    st.success("文件处理完成！")
-
-                    # 显示下载按钮
-                    excel_data = get_processed_file(result["file_id"])
-                    if excel_data:
-                        st.download_button(
-                            label="下载处理结果",
-                            data=excel_data,
-                            file_name=f"处理结果.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
-                else:
-                    st.error(f"处理失败: {result['error']}")
+            # 提交后台任务，页面不再阻塞在处理过程中
+            result = process_file(uploaded_file1, uploaded_file2, streaming=streaming, output_format=output_format,
+                                  summary=summary, profile=profile)
+            st.session_state["process_result"] = result
+
+            if result["status"] == "success":
+                st.session_state["processed_file_id"] = result["file_id"]
+                st.success("已有相同文件的处理结果，直接提供下载")
+            elif result["status"] == "queued":
+                st.session_state["job_id"] = result["job_id"]
+            else:
+                st.error(f"处理失败: {result['error']}")
+
+    # 处理进度（任务在后台线程中运行，这里只轮询状态）
+    job_running = False
+    if st.session_state["job_id"]:
+        job_running = not show_job_status(st.session_state["job_id"])
 
     # 已处理文件下载区
-    if st.session_state["processed_file_id"] and not st.session_state["processing"]:
+    if st.session_state["processed_file_id"] and not job_running:
         st.subheader("处理结果")
-        excel_data = get_processed_file(st.session_state["processed_file_id"])
+        file_id = st.session_state["processed_file_id"]
+        excel_data = get_processed_file(file_id)
         if excel_data and st.session_state.get("uploaded_file1"):
+            suffix = os.path.splitext(file_id)[1]
             st.download_button(
-                label="重新下载处理结果",
+                label="下载处理结果",
                 data=excel_data,
-                file_name=f"处理结果.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                file_name=f"处理结果{suffix}",
+                mime=MIME_TYPES.get(suffix, "application/octet-stream"),
                 key="redownload_btn"
             )
+            summary_data = get_processed_file(summary_key(file_id)) if st.session_state.get("summary_mode") else None
+            if summary_data:
+                st.download_button(
+                    label="下载异常汇总",
+                    data=summary_data,
+                    file_name=f"异常汇总{suffix}",
+                    mime=MIME_TYPES.get(suffix, "application/octet-stream"),
+                    key="summary_download_btn"
+                )
+            show_preview(file_id)
         elif not excel_data:
             st.warning("处理后的文件不存在或已过期")
 
-    # 定期清理临时文件
-    clean_temp_files()
+        result = st.session_state.get("process_result") or {}
+        if result.get("report"):
+            show_run_report(result["report"])
+        elif result.get("cached"):
+            st.caption("结果来自缓存，本次未重新处理，没有运行报告")
+
+    # 临时文件、任务目录和结果仓库由后台线程定期清理，不在每次页面刷新时扫描目录
+    get_job_manager()
+
+    # 任务未结束时定时刷新页面以更新进度
+    if job_running:
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
 
 
 if __name__ == "__main__":
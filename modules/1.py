@@ -1,98 +1,18 @@
-import os
-import re
-from openpyxl import load_workbook
+from options import RunOptions
+from 新02 import replace_excel_content as replace_with_profile
 
 
 def replace_excel_content(input_file, output_file):
     """
-    专门用于替换Excel文件中的指定内容
+    专门用于替换Excel文件中的指定内容（跳过前4列：姓名、员工ID、部门、班次）
+
+    按旧格式处理配置（profiles.PROFILES["legacy"]）执行，与新02共用同一套处理流程
 
     参数:
         input_file: 输入Excel文件路径（如上下班打卡_7月报_processed.xlsx）
         output_file: 输出Excel文件路径，默认为在输入文件名后加"_replaced"
     """
-    try:
-        # 自动生成输出文件名
-        output_file = output_file
-
-        # 打开Excel文件
-        wb = load_workbook(input_file)
-
-        # 替换模式列表（非单元格匹配，按优先级排序）
-        patterns_to_replace = [
-            # 带分号的缺卡格式
-            r'缺卡\([^)]*\);',
-            r'缺卡\(.*?\);',
-            # 不带分号的缺卡格式
-            r'缺卡\([^)]*\)',
-            r'缺卡\(.*?\)',
-            # 补卡申请格式
-            r'补卡申请（[^）]*）',
-            r'补卡申请（.*?）',
-            # 正常(补卡)格式
-            r'正常\(补卡\)-',
-            # 正常格式
-            r'正常-',
-            # 各种横线格式
-            r'--',
-            r'— —',  # 全角横线
-            r'——',  # 破折号
-            # 单独的缺卡
-            r'缺卡',
-            # 各种换行符和空白字符
-            r'\r\n|\r|\n|\t',
-            # 多个连续空格
-            r' +'
-        ]
-
-        # 处理每个工作表
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-
-            # 只处理可见工作表
-            if ws.sheet_state != 'visible':
-                print(f"工作表 {sheet_name} 是隐藏的，已跳过")
-                continue
-
-            # 记录替换数量
-            replace_count = 0
-
-            # 遍历所有单元格进行替换
-            for row in range(1, ws.max_row + 1):
-                for col in range(1, ws.max_column + 1):
-                    # 跳过姓名、员工ID、部门、班次列（假设这些列是前4列）
-                    if col <= 4:
-                        continue
-
-                    cell = ws.cell(row=row, column=col)
-                    if cell.value is not None:
-                        original_value = str(cell.value)
-                        cell_text = original_value
-
-                        # 应用所有替换模式
-                        for pattern in patterns_to_replace:
-                            cell_text = re.sub(pattern, '', cell_text)
-
-                        # 最终清理
-                        cell_text = cell_text.strip()
-
-                        # 如果内容有变化，更新单元格并计数
-                        if cell_text != original_value:
-                            cell.value = cell_text if cell_text else ""
-                            replace_count += 1
-
-            print(f"工作表 {sheet_name} 完成替换，共处理 {replace_count} 个单元格")
-
-        # 保存处理后的文件
-        wb.save(output_file)
-        wb.close()
-
-        print(f"替换完成，已保存至: {output_file}")
-        return output_file
-
-    except Exception as e:
-        print(f"替换过程出错: {str(e)}")
-        return None
+    return replace_with_profile(input_file, output_file, options=RunOptions("legacy"))
 
 
 if __name__ == "__main__":
@@ -103,4 +23,3 @@ if __name__ == "__main__":
         replace_excel_content(input_file, output_file)
     else:
         print("用法: python 1.py <输入文件> [输出文件]")
-    
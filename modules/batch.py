@@ -0,0 +1,194 @@
+import csv
+import glob
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from parallel import POOL_CONTEXT
+from pipeline import run_pipeline
+from profiles import DEFAULT_PROFILE, PROFILES
+from readers import xls_supported
+from writers import DEFAULT_FORMAT, OUTPUT_FORMATS
+from 新01 import load_employee_directory
+
+
+# 批量处理时识别的月报文件扩展名
+REPORT_EXTENSIONS = (".xlsx", ".xls", ".csv")
+SUMMARY_NAME = "批量处理汇总.csv"
+SUMMARY_FIELDS = ["月报文件", "状态", "输出文件", "工作表数", "行数", "匹配人数", "耗时(秒)", "错误信息"]
+
+
+def find_reports(source):
+    """
+    查找需要处理的月报文件
+
+    参数:
+        source: 目录（处理其中所有Excel文件）或通配符（如 reports/*/7月*.xlsx）
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    reports = sorted(
+        path for path in paths
+        if os.path.isfile(path)
+        and path.lower().endswith(REPORT_EXTENSIONS)
+        and not os.path.basename(path).startswith("~$")  # Excel打开文件时产生的锁文件
+    )
+    # 读取.xls需要xlrd，未安装时跳过这些文件（不在处理中途失败）
+    if not xls_supported():
+        skipped = [path for path in reports if path.lower().endswith(".xls")]
+        if skipped:
+            print(f"未安装xlrd，跳过 {len(skipped)} 个.xls月报（pip install xlrd 后可处理）: "
+                  + "、".join(os.path.basename(path) for path in skipped))
+            reports = [path for path in reports if path not in skipped]
+    return reports
+
+
+def output_stems(reports):
+    """
+    每个月报的输出文件名前缀：默认为月报文件名（不含扩展名）；
+    同名的月报（如 7月.xlsx 和 7月.csv，或不同目录下的 7月.xlsx）加上扩展名，仍重复时再加序号，
+    避免并发处理时互相覆盖输出文件
+
+    返回:
+        {月报文件: 输出文件名前缀}
+    """
+    def stem_of(path):
+        return os.path.splitext(os.path.basename(path))[0]
+
+    counts = Counter(stem_of(path).lower() for path in reports)
+    stems = {}
+    used = set()
+    for path in reports:
+        stem, ext = os.path.splitext(os.path.basename(path))
+        if counts[stem.lower()] > 1:
+            stem = f"{stem}_{ext.lstrip('.').lower()}"
+        candidate, index = stem, 2
+        while candidate.lower() in used:
+            candidate = f"{stem}_{index}"
+            index += 1
+        used.add(candidate.lower())
+        stems[path] = candidate
+    return stems
+
+
+def process_report(report_file, directory, output_dir, fused=True, streaming=False, output_format=DEFAULT_FORMAT,
+                   summary=False, profile=DEFAULT_PROFILE, stem=None):
+    """处理单个月报，任何异常都转换为结果字典，不影响其他文件；stem 为输出文件名前缀（见output_stems）"""
+    start = time.perf_counter()
+    stem = stem or os.path.splitext(os.path.basename(report_file))[0]
+    try:
+        result = run_pipeline(
+            report_file, directory, output_dir,
+            final_name=f"{stem}_原始数据.xlsx",
+            intermediate_name=f"{stem}_处理月报.xlsx",
+            fused=fused,
+            streaming=streaming,
+            output_format=output_format,
+            summary=summary,
+            profile=profile,
+        )
+    except Exception as e:
+        result = {"status": "error", "error": str(e)}
+    result["report_file"] = report_file
+    result.setdefault("elapsed", time.perf_counter() - start)
+    return result
+
+
+def run_batch(source, employee_file, output_dir, jobs=2, fused=True, streaming=False,
+              output_format=DEFAULT_FORMAT, summary=False, profile=DEFAULT_PROFILE):
+    """
+    批量处理多个月报：员工信息只读取一次，月报分给有上限的进程池并发处理
+
+    参数:
+        source: 月报所在目录或通配符
+        employee_file: 员工信息文件
+        output_dir: 输出目录（输出文件和汇总表）
+        jobs: 同时处理的月报数量
+        fused: 是否使用融合模式
+        streaming: 是否使用流式模式
+        output_format: 输出文件格式（见writers.OUTPUT_FORMATS）
+        summary: 是否为每个月报另外输出异常汇总文件
+        profile: 处理配置名称（见profiles.PROFILES）
+
+    返回:
+        每个月报的结果字典列表（与文件顺序一致）
+    """
+    reports = find_reports(source)
+    if not reports:
+        print(f"未找到月报文件: {source}")
+        return []
+
+    os.makedirs(output_dir, exist_ok=True)
+    directory = load_employee_directory(employee_file, profile)
+    directory.report_duplicates()
+    print(f"已读取员工信息 {len(directory)} 人，共 {len(reports)} 个月报待处理")
+    stems = output_stems(reports)
+    for report in reports:
+        if stems[report] != os.path.splitext(os.path.basename(report))[0]:
+            print(f"月报文件名重复，{report} 的输出文件名改为 {stems[report]}_原始数据")
+
+    with ProcessPoolExecutor(max_workers=max(1, jobs), mp_context=POOL_CONTEXT) as pool:
+        futures = [
+            pool.submit(process_report, report, directory, output_dir, fused, streaming, output_format, summary,
+                        profile, stems[report])
+            for report in reports
+        ]
+        results = []
+        for report, future in zip(reports, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # 子进程异常退出等情况
+                result = {"status": "error", "error": str(e), "report_file": report, "elapsed": 0}
+            results.append(result)
+            print(f"[{len(results)}/{len(reports)}] {os.path.basename(report)}: "
+                  f"{'成功' if result['status'] == 'success' else '失败'}")
+
+    write_summary(results, os.path.join(output_dir, SUMMARY_NAME))
+    return results
+
+
+def write_summary(results, summary_file):
+    """写出批量处理汇总表（CSV，Excel可直接打开）"""
+    with open(summary_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_FIELDS)
+        for result in results:
+            stats = result.get("stats") or {}
+            writer.writerow([
+                os.path.basename(result["report_file"]),
+                "成功" if result["status"] == "success" else "失败",
+                result.get("output_file", ""),
+                stats.get("sheets", ""),
+                stats.get("rows", ""),
+                stats.get("matched", ""),
+                f"{result.get('elapsed', 0):.2f}",
+                result.get("error", ""),
+            ])
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    print(f"批量处理完成：成功 {succeeded} 个，失败 {len(results) - succeeded} 个，汇总已保存至: {summary_file}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="用同一个员工信息文件批量处理多个月报")
+    parser.add_argument("source", help="月报所在目录，或通配符（需加引号，如 \"reports/*.xlsx\"）")
+    parser.add_argument("employee_file", help="员工信息文件")
+    parser.add_argument("output_dir", nargs="?", default="batch_output", help="输出目录，默认为 batch_output")
+    parser.add_argument("--jobs", type=int, default=2, help="同时处理的月报数量，默认为2")
+    parser.add_argument("--two-stage", action="store_true", help="使用两阶段模式（生成中间文件），默认为融合模式")
+    parser.add_argument("--streaming", action="store_true", help="流式模式，峰值内存与行数无关")
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default=DEFAULT_FORMAT,
+                        help="输出文件格式，默认xlsx；csv为每个工作表一个CSV打包的zip")
+    parser.add_argument("--summary", action="store_true", help="为每个月报另外输出按员工汇总的考勤异常")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="处理配置：" + "；".join(f"{name} {profile.label}" for name, profile in PROFILES.items()))
+    args = parser.parse_args()
+
+    run_batch(args.source, args.employee_file, args.output_dir, jobs=args.jobs,
+              fused=not args.two_stage, streaming=args.streaming, output_format=args.format,
+              summary=args.summary, profile=args.profile)
@@ -0,0 +1,201 @@
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from instrument import peak_rss
+from pipeline import run_pipeline
+from synth import generate_pair
+
+
+# 基准测试的处理模式：名称 → run_pipeline 参数
+MODES = {
+    "two-stage": {"fused": False, "streaming": False},
+    "fused": {"fused": True, "streaming": False},
+    "streaming": {"fused": False, "streaming": True},
+    "streaming-fused": {"fused": True, "streaming": True},
+}
+RESULTS_FILE = "bench_results.jsonl"
+
+
+def run_case(report, employee_file, mode, workers=1, trace=False):
+    """
+    在全新的子进程中执行一次流水线（峰值内存不受之前运行的影响），返回计时和内存结果
+
+    参数:
+        report: 月报文件
+        employee_file: 员工信息文件
+        mode: MODES 中的模式名称
+        workers: 清洗使用的进程数
+        trace: 为True时用tracemalloc记录Python对象的峰值内存（会明显变慢）
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        if trace:
+            tracemalloc.start()
+        rss_before = peak_rss()
+        # 处理过程中的逐表输出不计入结果，只保留汇总
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            result = run_pipeline(report, employee_file, work_dir, workers=workers, **MODES[mode])
+        case = {
+            "mode": mode,
+            "workers": workers,
+            "status": result["status"],
+            "elapsed": result.get("elapsed"),
+            "stages": result.get("timings", {}),
+            "stats": result.get("stats", {}),
+            "peak_rss": peak_rss(),
+            "rss_before": rss_before,
+        }
+        if trace:
+            case["tracemalloc_peak"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if result["status"] != "success":
+            case["error"] = result.get("error")
+        return case
+
+
+def run_isolated(*args, **kwargs):
+    """
+    用spawn方式启动的单独进程执行run_case；子进程中关闭员工信息缓存，
+    每次都计入读取员工信息的耗时
+    """
+    context = multiprocessing.get_context("spawn")
+    saved = os.environ.get("CLEXCEL_DIRECTORY_CACHE")
+    os.environ["CLEXCEL_DIRECTORY_CACHE"] = ""
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            return pool.submit(run_case, *args, **kwargs).result()
+    finally:
+        if saved is None:
+            del os.environ["CLEXCEL_DIRECTORY_CACHE"]
+        else:
+            os.environ["CLEXCEL_DIRECTORY_CACHE"] = saved
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import openpyxl
+    import pandas as pd
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "openpyxl": openpyxl.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def load_results(results_file):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_case(history, scale, mode, workers):
+    """找到同样规模、模式和进程数的上一次结果，用于对比"""
+    for record in reversed(history):
+        if record.get("scale") != scale:
+            continue
+        for case in record.get("cases", []):
+            if case["mode"] == mode and case["workers"] == workers and case["status"] == "success":
+                return case
+    return None
+
+
+def format_case(case, previous=None):
+    mb = (case["peak_rss"] or 0) / 1024 / 1024
+    stages = "  ".join(
+        f"{stage}[" + " ".join(f"{name}={seconds:.2f}" for name, seconds in timings.items()) + "]"
+        for stage, timings in case["stages"].items()
+    )
+    line = f"{case['mode']:<16} {case['elapsed'] or 0:8.2f}s  峰值内存 {mb:7.1f}MB  {stages}"
+    if previous and previous.get("elapsed"):
+        change = (case["elapsed"] - previous["elapsed"]) / previous["elapsed"] * 100
+        line += f"  （较上次 {change:+.1f}%）"
+    return line
+
+
+def run_benchmark(employees=500, days=31, sheets=2, modes=tuple(MODES), workers=1, repeat=1, seed=0,
+                  report=None, employee_file=None, results_file=RESULTS_FILE, trace=False):
+    """
+    生成（或使用指定的）月报，按各个模式执行流水线并记录每个阶段的耗时和峰值内存，
+    结果追加写入 results_file（每行一个JSON），便于长期跟踪性能变化
+
+    返回:
+        本次的结果记录
+    """
+    history = load_results(results_file)
+    with tempfile.TemporaryDirectory() as data_dir:
+        if report is None:
+            start = time.perf_counter()
+            report, employee_file = generate_pair(data_dir, employees, days, sheets, seed=seed)
+            print(f"已生成合成月报（{employees}人 × {days}天 × {sheets}个工作表），耗时 "
+                  f"{time.perf_counter() - start:.1f}秒")
+            scale = {"employees": employees, "days": days, "sheets": sheets, "seed": seed}
+        else:
+            scale = {"report": os.path.basename(report), "size": os.path.getsize(report)}
+
+        cases = []
+        for mode in modes:
+            for _ in range(repeat):
+                case = run_isolated(report, employee_file, mode, workers, trace)
+                print(format_case(case, previous_case(history, scale, mode, workers)))
+                cases.append(case)
+
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "scale": scale,
+        "environment": environment(),
+        "cases": cases,
+    }
+    with open(results_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"基准测试结果已追加至: {results_file}")
+    return record
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="流水线基准测试：按阶段（read/join/clean/write）计时并记录峰值内存")
+    parser.add_argument("--employees", type=int, default=500, help="合成月报每个工作表的员工数，默认500")
+    parser.add_argument("--days", type=int, default=31, help="合成月报的天数，默认31")
+    parser.add_argument("--sheets", type=int, default=2, help="合成月报的工作表数，默认2")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机数种子")
+    parser.add_argument("--report", help="使用已有的月报文件代替合成数据（需同时指定 --employee-file）")
+    parser.add_argument("--employee-file", help="已有的员工信息文件")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"逗号分隔的模式，可选 {','.join(MODES)}")
+    parser.add_argument("--workers", type=int, default=1, help="清洗使用的进程数，默认1")
+    parser.add_argument("--repeat", type=int, default=1, help="每个模式重复次数")
+    parser.add_argument("--results", default=RESULTS_FILE, help=f"结果文件，默认为 {RESULTS_FILE}")
+    parser.add_argument("--tracemalloc", action="store_true", help="同时记录Python对象的峰值内存（较慢）")
+    args = parser.parse_args()
+
+    if bool(args.report) != bool(args.employee_file):
+        parser.error("--report 和 --employee-file 需要同时指定")
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"未知的模式: {', '.join(unknown)}")
+
+    run_benchmark(args.employees, args.days, args.sheets, modes, args.workers, args.repeat, args.seed,
+                  args.report, args.employee_file, args.results, args.tracemalloc)
@@ -0,0 +1,255 @@
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+from openpyxl import load_workbook
+
+from bench import MODES
+from instrument import RuleHits
+from parallel import clean_text_blocks, create_pool
+from pipeline import run_pipeline
+from profiles import DEFAULT_PROFILE, PROFILES, compile_profile
+from reference import reference_clean, reference_process
+from synth import day_value, generate_employee_file, generate_report
+from 新01 import clean_text_array
+
+
+# 随机单元格文本使用的词汇：钉钉月报中出现的打卡结果、括号、横线、分隔符和空白
+TOKENS = [
+    "正常", "缺卡", "迟到", "早退", "旷工", "分钟", "补卡", "补卡申请", "管理员校准", "管理员校准、补卡",
+    "休息", "未排班", "地点异常", "公司", "已通过", "审批中", "上班卡", "下班卡",
+    "(", ")", "（", "）", "-", "--", "— —", "——", "—", ";", "；", "、",
+    " ", "  ", "\n", "\r\n", "\r", "\t",
+    "0", "5", "30", "45.5", ".", "480",
+]
+
+# 与参考实现比较的处理模式：名称 → run_pipeline 参数（incremental 为用同一状态文件连续处理两次）
+ENGINES = dict(MODES, **{
+    "fused-workers2": {"fused": True, "streaming": False, "workers": 2, "chunk_rows": 100},
+    "incremental": {"fused": True, "streaming": False, "incremental": True},
+})
+# 每种差异最多显示的条数
+MAX_SHOWN = 5
+
+
+def fuzz_event(rng):
+    """迟到/早退/旷工 N分钟 以及 缺卡(...)、补卡申请（...） 的各种变体（空白、小数、横线、分号、括号内容）"""
+    if rng.random() < 0.6:
+        space = lambda: " " * rng.randint(0, 2)
+        return (rng.choice(["迟到", "早退", "旷工"]) + space() + rng.choice(["", "5", "45.5", "1.", ".5", "120"])
+                + space() + "分钟" + rng.choice(["", "-", "-;", ";", "--"]))
+    inner = "".join(rng.choice(TOKENS) for _ in range(rng.randint(0, 3)))
+    if rng.random() < 0.5:
+        return "缺卡(" + inner + rng.choice([")", ");", ""])
+    return "补卡申请（" + inner + rng.choice(["）", ""])
+
+
+def fuzz_text(rng):
+    """由词汇、异常事件和真实打卡结果随机拼接的文本"""
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        r = rng.random()
+        if r < 0.25:
+            parts.append(str(day_value(rng, False) or ""))
+        elif r < 0.5:
+            parts.append(fuzz_event(rng))
+        else:
+            parts.append(rng.choice(TOKENS))
+    return "".join(parts)
+
+
+def fuzz_value(rng, weekend=False):
+    """一个随机的日期列单元格：大多为文本，也有空单元格、数字和真实的打卡结果"""
+    r = rng.random()
+    if r < 0.05:
+        return None
+    if r < 0.08:
+        return rng.randint(0, 600)
+    if r < 0.10:
+        return rng.choice([0.5, 45.5, 1e-3])
+    if r < 0.45:
+        return day_value(rng, weekend)
+    return fuzz_text(rng)
+
+
+def _texts(values):
+    """与新01相同的转换：None为空字符串，其余为str()"""
+    return np.array([str(x) if x is not None else '' for x in values], dtype=object)
+
+
+def _two_stage(values, plan):
+    cleaned, _, _ = clean_text_array(_texts(values), plan.cleaner("clean_cell"))
+    return [plan.replace_cell_value(value)[0] for value in cleaned]
+
+
+def _fused(values, plan):
+    return list(clean_text_array(_texts(values), plan.cleaner("clean_fused"))[0])
+
+
+def _rule_hits(values, plan):
+    hits = RuleHits()
+    return [plan.replace_cell_value(plan.clean_cell(text, hits), hits)[0] for text in _texts(values)]
+
+
+def _parallel(values, plan):
+    pool = create_pool(2)
+    try:
+        return list(clean_text_blocks(_texts(values), plan.cleaner("clean_fused"), pool, 1000)[0])
+    finally:
+        pool.shutdown()
+
+
+# 单元格级别的快速路径：名称 → 函数（值列表、执行计划 → 最终结果列表）
+CELL_ENGINES = {
+    "two-stage": _two_stage,
+    "fused": _fused,
+    "rule-hits": _rule_hits,
+    "parallel": _parallel,
+}
+
+
+def same_value(a, b):
+    return type(a) is type(b) and a == b
+
+
+def check_cells(count, seed=0, profile=DEFAULT_PROFILE):
+    """
+    随机生成count个单元格，按处理配置profile比较参考实现与各个单元格级别快速路径的结果
+
+    返回:
+        {引擎名称: (耗时, 不同的单元格列表[(输入, 参考结果, 快速路径结果)])}，
+        第一项为参考实现本身的耗时
+    """
+    plan = compile_profile(profile)
+    rng = random.Random(seed)
+    values = [fuzz_value(rng) for _ in range(count)]
+    start = time.perf_counter()
+    expected = [reference_clean(value, profile) for value in values]
+    results = {"reference": (time.perf_counter() - start, [])}
+    for name, engine in CELL_ENGINES.items():
+        start = time.perf_counter()
+        actual = engine(values, plan)
+        elapsed = time.perf_counter() - start
+        diffs = [(value, want, got) for value, want, got in zip(values, expected, actual) if not same_value(want, got)]
+        results[name] = (elapsed, diffs)
+    return results
+
+
+def read_values(path):
+    """{工作表名: [每行的值]}"""
+    wb = load_workbook(path, read_only=True)
+    try:
+        return {name: [list(row) for row in wb[name].iter_rows(values_only=True)] for name in wb.sheetnames}
+    finally:
+        wb.close()
+
+
+def compare_workbooks(expected, actual):
+    """逐单元格比较两个工作簿的值，返回差异列表[(工作表, 行, 列, 参考值, 实际值)]"""
+    diffs = []
+    if list(expected) != list(actual):
+        return [("工作表", None, None, list(expected), list(actual))]
+    for name, rows in expected.items():
+        other = actual[name]
+        for row_index in range(max(len(rows), len(other))):
+            a = rows[row_index] if row_index < len(rows) else []
+            b = other[row_index] if row_index < len(other) else []
+            for column in range(max(len(a), len(b))):
+                x = a[column] if column < len(a) else None
+                y = b[column] if column < len(b) else None
+                if not same_value(x, y):
+                    diffs.append((name, row_index + 1, column + 1, x, y))
+    return diffs
+
+
+def run_engine(report, employee_file, work_dir, options, profile=DEFAULT_PROFILE):
+    """按模式执行流水线；incremental 先处理一次生成状态，返回第二次（沿用上次结果）的结果"""
+    options = dict(options, profile=profile)
+    if options.pop("incremental", False):
+        state_file = os.path.join(work_dir, "state.pkl")
+        run_pipeline(report, employee_file, work_dir, incremental=state_file, report=False, **options)
+        return run_pipeline(report, employee_file, work_dir, incremental=state_file, report=False, **options)
+    return run_pipeline(report, employee_file, work_dir, report=False, **options)
+
+
+def check_workbook(employees=200, days=31, sheets=2, seed=0, engines=tuple(ENGINES), profile=DEFAULT_PROFILE):
+    """
+    按处理配置profile的布局生成单元格内容随机的合成月报，比较参考处理链与各个处理模式的最终文件
+
+    返回:
+        {模式名称: (耗时, 差异列表或错误信息)}，第一项为参考实现的耗时
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        report = generate_report(os.path.join(data_dir, "月报.xlsx"), employees, days, sheets, layout=profile,
+                                 seed=seed, cell_value=fuzz_value)
+        employee_file = generate_employee_file(os.path.join(data_dir, "员工信息.xlsx"), employees, seed=seed,
+                                               month_column="班次" if profile == "legacy" else None)
+        reference_file = os.path.join(data_dir, "参考结果.xlsx")
+        start = time.perf_counter()
+        reference_process(report, employee_file, reference_file, profile)
+        results = {"reference": (time.perf_counter() - start, [])}
+        expected = read_values(reference_file)
+
+        for name in engines:
+            work_dir = os.path.join(data_dir, name)
+            os.makedirs(work_dir)
+            # 处理过程中的逐表输出不显示
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                result = run_engine(report, employee_file, work_dir, ENGINES[name], profile)
+            elapsed = result.get("elapsed", 0)
+            if result["status"] != "success":
+                results[name] = (elapsed, f"处理失败: {result['error']}")
+            else:
+                results[name] = (elapsed, compare_workbooks(expected, read_values(result["output_file"])))
+    return results
+
+
+def print_results(title, results):
+    """并列显示各引擎的耗时（以及相对参考实现的加速比）和差异"""
+    print(title)
+    reference_time = results["reference"][0]
+    failed = False
+    for name, (elapsed, diffs) in results.items():
+        speedup = reference_time / elapsed if elapsed else float("inf")
+        if isinstance(diffs, str):
+            status = diffs
+        else:
+            status = f"{len(diffs)} 处不同" if diffs else "一致"
+        print(f"  {name:<16} {elapsed:8.3f}s  ×{speedup:6.1f}  {status}")
+        if diffs:
+            failed = True
+            for diff in ([] if isinstance(diffs, str) else diffs[:MAX_SHOWN]):
+                print(f"      {diff!r}")
+    return not failed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="差异测试：随机单元格和合成月报上，比较参考实现与各个处理模式的结果")
+    parser.add_argument("--cells", type=int, default=20000, help="单元格级别比较的随机单元格数，默认20000")
+    parser.add_argument("--workbooks", type=int, default=2, help="随机合成月报的个数（种子依次加1），默认2")
+    parser.add_argument("--employees", type=int, default=200, help="合成月报每个工作表的员工数，默认200")
+    parser.add_argument("--days", type=int, default=31, help="合成月报的天数，默认31")
+    parser.add_argument("--sheets", type=int, default=2, help="合成月报的工作表数，默认2")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--engines", default=",".join(ENGINES), help=f"逗号分隔的处理模式，可选 {','.join(ENGINES)}")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help=f"逗号分隔的处理配置，可选 {','.join(PROFILES)}")
+    args = parser.parse_args()
+
+    ok = True
+    for profile in args.profiles.split(","):
+        ok = print_results(f"[{profile}] 单元格（{args.cells}个，种子{args.seed}）",
+                           check_cells(args.cells, args.seed, profile)) and ok
+        for index in range(args.workbooks):
+            seed = args.seed + index
+            ok = print_results(
+                f"[{profile}] 合成月报（{args.employees}人 × {args.days}天 × {args.sheets}个工作表，种子{seed}）",
+                check_workbook(args.employees, args.days, args.sheets, seed, args.engines.split(","), profile),
+            ) and ok
+    if not ok:
+        sys.exit(1)
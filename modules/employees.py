@@ -0,0 +1,239 @@
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+from readers import read_bytes, read_table
+from store import ResultStore, content_key
+
+
+# 解析结果格式版本：EmployeeDirectory 的结构变化时递增，旧缓存随之失效
+DIRECTORY_VERSION = "3"
+# 员工信息缓存目录，app、命令行脚本和批量处理共用；可用环境变量覆盖
+DIRECTORY_CACHE_DIR = os.environ.get(
+    "CLEXCEL_DIRECTORY_CACHE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp_files", "employee_cache"),
+)
+DIRECTORY_CACHE_BYTES = 50 * 1024 * 1024
+# 提示信息中最多列出的姓名个数
+MAX_LISTED_NAMES = 20
+
+# 匹配前去掉的字符：空白（含全角空格、不换行空格）和导出文件中常见的不可见字符
+# （零宽空格/连接符、方向标记、BOM、软连字符等）
+_INVISIBLE_CHARS = r'[\s\u00ad\u180e\u200b-\u200f\u202a-\u202e\u2060-\u2064\ufeff]'
+
+
+def normalize_names(values):
+    """
+    把姓名（或其他匹配键）转换为匹配用的键（向量化）：NFKC规范化（全角字母数字、
+    兼容字符转为标准形式）后去掉所有空白和不可见字符；空值和去掉后为空的取值为NaN
+
+    返回:
+        与values等长的Series（object）
+    """
+    keys = pd.Series(values, dtype=object, copy=False)
+    present = keys.notna()
+    keys = keys.where(~present, keys.astype(str))
+    keys = keys.str.normalize("NFKC").str.replace(_INVISIBLE_CHARS, "", regex=True)
+    return keys.where(keys.str.len() > 0)
+
+
+def normalize_keys(values):
+    """
+    把第二匹配键（员工ID、工号等编号）转换为匹配用的键：整数值的浮点数（Excel中数字列含空值时
+    读成float，如 100001.0）按整数处理，其余同 normalize_names
+
+    返回:
+        与values等长的Series（object）
+    """
+    keys = pd.Series(values, dtype=object, copy=False)
+    # 逐个转换（map会把整数和NaN重新推断为float）
+    keys = pd.Series([int(value) if isinstance(value, float) and value.is_integer() else value for value in keys],
+                     index=keys.index, dtype=object)
+    return normalize_names(keys)
+
+
+def list_names(names):
+    """把姓名列表转换为提示信息中的文本（过多时截断）"""
+    names = [str(name) for name in names]
+    text = "、".join(names[:MAX_LISTED_NAMES])
+    return text + (f" 等 {len(names)} 个" if len(names) > MAX_LISTED_NAMES else "")
+
+
+class EmployeeDirectory:
+    """
+    员工信息索引：每次运行只按姓名建立一次，所有工作表共用，
+    通过向量化的哈希索引（get_indexer）填充员工ID、部门等列，每行查找为O(1)
+
+    姓名按 normalize_names 规范化后匹配，月报中带首尾空格、全角字符或零宽字符的姓名
+    也能匹配；规范化后相同的姓名视为重名（模糊），与原来的字典写法一致保留最后一条记录，
+    若指定了第二匹配键，月报提供该键时先按 (姓名, 第二匹配键) 精确匹配。
+
+    参数:
+        schedule_df: 员工信息DataFrame，必须包含"姓名"列
+        fields: 需要填充的列；可以是列名列表，
+                也可以是 {输出列名: 员工信息中的列名} 的字典（如 班次 对应某个月份列）
+        secondary_key: 第二匹配键在员工信息中的列名（如 员工ID），用于区分重名员工，可选
+        key_headers: 月报中第二匹配键列的表头（如 工号），默认与secondary_key相同
+    """
+
+    def __init__(self, schedule_df, fields, secondary_key=None, key_headers=None):
+        if not isinstance(fields, dict):
+            fields = {field: field for field in fields}
+        self.fields = dict(fields)
+        self.secondary_key = secondary_key
+        if secondary_key is None:
+            self.key_headers = ()
+        else:
+            self.key_headers = tuple(key_headers) if key_headers else (secondary_key,)
+
+        keys = normalize_names(schedule_df['姓名']).to_numpy()
+        valid = schedule_df[pd.notna(keys)]
+        keys = pd.Index(keys[pd.notna(keys)], dtype=object)
+        values = pd.DataFrame(
+            {output: valid[source].to_numpy() for output, source in self.fields.items()},
+            index=keys,
+        )
+
+        # 规范化后重名的员工（模糊姓名），便于提示；按姓名匹配时保留最后一条记录
+        duplicated = keys.duplicated(keep=False)
+        self.duplicates = sorted(set(valid['姓名'][duplicated]), key=str)
+        self.ambiguous = set(keys[duplicated])
+
+        self.table = values[~keys.duplicated(keep='last')]
+
+        # 第二匹配键索引：(姓名, 第二匹配键) 组合唯一的记录
+        self.pair_table = None
+        if secondary_key is not None:
+            secondary = normalize_keys(valid[secondary_key]).to_numpy()
+            pairs = pd.MultiIndex.from_arrays([keys, secondary])
+            self.pair_table = values.set_axis(pairs)[pd.notna(secondary) & ~pairs.duplicated(keep=False)]
+
+    def __len__(self):
+        return len(self.table)
+
+    def fingerprint(self):
+        """索引内容的哈希（填充的列、匹配键和各条记录），用于判断上次的处理结果能否沿用"""
+        digest = hashlib.sha256(repr((sorted(self.fields.items()), self.secondary_key, self.key_headers,
+                                      sorted(self.ambiguous, key=str))).encode())
+        for table in (self.table, self.pair_table):
+            if table is not None:
+                digest.update(pickle.dumps((list(table.index), table.to_numpy(dtype=object).tolist()),
+                                           protocol=pickle.HIGHEST_PROTOCOL))
+        return digest.hexdigest()
+
+    def report_duplicates(self):
+        """打印员工信息文件中的重名情况"""
+        if self.duplicates:
+            how = f"月报中有{'/'.join(self.key_headers)}列时按{self.secondary_key}区分，否则" if self.secondary_key else ""
+            print(f"员工信息文件中存在 {len(self.ambiguous)} 个重名姓名，{how}按最后一条记录匹配: "
+                  f"{list_names(self.duplicates)}")
+
+    def lookup(self, names, key_values=None):
+        """
+        查找每个姓名在索引中的位置（向量化）
+
+        参数:
+            names: 月报中的姓名
+            key_values: 与names对应的第二匹配键取值（可选，需要建立索引时指定secondary_key）
+
+        返回:
+            (table中的行号数组，未匹配为-1；pair_table中的行号数组或None)
+        """
+        keys = normalize_names(names)
+        positions = self.table.index.get_indexer(keys)
+        pair_positions = None
+        if key_values is not None and self.pair_table is not None:
+            pairs = pd.MultiIndex.from_arrays([keys.to_numpy(), normalize_keys(key_values).to_numpy()])
+            pair_positions = self.pair_table.index.get_indexer(pairs)
+        return positions, pair_positions
+
+    def fill(self, df, name_column='姓名', key_values=None):
+        """
+        根据姓名列（和可选的第二匹配键）填充 df 中的各个字段列（原地修改），未匹配的行保持原值
+
+        参数:
+            key_values: 与df各行对应的第二匹配键取值（月报中的工号等列），没有时只按姓名匹配
+
+        返回:
+            匹配成功的行数
+        """
+        positions, pair_positions = self.lookup(df[name_column], key_values)
+        matched = positions >= 0
+        if matched.any():
+            for output in self.fields:
+                df.loc[matched, output] = self.table[output].to_numpy()[positions[matched]]
+        if pair_positions is not None:
+            paired = pair_positions >= 0
+            if paired.any():
+                for output in self.fields:
+                    df.loc[paired, output] = self.pair_table[output].to_numpy()[pair_positions[paired]]
+            matched |= paired
+        return int(matched.sum())
+
+    def check_names(self, names, key_values=None):
+        """
+        检查月报中的姓名：返回 (未匹配的姓名列表, 匹配到重名员工的姓名列表)，按首次出现的顺序；
+        提供key_values时，已按第二匹配键区分的重名员工不计入后者
+        """
+        names = pd.Series(names, dtype=object, copy=False)
+        positions, pair_positions = self.lookup(names, key_values)
+        keys = normalize_names(names)
+        present = keys.notna().to_numpy()
+        unmatched = present & (positions < 0)
+        ambiguous = present & keys.isin(self.ambiguous).to_numpy()
+        if pair_positions is not None:
+            ambiguous &= pair_positions < 0
+        return list(names[unmatched].astype(str).unique()), list(names[ambiguous].astype(str).unique())
+
+
+def load_directory(schedule_file, fields, required_columns, cache_dir=DIRECTORY_CACHE_DIR, label="员工信息文件",
+                   secondary_key=None, key_headers=None):
+    """
+    读取并校验员工信息文件，建立按姓名的索引；解析结果按文件内容哈希缓存在磁盘上
+
+    同一个文件（内容不变）再次读取时直接从缓存加载，不再重新解析；
+    文件内容、fields 或 required_columns 变化时缓存键随之变化。
+
+    参数:
+        schedule_file: 员工信息文件路径（xlsx、xls或CSV），也可以是bytes或文件对象
+        fields: 需要填充的列，含义同 EmployeeDirectory
+        required_columns: 必须存在的列，缺少时抛出ValueError
+        cache_dir: 缓存目录，为None时不使用缓存
+        label: 错误提示中的文件名称
+        secondary_key: 第二匹配键的列名（见EmployeeDirectory），可选
+        key_headers: 月报中第二匹配键列的表头（见EmployeeDirectory），可选
+    """
+    data = read_bytes(schedule_file)
+
+    store = None
+    if cache_dir:
+        store = ResultStore(cache_dir, max_bytes=DIRECTORY_CACHE_BYTES, suffix=".pkl")
+        if not isinstance(fields, dict):
+            fields = {field: field for field in fields}
+        key = content_key(data, salt=f"{DIRECTORY_VERSION}|{sorted(fields.items())}|{list(required_columns)}"
+                                     f"|{secondary_key}|{key_headers}")
+        cached_path = store.get(key)
+        if cached_path:
+            try:
+                with open(cached_path, "rb") as f:
+                    return pickle.load(f)
+            except Exception as e:
+                # 缓存损坏或版本不兼容时重新解析
+                print(f"员工信息缓存读取失败，重新解析: {str(e)}")
+
+    schedule_df = read_table(data)
+    required_columns = list(required_columns) + ([secondary_key] if secondary_key is not None else [])
+    if not set(required_columns).issubset(schedule_df.columns):
+        missing = [col for col in required_columns if col not in schedule_df.columns]
+        raise ValueError(f"{label}缺少必要的列: {', '.join(missing)}")
+    directory = EmployeeDirectory(schedule_df, fields, secondary_key, key_headers)
+
+    if store is not None:
+        try:
+            store.put_bytes(key, pickle.dumps(directory, protocol=pickle.HIGHEST_PROTOCOL))
+            store.evict()
+        except OSError as e:
+            print(f"员工信息缓存写入失败: {str(e)}")
+    return directory
@@ -0,0 +1,487 @@
+import hashlib
+import io
+import os
+import pickle
+import posixpath
+import re
+import uuid
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from openpyxl.utils import column_index_from_string
+
+from layout import LAYOUT_PROBE_ROWS
+from readers import XLSX_MAGIC, is_file_object, read_head
+from summary import METRIC_COLUMNS, column_metrics
+
+
+# 增量状态文件格式版本：结构变化时递增，旧状态文件随之失效
+STATE_FORMAT = "3"
+
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+# 共享字符串表中的一项（<si>...</si>），以及工作表中引用共享字符串的单元格（t="s"）
+_SHARED_STRING = re.compile(rb"<(?:\w+:)?si\b[^>]*?(?:/>|>.*?</(?:\w+:)?si>)", re.S)
+_SHARED_REF = re.compile(rb"<(?:\w+:)?c\b[^>]*?\bt=[\"']s[\"'][^>]*>\s*<(?:\w+:)?v>\s*(\d+)\s*</(?:\w+:)?v>")
+_SHARED_TYPE = re.compile(rb"\bt=[\"']s[\"']")
+# 带位置（r="AB12"）的单元格，以及单元格中的值（<v> 或内联字符串 <is>）
+_CELL = re.compile(rb"(<(?:\w+:)?c\b[^>]*?\br=[\"']([A-Z]+)(\d+)[\"'][^>]*?(?:/>|>.*?</(?:\w+:)?c>))", re.S)
+_ANY_CELL = re.compile(rb"<(?:\w+:)?c\b")
+_VALUE = re.compile(rb"<(?:\w+:)?(?:v|is)\b")
+# 不需要读取的工作表替换为空表
+_EMPTY_SHEET = (b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData/></worksheet>')
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _resolve(base_dir, target):
+    """关系文件中的目标路径转换为zip中的路径（相对于所在目录，或以/开头的绝对路径）"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+
+def _relationships(zf, part):
+    """{关系ID: (类型, zip中的路径)}"""
+    base_dir, name = posixpath.split(part)
+    rels_part = posixpath.join(base_dir, "_rels", name + ".rels")
+    if rels_part not in zf.namelist():
+        return {}
+    root = ET.fromstring(zf.read(rels_part))
+    return {
+        rel.get("Id"): (rel.get("Type", ""), _resolve(base_dir, rel.get("Target", "")))
+        for rel in root if _local(rel.tag) == "Relationship" and rel.get("TargetMode") != "External"
+    }
+
+
+def _inline_shared(match, shared):
+    """把单元格中共享字符串的序号替换为字符串的内容"""
+    start, end = match.span(1)
+    offset = match.start()
+    text = match.group(0)
+    return text[:start - offset] + shared[int(match.group(1))] + text[end - offset:]
+
+
+class SheetContent:
+    """
+    xlsx月报中一个工作表的内容指纹（见xlsx_sheets）
+
+    属性:
+        name: 工作表名
+        part: 工作表XML在zip中的路径
+        hash: 整个工作表的哈希
+        columns: {列序号: 该列所有单元格的哈希}；有单元格没有位置（r属性）时为None，不按列沿用
+        rows: 最后一个有值单元格所在的行号（与pandas不设表头读取的行数一致）
+        width: 最后一个有值单元格所在的列序号加1（与pandas读取的列数一致）
+    """
+
+    def __init__(self, name, part, hash, columns, rows, width):
+        self.name = name
+        self.part = part
+        self.hash = hash
+        self.columns = columns
+        self.rows = rows
+        self.width = width
+
+
+def _column_hashes(data, common):
+    """
+    按列计算工作表XML中单元格的哈希（单元格内容包含行号，同一列中任一单元格变化时该列的哈希变化）
+
+    返回:
+        ({列序号: 哈希}, 行数, 列数)；有单元格没有位置时返回 (None, 0, 0)
+    """
+    cells = {}
+    rows = width = count = 0
+    for cell, letters, row in _CELL.findall(data):
+        count += 1
+        row = int(row)
+        column_cells = cells.get(letters)
+        if column_cells is None:
+            column_cells = cells[letters] = [column_index_from_string(letters.decode()) - 1]
+        column_cells.append(cell)
+        # 单元格按行排列，只有可能扩大行数、列数的单元格才需要检查是否有值
+        if (row > rows or column_cells[0] >= width) and _VALUE.search(cell):
+            rows = max(rows, row)
+            width = max(width, column_cells[0] + 1)
+    if count != len(_ANY_CELL.findall(data)):
+        return None, 0, 0
+    columns = {}
+    for column_cells in cells.values():
+        digest = common.copy()
+        digest.update(b"".join(column_cells[1:]))
+        columns[column_cells[0]] = digest.hexdigest()
+    return columns, rows, width
+
+
+def xlsx_sheets(source, salt=""):
+    """
+    按工作表计算xlsx月报的内容哈希，不解析单元格（直接读取zip中各工作表的XML）
+
+    工作表的哈希包含该工作表的XML（共享字符串的序号替换为字符串内容）、样式表（数字格式决定日期的读取结果）、
+    1904日期系统标记和工作表的隐藏状态；某个工作表变化时其他工作表的哈希不变。
+    引用的共享字符串无法可靠识别时（如属性写法不同），改为包含整个共享字符串表，此时不计算各列的哈希。
+    各列的哈希同样包含样式表、日期系统和salt，只包含该列的单元格。
+
+    参数:
+        source: 文件路径或文件对象
+        salt: 混入每个哈希的其他内容（如员工信息的指纹）
+
+    返回:
+        [SheetContent]，按工作簿中的顺序；不是xlsx时返回None
+    """
+    if read_head(source, len(XLSX_MAGIC)) != XLSX_MAGIC:
+        return None
+    if is_file_object(source):
+        source.seek(0)
+    with zipfile.ZipFile(source) as zf:
+        package_rels = ET.fromstring(zf.read("_rels/.rels"))
+        workbook_part = next(
+            _resolve("", rel.get("Target", "")) for rel in package_rels
+            if rel.get("Type", "").endswith("/officeDocument")
+        )
+        workbook = ET.fromstring(zf.read(workbook_part))
+        rels = _relationships(zf, workbook_part)
+
+        def part_of(kind):
+            return next((path for rel_type, path in rels.values() if rel_type.endswith("/" + kind)), None)
+
+        shared_part, styles_part = part_of("sharedStrings"), part_of("styles")
+        shared_data = zf.read(shared_part) if shared_part else b""
+        shared = _SHARED_STRING.findall(shared_data)
+        common = hashlib.sha256(salt.encode())
+        common.update(zf.read(styles_part) if styles_part else b"")
+        date1904 = next((pr.get("date1904", "") for pr in workbook.iter() if _local(pr.tag) == "workbookPr"), "")
+        common.update(f"|date1904={date1904}".encode())
+
+        sheets = []
+        for sheet in workbook.iter():
+            if _local(sheet.tag) != "sheet":
+                continue
+            name = sheet.get("name")
+            _, sheet_part = rels[sheet.get(f"{{{_REL_NS}}}id")]
+            data = zf.read(sheet_part)
+            digest = common.copy()
+            digest.update(f"|{name}|{sheet.get('state', 'visible')}|".encode())
+            refs = _SHARED_REF.findall(data)
+            if len(refs) == len(_SHARED_TYPE.findall(data)) and all(int(ref) < len(shared) for ref in refs):
+                # 共享字符串的序号替换为字符串本身：其他工作表增加新字符串导致序号变化时，哈希不变
+                if refs:
+                    data = _SHARED_REF.sub(lambda match: _inline_shared(match, shared), data)
+                digest.update(data)
+                columns, rows, width = _column_hashes(data, common)
+            else:
+                digest.update(data + b"\x01" + shared_data)
+                columns, rows, width = None, 0, 0
+            sheets.append(SheetContent(name, sheet_part, digest.hexdigest(), columns, rows, width))
+    return sheets
+
+
+def filter_sheet(data, columns, last_row):
+    """
+    只保留工作表XML中需要读取的单元格：columns 中的列、开头 LAYOUT_PROBE_ROWS 行（识别布局）
+    和第 last_row 行（最后一个有值的行）；单元格保持原来的位置，pandas读取后这些列的值和类型
+    与读取整个工作表时相同
+    """
+    letters = {}
+
+    def keep(match):
+        row = int(match.group(3))
+        if row <= LAYOUT_PROBE_ROWS or row == last_row:
+            return match.group(1)
+        column = letters.get(match.group(2))
+        if column is None:
+            column = letters[match.group(2)] = column_index_from_string(match.group(2).decode()) - 1
+        return match.group(1) if column in columns else b""
+
+    return _CELL.sub(keep, data)
+
+
+def filtered_workbook(source, sheets):
+    """
+    复制xlsx月报，按 sheets 替换其中的工作表，其余内容（共享字符串、样式等）原样复制
+
+    参数:
+        sheets: {工作表XML的路径: None（替换为空表）或 (保留的列, 最后一个有值的行)，见filter_sheet}
+
+    返回:
+        内存中的工作簿（BytesIO）
+    """
+    if is_file_object(source):
+        source.seek(0)
+    output = io.BytesIO()
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as zout:
+        for info in zin.infolist():
+            if info.filename not in sheets:
+                zout.writestr(info.filename, zin.read(info.filename))
+            elif sheets[info.filename] is None:
+                zout.writestr(info.filename, _EMPTY_SHEET)
+            else:
+                zout.writestr(info.filename, filter_sheet(zin.read(info.filename), *sheets[info.filename]))
+    output.seek(0)
+    return output
+
+
+def file_digest(path):
+    """文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IncrementalState:
+    """
+    增量处理状态：按工作表保存内容哈希、各日期列的哈希和处理完成的结果
+
+    月报每天更新时（如月初至今月报，每天增加一个日期列，偶尔更正几行），只重新读取、
+    清洗和统计新增或变化的日期列，其余日期列沿用上次的清洗结果和异常统计；
+    姓名和员工信息每次重新匹配。整个工作表都未变化时不再读取，直接使用上次的表格；
+    所有工作表都未变化且上次的输出文件仍在时，连输出文件也不再重新写出。
+
+    工作表和各列的哈希直接从xlsx的zip内容计算（见xlsx_sheets），包含员工信息的指纹；
+    按列沿用时只解析需要的单元格（见filtered_workbook）。状态中只保存哈希、处理结果和
+    各列的异常统计（压缩后的pickle），不保存原始单元格文本。
+    version（流水线版本、规则集版本、处理配置）变化时上次的状态作废。
+
+    参数:
+        path: 状态文件路径
+        version: 处理规则和流水线的版本标识
+    """
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self.sheets = {}
+        self.output = None
+        self.hashes = None
+        self.contents = {}
+        # 按列沿用的工作表：{工作表名: 沿用的列序号列表}（见read_source）
+        self.plans = {}
+        # 本次处理的工作表和输出文件（处理成功后由save保存）
+        self._updated = {}
+        self._output = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"增量状态读取失败，本次全部重新处理: {str(e)}")
+            return
+        if state.get("format") != STATE_FORMAT or state.get("version") != self.version:
+            print("处理规则或流水线版本已变化，本次全部重新处理")
+            return
+        self.sheets = state["sheets"]
+        self.output = state.get("output")
+
+    def save(self):
+        """保存本次处理的所有工作表（本次没有出现的工作表不再保留）"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+        state = {"format": STATE_FORMAT, "version": self.version, "sheets": self._updated, "output": self._output}
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def begin(self, input_file, directory):
+        """
+        计算本次月报各工作表和各列的哈希
+
+        返回:
+            工作表名列表；月报不是xlsx时返回None（不支持增量处理）
+        """
+        sheets = xlsx_sheets(input_file, salt=directory.fingerprint())
+        if sheets is None:
+            return None
+        self.contents = {sheet.name: sheet for sheet in sheets}
+        self.hashes = {sheet.name: sheet.hash for sheet in sheets}
+        return list(self.hashes)
+
+    def lookup(self, sheet_name, summary=False):
+        """内容未变化的工作表上次保存的结果，没有时返回None；summary 为True时要求保存了异常汇总"""
+        entry = self.sheets.get(sheet_name)
+        if entry is None or entry["hash"] != self.hashes.get(sheet_name):
+            return None
+        if summary and entry["summary"] is None:
+            return None
+        return entry
+
+    def reusable_columns(self, sheet_name, summary=False):
+        """
+        工作表中内容与上次相同、可以沿用上次清洗结果的日期列（列序号列表）
+
+        要求上次按同样的布局处理、行数相同（各列的类型由该列的值和行数决定），
+        summary 为True时要求保存了各列的异常统计
+        """
+        entry = self.sheets.get(sheet_name)
+        content = self.contents[sheet_name]
+        if entry is None or entry["layout"] is None or content.columns is None or entry["rows"] != content.rows:
+            return []
+        if summary and entry["metrics"] is None:
+            return []
+        return [column for column, digest in entry["columns"].items()
+                if column < content.width and content.columns.get(column) == digest]
+
+    def read_source(self, input_file, summary=False):
+        """
+        确定各工作表能否按列沿用上次的结果，返回本次读取用的文件
+
+        有工作表按列沿用时，生成只包含需要读取的单元格的工作簿：按列沿用的工作表只保留
+        姓名列、第二匹配键列、变化的日期列和最后一个有值的行列，整个未变化的工作表替换为空表；
+        否则返回原文件
+        """
+        self.plans = {}
+        for sheet_name in self.contents:
+            if self.lookup(sheet_name, summary) is None:
+                reused = self.reusable_columns(sheet_name, summary)
+                if reused:
+                    self.plans[sheet_name] = reused
+        if not self.plans:
+            return input_file
+
+        sheets = {}
+        for sheet_name, content in self.contents.items():
+            if self.lookup(sheet_name, summary) is not None:
+                sheets[content.part] = None
+            elif sheet_name in self.plans:
+                layout = self.sheets[sheet_name]["layout"]
+                columns = {layout.name_column, layout.key_column, content.width - 1}
+                columns.update(column for column in range(layout.day_start, content.width)
+                               if column not in self.plans[sheet_name])
+                sheets[content.part] = (columns, content.rows)
+        return filtered_workbook(input_file, sheets)
+
+    def partial(self, sheet_name):
+        """本次是否只读取了该工作表的部分列"""
+        return sheet_name in self.plans
+
+    def reuse(self, sheet_name, raw, layout):
+        """
+        按列沿用上次的清洗结果
+
+        参数:
+            raw: 本次读取的工作表数据（见layout.read_sheet）
+            layout: 本次识别的布局
+
+        返回:
+            {输出列名: 上次的清洗结果}（见新01.process_sheet 的 reuse 参数）；
+            没有按列沿用，或布局、行数、列数与计划不一致时返回None（需要重新读取整个工作表）
+        """
+        reused = self.plans.get(sheet_name)
+        if not reused:
+            return None
+        entry = self.sheets[sheet_name]
+        content = self.contents[sheet_name]
+        width = raw.columns[-1] + 1 if len(raw.columns) else 0
+        if (layout != entry["layout"] or layout.key_column != entry["layout"].key_column
+                or (len(raw), width) != (content.rows, content.width)):
+            return None
+        frame = pickle.loads(zlib.decompress(entry["frame"]))
+        return {column - layout.day_start + 1: frame[column - layout.day_start + 1].to_numpy(dtype=object)
+                for column in reused}
+
+    def restore(self, sheet_name, entry, stats, recorder, summary=None):
+        """
+        使用上次的结果：累加处理统计、补充工作表记录和异常汇总，本次保存时保留该结果
+
+        返回:
+            处理完成的DataFrame（上次行数或列数不足跳过时为None）
+        """
+        self._updated[sheet_name] = entry
+        if stats is not None:
+            for key, value in entry["stats"].items():
+                stats[key] += value
+        recorder.update_sheet(**entry["counts"])
+        recorder.update_sheet(reused=entry["stats"]["cells"])
+        if summary is not None:
+            summary.sheets[sheet_name] = list(entry["summary"])
+        return pickle.loads(zlib.decompress(entry["frame"]))
+
+    def record(self, sheet_name, df, stats, counts, summary=None, raw=None, layout=None, reuse=None):
+        """
+        保存本次处理完成的工作表（df为None表示该工作表被跳过）
+
+        参数:
+            raw、layout: 本次读取的工作表数据和布局，用于保存各日期列的哈希（下次按列沿用）
+            reuse: 本次沿用的列（见reuse）
+            summary: 异常汇总；统计各日期列的异常（沿用的列使用上次的统计），合计后加入汇总
+        """
+        content = self.contents[sheet_name]
+        entry = {
+            "hash": self.hashes[sheet_name],
+            "frame": zlib.compress(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)),
+            "stats": dict(stats),
+            "counts": {key: value for key, value in counts.items() if key not in ("sheet", "elapsed", "peak_rss")},
+            "summary": None,
+            "layout": None,
+            "rows": content.rows,
+            "columns": {},
+            "metrics": None,
+        }
+        width = raw.columns[-1] + 1 if raw is not None and len(raw.columns) else 0
+        if df is not None and raw is not None:
+            day_columns = list(range(layout.day_start, width))
+            if summary is not None:
+                metrics = self._column_metrics(sheet_name, raw, layout, day_columns, reuse or {})
+                summary.add_metrics(sheet_name, df, np.stack([metrics[column] for column in day_columns], axis=1)
+                                    .sum(axis=1) if day_columns else np.zeros((len(df), len(METRIC_COLUMNS))))
+                entry["metrics"] = zlib.compress(pickle.dumps(metrics, protocol=pickle.HIGHEST_PROTOCOL))
+            # 本次读取的行数、列数与zip中的内容一致时才能在下次按列沿用
+            if content.columns is not None and (len(raw), width) == (content.rows, content.width):
+                entry["layout"] = layout
+                entry["columns"] = {column: content.columns[column] for column in day_columns
+                                    if column in content.columns}
+        if summary is not None:
+            entry["summary"] = list(summary.sheets.get(sheet_name, []))
+        self._updated[sheet_name] = entry
+
+    def _column_metrics(self, sheet_name, raw, layout, day_columns, reuse):
+        """各日期列每行的异常统计 {列序号: 行数 × 指标数}：沿用的列取上次的统计，其余列从原始文本统计"""
+        metrics = {}
+        entry = self.sheets.get(sheet_name)
+        if reuse:
+            metrics = {column: values for column, values in pickle.loads(zlib.decompress(entry["metrics"])).items()
+                       if column - layout.day_start + 1 in reuse}
+        changed = [column for column in day_columns if column not in metrics]
+        values = raw[changed][layout.data_start:].to_numpy(dtype=object)
+        texts = np.array([[str(x) if x is not None else '' for x in row] for row in values], dtype=object)
+        counted = column_metrics(texts.reshape(len(values), len(changed)))
+        for index, column in enumerate(changed):
+            metrics[column] = counted[:, index, :]
+        return metrics
+
+    def unchanged(self, summary=False):
+        """所有工作表（包括顺序）都与上次相同"""
+        return (self.hashes is not None and list(self.sheets) == list(self.hashes)
+                and all(self.lookup(name, summary) is not None for name in self.hashes))
+
+    def reuse_output(self, output_file, output_format):
+        """
+        上次写出的输出文件仍在原处且内容未被改动时沿用（本次保存时保留其记录）
+
+        返回:
+            是否沿用
+        """
+        if self.output is None or not isinstance(output_file, (str, os.PathLike)):
+            return False
+        if (self.output["path"] != os.path.abspath(output_file) or self.output["format"] != output_format
+                or not os.path.exists(output_file) or file_digest(output_file) != self.output["digest"]):
+            return False
+        self._output = self.output
+        return True
+
+    def record_output(self, output_file, output_format):
+        """记录本次写出的输出文件（写入内存时不记录）"""
+        if isinstance(output_file, (str, os.PathLike)):
+            self._output = {"path": os.path.abspath(output_file), "format": output_format,
+                            "digest": file_digest(output_file)}
@@ -0,0 +1,255 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# 阶段运行期间采样常驻内存的间隔（秒）
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def peak_rss():
+    """
+    当前进程启动以来的峰值常驻内存（字节），无法获取时返回None
+
+    只在每次运行使用独立进程时有意义（如bench）；app和HTTP服务是长期运行的进程，
+    各个任务的内存使用 current_rss 采样（见RssSampler）
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为KB，macOS 为字节
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def current_rss():
+    """当前进程此刻的常驻内存（字节），无法获取时返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class RssSampler:
+    """
+    在后台线程中定期采样当前进程的常驻内存，记录采样期间的峰值
+
+    峰值是整个进程的常驻内存，同一进程内同时运行的其他任务也计算在内；
+    window_peak 为最近一次 start_window 以来的峰值（用于单个工作表）
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_rss = None
+        self.peak = None
+        self.window_peak = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        rss = current_rss()
+        if rss is None:
+            return
+        with self._lock:
+            if self.peak is None or rss > self.peak:
+                self.peak = rss
+            if self.window_peak is None or rss > self.window_peak:
+                self.window_peak = rss
+
+    def start_window(self):
+        with self._lock:
+            self.window_peak = None
+        self.sample()
+
+    def end_window(self):
+        self.sample()
+        return self.window_peak
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.start_rss = current_rss()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+        return self.peak
+
+
+class RuleHits:
+    """
+    规则命中统计：{规则集名称: {规则: 命中的单元格数}}
+
+    清洗函数对每个不同取值调用一次，weight 为该取值出现的单元格数，
+    因此命中数按单元格计，而不是按不同取值计。
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.weight = 1
+
+    def add(self, ruleset, pattern):
+        # 首次遇到规则集时按规则顺序登记，未命中的规则也会出现在报告中（计为0）
+        counts = self.counts.get(ruleset.name)
+        if counts is None:
+            counts = self.counts[ruleset.name] = dict.fromkeys(ruleset.patterns, 0)
+        counts[pattern] += self.weight
+
+    def register(self, *rulesets):
+        """按规则顺序登记规则集，未命中的规则计为0"""
+        for ruleset in rulesets:
+            self.counts.setdefault(ruleset.name, dict.fromkeys(ruleset.patterns, 0))
+
+    def count(self, clean, values, weights):
+        """对每个不同取值调用 clean(value, hits)，按出现次数累计命中"""
+        for value, weight in zip(values, weights):
+            self.weight = int(weight)
+            clean(value, self)
+        self.weight = 1
+
+    def merge(self, counts):
+        for name, patterns in counts.items():
+            merged = self.counts.setdefault(name, dict.fromkeys(patterns, 0))
+            for pattern, count in patterns.items():
+                merged[pattern] = merged.get(pattern, 0) + count
+
+
+class StageRecorder:
+    """
+    记录一个处理阶段（如新01、新02）的运行信息：
+
+    - 按步骤（read / join / clean / write 等）累计的耗时；步骤可以嵌套，外层步骤
+      只记录自身的耗时（扣除内层步骤），因此各步骤之和等于总耗时。例如 write 包住
+      整个写出过程，其中的 read、clean 单独计时
+    - 每个工作表的耗时、处理期间的峰值内存、行数、单元格数、匹配人数
+    - 规则命中统计（rule_hits=True 时）
+    - 整个阶段的耗时、开始时的内存和阶段期间的峰值内存（由 measure 记录）
+
+    内存为本进程的常驻内存，在阶段运行期间采样（见RssSampler），不是进程启动以来的峰值；
+    同一进程内同时运行的任务（如app的多个任务）也计算在内，按工作表并行时不含子进程
+    """
+
+    def __init__(self, rule_hits=False):
+        self.timings = {}
+        self.sheets = []
+        self.hits = RuleHits() if rule_hits else None
+        self.elapsed = None
+        self.peak_rss = None
+        self.start_rss = None
+        self._stack = []
+        self._sheet = None
+        self._sampler = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = self._stack.pop()
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed - inner
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    @contextmanager
+    def sheet(self, name):
+        """记录一个工作表的处理过程，处理代码通过 update_sheet 补充行数等信息"""
+        record = {"sheet": name}
+        self._sheet = record
+        sampler = self._sampler or RssSampler()
+        sampler.start_window()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["elapsed"] = time.perf_counter() - start
+            record["peak_rss"] = sampler.end_window()
+            self._sheet = None
+            self.sheets.append(record)
+
+    def update_sheet(self, **values):
+        """累加当前工作表的统计值（行数、单元格数等）"""
+        if self._sheet is None:
+            return
+        for key, value in values.items():
+            self._sheet[key] = self._sheet.get(key, 0) + value
+
+    @contextmanager
+    def measure(self):
+        """记录整个阶段的耗时，以及阶段期间采样得到的峰值内存"""
+        self._sampler = RssSampler().start()
+        self.start_rss = self._sampler.start_rss
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self.peak_rss = self._sampler.stop()
+            self._sampler = None
+
+    def count_rules(self, clean, values, weights):
+        """统计规则命中（未开启时忽略），clean 需要支持 hits 参数"""
+        if self.hits is not None:
+            self.hits.count(clean, values, weights)
+
+    def to_dict(self):
+        return {
+            "elapsed": self.elapsed,
+            "start_rss": self.start_rss,
+            "peak_rss": self.peak_rss,
+            "timings": dict(self.timings),
+            "sheets": list(self.sheets),
+            "rule_hits": self.hits.counts if self.hits is not None else None,
+        }
+
+
+class _NullRecorder:
+    """不记录任何信息的占位记录器，调用方不需要判断是否传入了记录器"""
+
+    timings = {}
+    sheets = []
+    hits = None
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    @contextmanager
+    def sheet(self, name):
+        yield {}
+
+    def update_sheet(self, **values):
+        pass
+
+    def count_rules(self, clean, values, weights):
+        pass
+
+
+NULL_RECORDER = _NullRecorder()
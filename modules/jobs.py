@@ -0,0 +1,229 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline import run_pipeline
+
+
+# 同时运行的任务数，以及运行中之外最多允许排队的任务数
+DEFAULT_MAX_RUNNING = 2
+DEFAULT_MAX_QUEUED = 8
+# 已结束的任务记录和工作目录保留时间（秒）
+DEFAULT_JOB_TTL = 3600
+
+REPORT_NAME = "月报.xlsx"
+EMPLOYEE_NAME = "员工信息.xlsx"
+
+
+def summary_key(key):
+    """异常汇总文件在结果仓库中的键（与处理结果的键对应）"""
+    return f"summary-{key}"
+
+
+def preview_key(key):
+    """预览缓存在结果仓库中的键"""
+    return f"preview-{key}"
+
+
+class JobQueueFull(Exception):
+    """排队的任务已达上限，拒绝新的任务"""
+
+
+class Job:
+    """
+    一次处理任务，状态依次为 queued → running → success / error
+
+    属性:
+        job_id: 任务ID
+        workspace: 任务的工作目录（上传文件、中间文件、输出文件都在这里），在内存中处理时为None
+        key: 结果缓存键（可选）
+        status: 当前状态
+        progress: {"stage", "done", "total", "sheet"}，每个工作表开始处理时更新
+        result: 结束后为 run_pipeline 的结果字典
+    """
+
+    def __init__(self, job_id, workspace, key=None):
+        self.job_id = job_id
+        self.workspace = workspace
+        self.key = key
+        # 在内存中处理时的上传内容，任务开始后释放
+        self.inputs = None
+        self.status = "queued"
+        self.progress = {"stage": None, "done": 0, "total": 0, "sheet": None}
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束（超时返回False）"""
+        return self._done.wait(timeout)
+
+    def update_progress(self, stage, done, total, sheet_name):
+        self.progress = {"stage": stage, "done": done, "total": total, "sheet": sheet_name}
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def to_dict(self):
+        """转换为可直接展示或序列化的状态字典"""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": dict(self.progress),
+            # 内存中的输出内容不放进状态字典
+            "result": {k: v for k, v in self.result.items() if k not in ("output_bytes", "summary_bytes", "preview_bytes")}
+            if self.result else None,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """
+    在有上限的后台线程池中运行处理任务，调用方（如Streamlit页面）只需轮询任务状态
+
+    root 为None时任务全部在内存中处理（上传内容直接交给流水线，结果为bytes），
+    否则每个任务在 root 下有独立的工作目录，多个用户同时处理时不会互相覆盖文件。
+    运行中的任务数不超过 max_running，排队的任务数不超过 max_queued，超过时
+    submit 抛出 JobQueueFull。传入 store 时，成功的结果按任务的 key 存入结果仓库
+    （只有这一步写磁盘），随后释放内存中的结果或删除工作目录。
+
+    参数:
+        root: 各任务工作目录的上级目录，None表示在内存中处理
+        store: 结果仓库（ResultStore），可选
+        max_running: 同时运行的任务数
+        max_queued: 最多排队的任务数
+        ttl: 已结束任务的保留时间（秒），由 prune 清理
+    """
+
+    def __init__(self, root, store=None, max_running=DEFAULT_MAX_RUNNING, max_queued=DEFAULT_MAX_QUEUED,
+                 ttl=DEFAULT_JOB_TTL):
+        self.root = root
+        self.store = store
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="job")
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.active)
+
+    def submit(self, report_data, employee_data, key=None, **options):
+        """
+        提交一个处理任务，立即返回Job，处理在后台线程中进行
+
+        参数:
+            report_data: 月报文件内容（bytes或memoryview；在内存中处理时直接使用，不复制）
+            employee_data: 员工信息文件内容
+            key: 结果缓存键，配合 store 使用
+            options: 传给 run_pipeline 的其他参数（fused、streaming等）
+        """
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.active)
+            if active >= self.max_running + self.max_queued:
+                raise JobQueueFull(f"当前排队任务过多（{active} 个），请稍后再试")
+            job_id = uuid.uuid4().hex
+            job = Job(job_id, os.path.join(self.root, job_id) if self.root is not None else None, key)
+            self._jobs[job_id] = job
+
+        if job.workspace is None:
+            job.inputs = (report_data, employee_data)
+            self._executor.submit(self._run, job, options)
+            return job
+
+        try:
+            os.makedirs(job.workspace)
+            with open(os.path.join(job.workspace, REPORT_NAME), "wb") as f:
+                f.write(report_data)
+            with open(os.path.join(job.workspace, EMPLOYEE_NAME), "wb") as f:
+                f.write(employee_data)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            shutil.rmtree(job.workspace, ignore_errors=True)
+            raise
+
+        self._executor.submit(self._run, job, options)
+        return job
+
+    def _run(self, job, options):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            if job.workspace is None:
+                report_data, employee_data = job.inputs
+                job.inputs = None
+                result = run_pipeline(report_data, employee_data, None, progress=job.update_progress, **options)
+            else:
+                result = run_pipeline(
+                    os.path.join(job.workspace, REPORT_NAME),
+                    os.path.join(job.workspace, EMPLOYEE_NAME),
+                    job.workspace,
+                    progress=job.update_progress,
+                    **options
+                )
+            if result["status"] == "success" and self.store is not None and job.key:
+                if job.workspace is None:
+                    result["output_file"] = self.store.put_bytes(job.key, result.pop("output_bytes"))
+                    if "summary_bytes" in result:
+                        result["summary_file"] = self.store.put_bytes(summary_key(job.key),
+                                                                      result.pop("summary_bytes"))
+                    if "preview_bytes" in result:
+                        result["preview_file"] = self.store.put_bytes(preview_key(job.key),
+                                                                      result.pop("preview_bytes"))
+                else:
+                    result["output_file"] = self.store.put(job.key, result["output_file"])
+                    if "summary_file" in result:
+                        result["summary_file"] = self.store.put(summary_key(job.key), result["summary_file"])
+                    if "preview_file" in result:
+                        result["preview_file"] = self.store.put(preview_key(job.key), result["preview_file"])
+                    shutil.rmtree(job.workspace, ignore_errors=True)
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        job.result = result
+        job.finished = time.time()
+        job.status = result["status"]
+        job._done.set()
+
+    def get(self, job_id):
+        """返回任务，不存在（或已被清理）时返回None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def prune(self):
+        """
+        清理结束超过 ttl 的任务记录及其工作目录，以及没有对应任务的残留工作目录（如应用重启前的任务）
+
+        返回:
+            清理的任务数量
+        """
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished and now - job.finished > self.ttl]
+            for job in expired:
+                del self._jobs[job.job_id]
+            known = set(self._jobs)
+
+        if self.root is None:
+            return len(expired)
+        for job in expired:
+            shutil.rmtree(job.workspace, ignore_errors=True)
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.name not in known and now - entry.stat().st_mtime > self.ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        return len(expired)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
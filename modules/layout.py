@@ -0,0 +1,169 @@
+import datetime
+import re
+
+import pandas as pd
+
+
+# 探测布局时读取的行数（标题、生成时间、表头、星期行都在开头几行）
+LAYOUT_PROBE_ROWS = 10
+# 固定布局：前四行为标题、生成时间、表头和星期，第一列为姓名
+DEFAULT_NAME_COLUMN = 0
+DEFAULT_DATA_START = 4
+
+_DAY_TEXT = re.compile(r'^(\d{1,2})[日号]?$')
+_DATE_TEXT = re.compile(r'^(\d{4}[-/.])?\d{1,2}[-/.]\d{1,2}$')
+_WEEKDAY_TEXT = re.compile(r'^(星期|周)?[一二三四五六日天]$')
+
+
+class SheetLayout:
+    """
+    月报工作表的布局
+
+    属性:
+        name_column: 姓名列的序号
+        day_start: 第一个日期列的序号（之后的列全部保留）
+        data_start: 第一条员工记录的行号（之前的行删除）
+        detected: 是否由表头识别得到（False为固定布局）
+        key_column: 第二匹配键列（如 工号）的序号，只用于匹配员工信息、不输出；没有时为None
+    """
+
+    def __init__(self, name_column, day_start, data_start, detected=False, key_column=None):
+        self.name_column = name_column
+        self.day_start = day_start
+        self.data_start = data_start
+        self.detected = detected
+        self.key_column = key_column
+
+    def __eq__(self, other):
+        return (isinstance(other, SheetLayout)
+                and (self.name_column, self.day_start, self.data_start)
+                == (other.name_column, other.day_start, other.data_start))
+
+    def __repr__(self):
+        return (f"SheetLayout(name_column={self.name_column}, day_start={self.day_start}, "
+                f"data_start={self.data_start}, detected={self.detected}, key_column={self.key_column})")
+
+    def keep_columns(self, width):
+        """保留的列：姓名列和日期列（直到最后一列）"""
+        return [self.name_column] + list(range(self.day_start, width))
+
+    def read_columns(self, width):
+        """读取的列：保留的列，有第二匹配键列时再加上该列（放在最后）"""
+        return self.keep_columns(width) + ([self.key_column] if self.key_column is not None else [])
+
+    def usecols(self, index):
+        """传给 read_excel 的 usecols，汇总列（第二匹配键列除外）不读取"""
+        return index == self.name_column or index == self.key_column or index >= self.day_start
+
+    def describe(self):
+        text = f"姓名在第{self.name_column + 1}列，日期从第{self.day_start + 1}列开始，数据从第{self.data_start + 1}行开始"
+        return text + (f"，第{self.key_column + 1}列用于区分重名员工" if self.key_column is not None else "")
+
+
+def default_layout(day_start):
+    """原来的固定布局：删除前四行，保留第一列和day_start及以后的列"""
+    return SheetLayout(DEFAULT_NAME_COLUMN, day_start, DEFAULT_DATA_START)
+
+
+def _text(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return re.sub(r'\s+', "", str(value))
+
+
+def is_day_header(value):
+    """日期列的表头：1~31的日号（数字或文本）、日期，或 7-1、2024/7/1 这类日期文本"""
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return True
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return value == int(value) and 1 <= value <= 31
+    text = _text(value)
+    match = _DAY_TEXT.match(text)
+    if match:
+        return 1 <= int(match.group(1)) <= 31
+    return bool(_DATE_TEXT.match(text))
+
+
+def is_weekday(value):
+    return bool(_WEEKDAY_TEXT.match(_text(value)))
+
+
+def detect_layout(rows, key_headers=()):
+    """
+    根据开头几行识别布局：找到内容为"姓名"的表头单元格，其后第一个日期表头
+    （下一行为星期，或者右边一列也是日期表头）为日期列的起点；
+    表头下一行为星期行时数据从再下一行开始
+
+    参数:
+        rows: 开头几行的值（每行为列表，不要求等长）
+        key_headers: 第二匹配键列可能的表头（如 工号），在姓名列和日期列之间按顺序查找
+
+    返回:
+        识别成功时返回SheetLayout，否则返回None
+    """
+    rows = [list(row) for row in rows]
+    for header_row, row in enumerate(rows):
+        names = [index for index, value in enumerate(row) if _text(value) == "姓名"]
+        if not names:
+            continue
+        name_column = names[0]
+        below = rows[header_row + 1] if header_row + 1 < len(rows) else []
+
+        def cell(values, index):
+            return values[index] if index < len(values) else None
+
+        for index in range(name_column + 1, len(row)):
+            if not is_day_header(row[index]):
+                continue
+            if is_weekday(cell(below, index)) or is_day_header(cell(row, index + 1)):
+                data_start = header_row + (2 if is_weekday(cell(below, index)) else 1)
+                headers = [_text(value) for value in row[name_column + 1:index]]
+                key_column = next((name_column + 1 + headers.index(header) for header in key_headers
+                                   if header in headers), None)
+                return SheetLayout(name_column, index, data_start, detected=True, key_column=key_column)
+        return None
+    return None
+
+
+def resolve_layout(rows, sheet_name, default_day_start, log=print, key_headers=()):
+    """
+    识别布局，识别失败时退回固定布局并提示；识别结果与固定布局不同时同样提示
+
+    参数:
+        rows: 开头几行的值
+        sheet_name: 工作表名称（用于提示）
+        default_day_start: 固定布局中第一个日期列的序号（新01为46，0.py为26）
+        key_headers: 第二匹配键列可能的表头（见detect_layout）
+    """
+    fallback = default_layout(default_day_start)
+    layout = detect_layout(rows, key_headers)
+    if layout is None:
+        if rows and any(_text(value) for row in rows for value in row):
+            log(f"工作表 {sheet_name} 未识别到表头（姓名列和日期列），按固定布局处理：{fallback.describe()}")
+        return fallback
+    if layout != fallback:
+        log(f"工作表 {sheet_name} 的布局与默认不同，按表头识别结果处理：{layout.describe()}")
+    return layout
+
+
+def probe_excel_layout(excel_file, sheet_name, default_day_start, log=print, key_headers=()):
+    """只读取工作表开头几行识别布局（excel_file为pd.ExcelFile）"""
+    head = excel_file.parse(sheet_name, header=None, nrows=LAYOUT_PROBE_ROWS)
+    return resolve_layout(head.to_numpy(dtype=object).tolist(), sheet_name, default_day_start, log, key_headers)
+
+
+def read_sheet(excel_file, sheet_name, default_day_start, log=print, key_headers=()):
+    """
+    识别布局后只读取姓名列、日期列和第二匹配键列（不构造其他汇总列的数据）
+
+    开头的标题、表头行仍然一起读取，各列类型的推断与整表读取完全相同，由调用方按
+    layout.data_start 删除；识别失败时整表读取，与原来的固定布局处理一致
+
+    返回:
+        (DataFrame，列名为原来的列序号；布局)
+    """
+    layout = probe_excel_layout(excel_file, sheet_name, default_day_start, log, key_headers)
+    usecols = layout.usecols if layout.detected else None
+    return excel_file.parse(sheet_name, header=None, usecols=usecols), layout
@@ -0,0 +1,58 @@
+import copy
+
+from instrument import NULL_RECORDER
+from parallel import DEFAULT_CHUNK_ROWS
+from profiles import DEFAULT_PROFILE, compile_profile
+from writers import DEFAULT_FORMAT
+
+
+class RunOptions:
+    """
+    交给 新01.process_excel / 新02.replace_excel_content 的执行计划和本次运行的选项，
+    流水线为每个阶段复制一份（见copy），替换其中的记录器、进度回调和输出格式
+
+    参数:
+        profile: 处理配置名称（见profiles.PROFILES），编译为执行计划 plan
+        fused: 新01在内存中继续应用新02的替换规则，直接输出最终结果
+        streaming: 使用流式模式（只读/只写工作簿，按批处理），适用于超大月报
+        workers: 清洗使用的进程数，1为串行，0或None为全部CPU核数；数据量小时固定走串行
+        chunk_rows: 按行分块并行时每块的行数
+        output_format: 输出格式（见writers.OUTPUT_FORMATS）
+        sources: {填充列: 员工信息中的来源列}，覆盖处理配置中的同名列（如0.py的月份列名）
+        stats: 传入字典时累加处理统计（工作表数、行数、匹配数、单元格数）
+        progress: 进度回调 progress(已完成工作表数, 工作表总数, 当前工作表名)
+        recorder: 运行记录器（见instrument.StageRecorder）
+        state: 增量状态（见incremental.IncrementalState），只用于新01
+        summary: 异常汇总（见summary.ExceptionSummary），只用于新01，由调用方写出
+        preview: 预览缓存（见preview.PreviewBuilder），写出结果的同时生成，由调用方关闭
+    """
+
+    def __init__(self, profile=DEFAULT_PROFILE, fused=False, streaming=False, workers=1,
+                 chunk_rows=DEFAULT_CHUNK_ROWS, output_format=DEFAULT_FORMAT, sources=None, stats=None,
+                 progress=None, recorder=NULL_RECORDER, state=None, summary=None, preview=None):
+        self.plan = compile_profile(profile)
+        self.fused = fused
+        self.streaming = streaming
+        self.workers = workers
+        self.chunk_rows = chunk_rows
+        self.output_format = output_format
+        self.sources = sources
+        self.stats = stats
+        self.progress = progress
+        self.recorder = recorder
+        self.state = state
+        self.summary = summary
+        self.preview = preview
+
+    def copy(self, **changes):
+        """复制一份并修改其中的选项（profile 不能修改）"""
+        options = copy.copy(self)
+        for name, value in changes.items():
+            if name == "plan" or not hasattr(options, name):
+                raise TypeError(f"未知的处理选项: {name}")
+            setattr(options, name, value)
+        return options
+
+    def __repr__(self):
+        return (f"RunOptions({self.plan.profile.name!r}, fused={self.fused}, streaming={self.streaming}, "
+                f"workers={self.workers}, output_format={self.output_format!r})")
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# 每个任务处理的行数
+DEFAULT_CHUNK_ROWS = 5000
+# 单元格数少于该值时串行清洗，进程池的调度和数据传输开销不划算
+MIN_PARALLEL_CELLS = 200000
+# 文件小于该大小时不按工作表并行（单个工作表的读取和处理很快）
+MIN_PARALLEL_BYTES = 2 * 1024 * 1024
+# 子进程的启动方式：app和HTTP服务在线程中创建进程池，fork会复制其他线程持有的锁，子进程可能卡死；
+# spawn的子进程重新导入模块，清洗函数按处理配置名称传递（见profiles.Cleaner）
+POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def resolve_workers(workers):
+    """进程数：None或0表示使用全部CPU核数，至少为1"""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def create_pool(workers):
+    """进程数大于1时创建进程池，否则返回None（串行处理）"""
+    workers = resolve_workers(workers)
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT)
+
+
+def use_parallel(pool, cell_count):
+    """是否对这批单元格使用进程池：没有进程池或数据量太小时固定走串行"""
+    return pool is not None and cell_count >= MIN_PARALLEL_CELLS
+
+
+def clean_texts(clean, texts):
+    """在子进程中清洗一批文本（已去重），按原顺序返回结果"""
+    return [clean(text) for text in texts]
+
+
+def clean_text_blocks(texts, clean, pool, block_size):
+    """
+    把文本按块分给进程池清洗：每块先在本进程内去重，只把不同取值发给子进程，
+    结果按块的原顺序拼接
+
+    参数:
+        texts: 一维object数组（已转为字符串）
+        clean: 可pickle的单个字符串清洗函数（模块级函数）
+        pool: 进程池
+        block_size: 每块的单元格数
+
+    返回:
+        (清洗后的一维object数组, 各块不同取值个数之和)
+    """
+    blocks = []
+    for start in range(0, len(texts), block_size):
+        codes, uniques = pd.factorize(texts[start:start + block_size])
+        future = pool.submit(clean_texts, clean, list(uniques))
+        blocks.append((start, codes, future))
+
+    result = np.empty(len(texts), dtype=object)
+    distinct_count = 0
+    for start, codes, future in blocks:
+        cleaned_values = future.result()
+        cleaned = np.empty(len(cleaned_values), dtype=object)
+        cleaned[:] = cleaned_values
+        result[start:start + len(codes)] = cleaned[codes]
+        distinct_count += len(cleaned_values)
+    return result, distinct_count
@@ -0,0 +1,361 @@
+import datetime
+import json
+import os
+import time
+from io import BytesIO
+
+from employees import EmployeeDirectory
+from incremental import IncrementalState
+from instrument import StageRecorder
+from options import RunOptions
+from parallel import DEFAULT_CHUNK_ROWS
+from preview import PREVIEW_SUFFIX, PreviewBuilder
+from profiles import DEFAULT_PROFILE, PROFILES
+from readers import check_input_format, source_name
+from rules import RULES_VERSION
+from store import content_key
+from summary import SUMMARY_SUFFIX, ExceptionSummary
+from writers import DEFAULT_FORMAT, OUTPUT_FORMATS, check_output_format, output_name, output_suffix, with_suffix
+from 新01 import new_stats, process_excel
+from 新02 import replace_excel_content
+
+
+# 流水线版本：处理逻辑变化（不含规则变化）时递增，已缓存的结果随之失效
+PIPELINE_VERSION = "3"
+
+# 中间文件和最终文件的默认文件名（与原subprocess调用方式保持一致）
+INTERMEDIATE_NAME = "处理月报_xin01_3.xlsx"
+FINAL_NAME = "原始数据.xlsx"
+# 运行报告文件名后缀（写在最终文件旁）
+REPORT_SUFFIX = "_运行报告.json"
+
+
+class PipelineError(Exception):
+    """
+    流水线某个阶段执行失败时抛出的结构化异常
+
+    属性:
+        stage: 出错的阶段名称（如"新01"、"新02"）
+        message: 错误描述
+        error_type: 原始异常类型名称
+    """
+
+    def __init__(self, stage, message, error_type=None):
+        super().__init__(f"{stage} 执行失败: {message}")
+        self.stage = stage
+        self.message = message
+        self.error_type = error_type or "PipelineError"
+
+    def to_dict(self):
+        """转换为app使用的结果字典"""
+        return {
+            "status": "error",
+            "stage": self.stage,
+            "error_type": self.error_type,
+            "error": str(self),
+        }
+
+
+def result_key(*payloads, options=""):
+    """
+    计算流水线结果的缓存键：各个上传文件内容 + 流水线版本 + 规则集版本 + 处理选项
+
+    参数:
+        payloads: 上传文件的内容（bytes或memoryview），顺序有意义
+        options: 会影响输出的处理选项（如 "fused" / "streaming" / 处理配置）
+    """
+    return content_key(*payloads, salt=f"{PIPELINE_VERSION}|{RULES_VERSION}|{options}")
+
+
+def result_file_key(report_data, employee_data, fused=True, streaming=False, output_format=DEFAULT_FORMAT,
+                    profile=DEFAULT_PROFILE):
+    """
+    处理结果在结果仓库中的键：result_key + 输出格式的扩展名（app和HTTP服务共用，结果互相命中）
+
+    非默认格式加上格式名前缀（快速写出与默认格式的扩展名同为.xlsx）
+    """
+    options = f"fused,streaming={streaming}" if fused else f"streaming={streaming}"
+    options += f",profile={profile}"
+    key = result_key(report_data, employee_data, options=options) + output_suffix(output_format)
+    return key if output_format == DEFAULT_FORMAT else f"{output_format}-{key}"
+
+
+def run_stage(stage, func, *args, **kwargs):
+    """
+    执行单个阶段，成功返回阶段的返回值，失败统一转换为PipelineError
+
+    参数:
+        stage: 阶段名称
+        func: 阶段函数（出错时需抛出异常；新01、新02需传入raise_errors=True）
+    """
+    try:
+        result = func(*args, **kwargs)
+    except PipelineError:
+        raise
+    except Exception as e:
+        raise PipelineError(stage, str(e), type(e).__name__) from e
+    if result is None:
+        raise PipelineError(stage, "阶段未返回输出文件")
+    return result
+
+
+def stage_progress(progress, stage):
+    """把流水线的进度回调转换为单个阶段使用的回调（附带阶段名）"""
+    if progress is None:
+        return None
+    return lambda done, total, sheet_name: progress(stage, done, total, sheet_name)
+
+
+def write_run_report(report, report_file):
+    """把运行报告写为JSON文件，写入失败不影响处理结果"""
+    try:
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return report_file
+    except OSError as e:
+        print(f"运行报告写入失败: {str(e)}")
+        return None
+
+
+def write_preview(preview):
+    """写出预览缓存的索引并关闭（供run_stage调用）"""
+    preview.close()
+    return preview.output_file
+
+
+def check_formats(input_file, employee_file, output_format):
+    """
+    在开始处理之前检查输出格式和输入格式所需的依赖（如Parquet的pyarrow、.xls的xlrd），
+    不要在整个月报处理完、写出时才失败
+
+    返回:
+        不可用时为PipelineError，否则为None；文件无法读取等错误留给处理阶段报告
+    """
+    try:
+        check_output_format(output_format)
+    except (ValueError, ImportError) as e:
+        return PipelineError("输出格式", str(e), type(e).__name__)
+    for source in (input_file, employee_file):
+        if isinstance(source, EmployeeDirectory):
+            continue
+        try:
+            check_input_format(source)
+        except ImportError as e:
+            return PipelineError("输入格式", str(e), type(e).__name__)
+        except OSError:
+            pass
+    return None
+
+
+def output_exists(output_file):
+    """输出文件（或内存中的输出）是否已生成"""
+    if isinstance(output_file, BytesIO):
+        return output_file.getbuffer().nbytes > 0
+    return os.path.exists(output_file)
+
+
+def run_pipeline(input_file, employee_file, work_dir, final_name=FINAL_NAME, fused=False, streaming=False,
+                 workers=1, chunk_rows=DEFAULT_CHUNK_ROWS, intermediate_name=INTERMEDIATE_NAME, progress=None,
+                 rule_hits=False, report=True, output_format=DEFAULT_FORMAT, incremental=None, summary=False,
+                 preview=False, profile=DEFAULT_PROFILE):
+    """
+    在当前进程内按顺序执行 新01.process_excel 和 新02.replace_excel_content
+
+    参数:
+        input_file: 月报文件路径，或内存中的内容（bytes / BytesIO）
+        employee_file: 员工信息文件路径、内存中的内容，或已建立的EmployeeDirectory
+        work_dir: 中间文件和最终文件的输出目录；为None时全部在内存中完成（不写任何文件，
+                  不写运行报告文件），结果以bytes返回
+        final_name: 最终输出文件名
+        fused: 为True时使用融合模式，两组替换规则在内存中一次完成，
+               不再写出和重新读取中间文件
+        streaming: 为True时两个阶段都使用流式模式，峰值内存与行数无关
+        workers: 清洗使用的进程数（1为串行，0为全部CPU核数），数据量小时自动串行
+        chunk_rows: 按行分块并行时每块的行数
+        intermediate_name: 中间文件名（多个任务共用输出目录时需要区分）
+        progress: 进度回调 progress(阶段名, 已完成工作表数, 工作表总数, 当前工作表名)
+        rule_hits: 为True时统计每条替换规则命中的单元格数（会增加少量耗时）
+        report: 为True时在输出文件旁写出JSON格式的运行报告（<输出文件名>_运行报告.json）
+        output_format: 最终文件的格式（见writers.OUTPUT_FORMATS），final_name 的扩展名随之调整；
+                       中间文件始终为Excel，非默认格式时中间文件使用快速写出；
+                       格式不受支持或所需依赖（如Parquet的pyarrow）未安装时，在开始处理之前返回错误
+                       （输入为.xls而没有安装xlrd时同样如此）
+        incremental: 增量状态文件路径；指定时按工作表和日期列保存内容哈希和处理结果，下次处理同一月报
+                     （如每天更新的月初至今月报）时只读取和清洗新增或变化的日期列，内容未变化的工作表
+                     不再读取，月报完全未变化且上次的输出文件仍在时不再写出（见incremental.py）。
+                     使用融合模式和整表处理，流式模式和按工作表并行不生效，只支持xlsx月报。
+                     处理成功后才更新状态文件
+        summary: 为True时另外输出异常汇总文件（<输出文件名>_异常汇总，格式同output_format）：
+                 每个工作表一张表，按员工汇总迟到/早退/旷工的次数和分钟数及缺卡次数，
+                 在新01清洗的同一遍中从原始文本提取
+        preview: 为True时在写出最终文件的同一遍中生成预览缓存（<输出文件名>_预览.cache，见preview.py）
+        profile: 处理配置名称（见profiles.PROFILES），两个阶段使用同一配置编译的执行计划
+
+    返回:
+        成功时返回 {"status": "success", "output_file": ..., "elapsed": ..., "stats": ...,
+                    "timings": ..., "report": ..., "report_file": ...}，
+        work_dir 为None时 output_file 为None，另有 output_bytes（输出文件的内容），
+        summary 为True时另有 summary_file（work_dir 为None时为 summary_bytes），
+        preview 为True时另有 preview_file（work_dir 为None时为 preview_bytes），
+        timings 为 {阶段名: {read/join/clean/write: 秒}}，report 为运行报告（各阶段及工作表的耗时、内存、行数和规则命中）
+        失败时返回 PipelineError.to_dict() 的结果，同样附带 report（格式不可用时 report 为None）
+    """
+    start = time.perf_counter()
+    started = datetime.datetime.now()
+    format_error = check_formats(input_file, employee_file, output_format)
+    if format_error is not None:
+        result = format_error.to_dict()
+        result.update(elapsed=time.perf_counter() - start, timings={}, report=None)
+        return result
+    in_memory = work_dir is None
+    if in_memory:
+        intermediate_path, final_path = BytesIO(), BytesIO()
+        summary_path, preview_path = BytesIO(), BytesIO()
+        report = False
+    else:
+        intermediate_path = os.path.join(work_dir, intermediate_name)
+        final_path = with_suffix(os.path.join(work_dir, final_name), output_format)
+        summary_path = os.path.splitext(final_path)[0] + SUMMARY_SUFFIX + os.path.splitext(final_path)[1]
+        preview_path = os.path.splitext(final_path)[0] + PREVIEW_SUFFIX
+    exceptions = ExceptionSummary() if summary else None
+    stats = new_stats()
+    recorders = {}
+    # 处理结果取决于流水线版本、规则集和处理配置，任一变化时上次的状态作废；
+    # 增量处理由新01直接写出最终文件（输出与两阶段模式相同）
+    state = None
+    if incremental:
+        if not fused:
+            print("增量处理使用融合模式")
+            fused = True
+        state = IncrementalState(incremental, f"{PIPELINE_VERSION}|{RULES_VERSION}|fused={fused}|profile={profile}")
+
+    def stage_recorder(stage):
+        recorders[stage] = StageRecorder(rule_hits=rule_hits)
+        return recorders[stage]
+
+    # 预览缓存在写出最终文件的同一遍中生成
+    previews = PreviewBuilder(preview_path) if preview else None
+    # 两个阶段共用的执行计划和选项，每个阶段复制一份并替换记录器、进度回调和输出格式
+    options = RunOptions(profile, streaming=streaming, workers=workers, chunk_rows=chunk_rows, stats=stats,
+                         state=state, summary=exceptions, preview=previews)
+
+    try:
+        if fused:
+            # 融合模式下新01直接输出最终文件
+            with stage_recorder("新01").measure() as recorder:
+                run_stage("新01", process_excel, input_file, employee_file, final_path, raise_errors=True,
+                          options=options.copy(fused=True, progress=stage_progress(progress, "新01"),
+                                               recorder=recorder, output_format=output_format))
+        else:
+            # 中间文件只供新02读取，最终文件不是默认格式时不需要表头样式
+            intermediate_format = DEFAULT_FORMAT if output_format == DEFAULT_FORMAT else "xlsx-fast"
+            with stage_recorder("新01").measure() as recorder:
+                run_stage("新01", process_excel, input_file, employee_file, intermediate_path, raise_errors=True,
+                          options=options.copy(progress=stage_progress(progress, "新01"), recorder=recorder,
+                                               output_format=intermediate_format, preview=None))
+            if not output_exists(intermediate_path):
+                raise PipelineError("新01", f"未生成中间文件: {output_name(intermediate_path)}")
+            with stage_recorder("新02").measure() as recorder:
+                run_stage("新02", replace_excel_content, intermediate_path, final_path, raise_errors=True,
+                          options=options.copy(progress=stage_progress(progress, "新02"), recorder=recorder,
+                                               output_format=output_format))
+
+        if not output_exists(final_path):
+            raise PipelineError("新01" if fused else "新02", f"未生成最终文件: {output_name(final_path)}")
+        if exceptions is not None:
+            with stage_recorder("异常汇总").measure() as recorder, recorder.stage("write"):
+                run_stage("异常汇总", exceptions.write, summary_path, output_format)
+        if previews is not None:
+            with stage_recorder("预览").measure() as recorder, recorder.stage("write"):
+                run_stage("预览", write_preview, previews)
+        if state is not None:
+            with stage_recorder("增量状态").measure() as recorder, recorder.stage("write"):
+                try:
+                    state.save()
+                except OSError as e:
+                    print(f"增量状态写入失败，下次将全部重新清洗: {str(e)}")
+        result = {
+            "status": "success",
+            "output_file": None if in_memory else final_path,
+            "elapsed": time.perf_counter() - start,
+            "stats": stats,
+        }
+        if in_memory:
+            result["output_bytes"] = final_path.getvalue()
+            if exceptions is not None:
+                result["summary_bytes"] = summary_path.getvalue()
+            if previews is not None:
+                result["preview_bytes"] = preview_path.getvalue()
+        else:
+            if exceptions is not None:
+                result["summary_file"] = summary_path
+            if previews is not None:
+                result["preview_file"] = preview_path
+    except PipelineError as e:
+        if previews is not None:
+            previews.discard()
+        result = e.to_dict()
+        result["elapsed"] = time.perf_counter() - start
+
+    result["timings"] = {stage: dict(recorder.timings) for stage, recorder in recorders.items()}
+    result["report"] = {
+        "status": result["status"],
+        "error": result.get("error"),
+        "started": started.isoformat(timespec="seconds"),
+        "elapsed": result["elapsed"],
+        # 各阶段期间采样的本进程常驻内存（不是进程启动以来的峰值）：开始处理时的值和处理期间的峰值
+        "start_rss": next((recorder.start_rss for recorder in recorders.values()), None),
+        "peak_rss": max((recorder.peak_rss for recorder in recorders.values() if recorder.peak_rss is not None),
+                        default=None),
+        "input_file": source_name(input_file, default=None),
+        "output_file": None if in_memory else final_path,
+        "options": {"streaming": streaming, "workers": workers, "chunk_rows": chunk_rows, "fused": fused,
+                    "output_format": output_format, "incremental": incremental, "summary": summary,
+                    "preview": preview, "profile": profile},
+        "stats": stats,
+        "stages": {stage: recorder.to_dict() for stage, recorder in recorders.items()},
+    }
+    if report:
+        result["report_file"] = write_run_report(
+            result["report"], os.path.splitext(final_path)[0] + REPORT_SUFFIX)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="在同一进程内执行 新01 → 新02 处理流水线")
+    parser.add_argument("input_file", help="月报文件")
+    parser.add_argument("employee_file", help="员工信息文件")
+    parser.add_argument("output_dir", nargs="?", help="输出目录，默认与月报文件相同")
+    parser.add_argument("--fused", action="store_true", help="融合模式，不生成中间文件")
+    parser.add_argument("--streaming", action="store_true", help="流式模式，峰值内存与行数无关")
+    parser.add_argument("--workers", type=int, default=1, help="清洗使用的进程数，0为全部CPU核数")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="并行时每块的行数")
+    parser.add_argument("--rule-hits", action="store_true", help="在运行报告中统计每条替换规则的命中数")
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default=DEFAULT_FORMAT,
+                        help="最终文件格式：" + "；".join(f"{name} {desc}" for name, (_, desc) in OUTPUT_FORMATS.items()))
+    parser.add_argument("--incremental", metavar="STATE_FILE",
+                        help="增量处理：状态文件路径，再次处理更新后的同一月报时只重新处理新增或变化的日期列")
+    parser.add_argument("--summary", action="store_true",
+                        help="另外输出按员工汇总的迟到/早退/旷工分钟数和缺卡次数（<输出文件名>_异常汇总）")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="处理配置：" + "；".join(f"{name} {profile.label}" for name, profile in PROFILES.items()))
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.dirname(os.path.abspath(args.input_file))
+    os.makedirs(output_dir, exist_ok=True)
+    result = run_pipeline(args.input_file, args.employee_file, output_dir, fused=args.fused,
+                          streaming=args.streaming, workers=args.workers, chunk_rows=args.chunk_rows,
+                          rule_hits=args.rule_hits, output_format=args.format, incremental=args.incremental,
+                          summary=args.summary, profile=args.profile)
+    if result["status"] == "success":
+        print(f"流水线完成，耗时 {result['elapsed']:.2f} 秒，已保存至: {result['output_file']}")
+        if result.get("summary_file"):
+            print(f"异常汇总已保存至: {result['summary_file']}")
+        if result.get("report_file"):
+            print(f"运行报告已保存至: {result['report_file']}")
+    else:
+        print(f"流水线失败: {result['error']}")
+        sys.exit(1)
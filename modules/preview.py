@@ -0,0 +1,258 @@
+import os
+import pickle
+import struct
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from writers import OutputWriter
+
+
+# 预览缓存格式版本：结构变化时递增，旧缓存按不存在处理
+PREVIEW_FORMAT = "1"
+# 每块的行数：翻页时只读取当前页所在的块
+PREVIEW_CHUNK_ROWS = 1000
+# 每个预览读取器在内存中保留的块数
+PREVIEW_CACHED_CHUNKS = 8
+# 筛选使用的列（姓名、部门），不存在时只按第一列筛选
+FILTER_COLUMNS = ["姓名", "部门"]
+PREVIEW_SUFFIX = "_预览.cache"
+
+_FOOTER = struct.Struct("<Q")
+
+
+def _column_name(value):
+    return "" if value is None else str(value)
+
+
+class _PreviewSheet:
+    """一个工作表的预览数据：逐行追加，满一块时按列写入文件"""
+
+    def __init__(self, builder, name, header):
+        self.builder = builder
+        self.name = name
+        self.columns = None if header is None else [_column_name(value) for value in header]
+        self.rows = []
+        self.row_count = 0
+        self.chunks = []
+        # 筛选列的全部取值（只保存这几列，用于在读取块之前定位匹配的行）
+        self.filters = {}
+
+    def append(self, row):
+        if self.columns is None:
+            # 未指定表头时第一行为表头（如流式复制的工作表）
+            self.columns = [_column_name(value) for value in row]
+            return
+        self.rows.append(list(row))
+        if len(self.rows) >= PREVIEW_CHUNK_ROWS:
+            self.flush()
+
+    def add_frame(self, df):
+        for start in range(0, len(df), PREVIEW_CHUNK_ROWS):
+            part = df.iloc[start:start + PREVIEW_CHUNK_ROWS]
+            self._write_chunk([part.iloc[:, index].to_numpy(dtype=object) for index in range(part.shape[1])])
+
+    def flush(self):
+        if not self.rows:
+            return
+        width = len(self.columns)
+        table = np.empty((len(self.rows), width), dtype=object)
+        for index, row in enumerate(self.rows):
+            row = row[:width] + [None] * (width - len(row))
+            table[index] = row
+        self.rows = []
+        self._write_chunk([table[:, index] for index in range(width)])
+
+    def _write_chunk(self, arrays):
+        for name in self.filter_columns():
+            self.filters.setdefault(name, []).append(arrays[self.columns.index(name)])
+        offset = self.builder.write_block(arrays)
+        self.chunks.append((offset, self.row_count, len(arrays[0]) if arrays else 0))
+        self.row_count += self.chunks[-1][2]
+
+    def filter_columns(self):
+        names = [name for name in FILTER_COLUMNS if name in self.columns]
+        return names or self.columns[:1]
+
+    def to_index(self):
+        self.flush()
+        columns = self.columns or []
+        return {
+            "name": self.name,
+            "columns": columns,
+            "rows": self.row_count,
+            "chunks": self.chunks,
+            "filters": {
+                name: np.concatenate(parts) if parts else np.empty(0, dtype=object)
+                for name, parts in self.filters.items()
+            },
+        }
+
+
+class PreviewBuilder:
+    """
+    在写出处理结果的同时生成预览缓存（按列保存的分块数据），app翻页时不再解析xlsx
+
+    文件格式：各数据块（每块为各列的数组，pickle）依次写入，最后是索引
+    （工作表、列名、行数、各块位置、筛选列的全部取值）和索引的位置（8字节）。
+    读取时先读索引，翻页时只读取当前页所在的块。
+
+    参数:
+        output_file: 预览缓存文件路径，也可以是BytesIO
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self._file = output_file if isinstance(output_file, BytesIO) else open(output_file, "wb")
+        self.sheets = []
+
+    def add_sheet(self, sheet_name, header=None):
+        sheet = _PreviewSheet(self, sheet_name, header)
+        self.sheets.append(sheet)
+        return sheet
+
+    def add_frame(self, sheet_name, df):
+        self.add_sheet(sheet_name, list(df.columns)).add_frame(df)
+
+    def add_workbook(self, wb):
+        """从内存中的openpyxl工作簿生成所有工作表的预览（第一行为表头）"""
+        for ws in wb.worksheets:
+            sheet = self.add_sheet(ws.title)
+            for row in ws.iter_rows(values_only=True):
+                sheet.append(row)
+
+    def write_block(self, arrays):
+        offset = self._file.tell()
+        pickle.dump(arrays, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        return offset
+
+    def tee(self, writer):
+        """包装结果写出器：写出的同时生成预览"""
+        return _TeeWriter(writer, self)
+
+    def discard(self):
+        """处理失败时关闭并删除未完成的预览缓存"""
+        if self._file is None:
+            return
+        if not isinstance(self._file, BytesIO):
+            self._file.close()
+            os.remove(self.output_file)
+        self._file = None
+
+    def close(self):
+        if self._file is None:
+            return
+        index = {"format": PREVIEW_FORMAT, "sheets": [sheet.to_index() for sheet in self.sheets]}
+        offset = self._file.tell()
+        pickle.dump(index, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.write(_FOOTER.pack(offset))
+        if not isinstance(self._file, BytesIO):
+            self._file.close()
+        self._file = None
+
+
+def tee_writer(writer, preview):
+    """preview不为None时包装写出器，写出的同时生成预览"""
+    return writer if preview is None else preview.tee(writer)
+
+
+class _TeeSheet:
+    def __init__(self, sheet, preview):
+        self._sheet = sheet
+        self._preview = preview
+
+    def append(self, row):
+        self._sheet.append(row)
+        self._preview.append(row)
+
+
+class _TeeWriter(OutputWriter):
+    """把写出的工作表同时交给预览缓存"""
+
+    def __init__(self, writer, preview):
+        super().__init__(writer.output_file)
+        self._writer = writer
+        self._preview = preview
+
+    def add_sheet(self, sheet_name, header=None, sheet_state="visible"):
+        sheet = self._writer.add_sheet(sheet_name, header, sheet_state)
+        return _TeeSheet(sheet, self._preview.add_sheet(sheet_name, header))
+
+    def write_frame(self, sheet_name, df):
+        self._writer.write_frame(sheet_name, df)
+        self._preview.add_frame(sheet_name, df)
+
+    def close(self):
+        self._writer.close()
+
+
+class PreviewReader:
+    """
+    读取预览缓存：打开时只读取索引，按页读取需要的块（最近使用的块保留在内存中，
+    最多 PREVIEW_CACHED_CHUNKS 块），可在多个会话之间共用
+
+    参数:
+        path: 预览缓存文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            (offset,) = _FOOTER.unpack(f.read(_FOOTER.size))
+            f.seek(offset)
+            index = pickle.load(f)
+        if index.get("format") != PREVIEW_FORMAT:
+            raise ValueError("预览缓存格式已变化")
+        self.sheets = OrderedDict((sheet["name"], sheet) for sheet in index["sheets"])
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def sheet_names(self):
+        return list(self.sheets)
+
+    def matching_rows(self, sheet_name, text=""):
+        """姓名或部门中包含text的行号（text为空时为全部行）"""
+        sheet = self.sheets[sheet_name]
+        if not text:
+            return np.arange(sheet["rows"])
+        mask = np.zeros(sheet["rows"], dtype=bool)
+        for values in sheet["filters"].values():
+            mask |= pd.Series(values, dtype=object).astype(str).str.contains(text, regex=False).to_numpy()
+        return np.flatnonzero(mask)
+
+    def page(self, sheet_name, rows):
+        """读取指定行号（升序）的数据，返回DataFrame"""
+        sheet = self.sheets[sheet_name]
+        starts = np.array([start for _, start, _ in sheet["chunks"]], dtype=np.int64)
+        parts = []
+        for chunk_index in np.unique(np.searchsorted(starts, rows, side="right") - 1):
+            offset, start, count = sheet["chunks"][chunk_index]
+            arrays = self._chunk(offset)
+            local = rows[(rows >= start) & (rows < start + count)] - start
+            parts.append([array[local] for array in arrays])
+        columns = sheet["columns"]
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        data = {index: np.concatenate([part[index] for part in parts]) for index in range(len(columns))}
+        df = pd.DataFrame(data)
+        df.columns = columns
+        return df
+
+    def _chunk(self, offset):
+        with self._lock:
+            if offset in self._chunks:
+                self._chunks.move_to_end(offset)
+                return self._chunks[offset]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            arrays = pickle.load(f)
+        with self._lock:
+            self._chunks[offset] = arrays
+            while len(self._chunks) > PREVIEW_CACHED_CHUNKS:
+                self._chunks.popitem(last=False)
+        return arrays
@@ -0,0 +1,240 @@
+from functools import lru_cache
+
+import pandas as pd
+
+from employees import load_directory
+from rules import (
+    PATTERNS_0, PATTERNS_1, PATTERNS_XIN01, PATTERNS_XIN02, PATTERNS_XIN02_SEMICOLON, RuleSet, TriggerFilter,
+)
+
+
+# 单元格文本清洗结果的缓存上限（按不同取值计）
+CACHE_SIZE = 65536
+
+
+class Profile:
+    """
+    处理配置：描述一种月报格式的整条处理流程（第一阶段清洗、第二阶段替换）
+
+    属性:
+        name: 配置名称（PROFILES中的键）
+        label: 界面上显示的说明
+        day_start: 固定布局中第一个日期列的序号，表头识别失败时使用
+        min_day_columns: 至少需要的日期列数，列数不足 day_start + min_day_columns 的工作表跳过
+                         （0.py要求至少27列，即至少一个日期列；新01只要求46列）
+        join_fields: 按姓名从员工信息中填充的列（依次插入在姓名列之后）
+        clean_rules: 第一阶段（新01 / 0.py）的规则集 [(名称, 规则列表, 替换文本)]，按顺序应用
+        replace_rules: 第二阶段（新02 / 1.py）的规则集，格式同上
+        protected_columns: 第二阶段不替换的前几列（姓名和填充的列）
+        directory_label: 员工信息文件在提示中的名称
+        secondary_key: 员工信息中区分重名员工的列（如 员工ID），为None时只按姓名匹配
+        key_headers: 月报中与secondary_key对应的列的表头，月报有其中之一时按 (姓名, 该列) 匹配
+    """
+
+    def __init__(self, name, label, day_start, join_fields, clean_rules, replace_rules, protected_columns,
+                 directory_label="员工信息文件", secondary_key=None, key_headers=(), min_day_columns=0):
+        self.name = name
+        self.label = label
+        self.day_start = day_start
+        self.join_fields = list(join_fields)
+        self.clean_rules = list(clean_rules)
+        self.replace_rules = list(replace_rules)
+        self.protected_columns = protected_columns
+        self.directory_label = directory_label
+        self.secondary_key = secondary_key
+        self.key_headers = tuple(key_headers)
+        self.min_day_columns = min_day_columns
+
+    def __repr__(self):
+        return f"Profile({self.name!r}, day_start={self.day_start}, join_fields={self.join_fields})"
+
+
+PROFILES = {
+    "current": Profile(
+        "current", "当前格式（新01/新02：保留第47列及以后，填充员工ID、部门）",
+        day_start=46,
+        join_fields=["员工ID", "部门"],
+        clean_rules=[("新01.patterns_to_replace", PATTERNS_XIN01, '')],
+        replace_rules=[
+            ("新02.patterns_to_replace", PATTERNS_XIN02, ''),
+            ("新02.patterns_to_replace2", PATTERNS_XIN02_SEMICOLON, ';'),
+        ],
+        protected_columns=3,
+        secondary_key="员工ID",
+        key_headers=("员工ID", "工号"),
+    ),
+    "legacy": Profile(
+        "legacy", "旧格式（0/1：保留第27列及以后，填充员工ID、部门、班次）",
+        day_start=26,
+        join_fields=["员工ID", "部门", "班次"],
+        clean_rules=[("0.patterns_to_replace", PATTERNS_0, '')],
+        replace_rules=[("1.patterns_to_replace", PATTERNS_1, '')],
+        protected_columns=4,
+        directory_label="班次文件",
+        min_day_columns=1,
+    ),
+}
+DEFAULT_PROFILE = "current"
+
+
+class Cleaner:
+    """
+    执行计划中的一个单元格处理函数，可以pickle（按配置名称传给子进程，
+    子进程中重新编译同一配置的执行计划）
+
+    属性:
+        prefilter: 该函数依次应用的规则集的合并预判，用于统计跳过规则的单元格数
+    """
+
+    def __init__(self, plan, kind, prefilter=None):
+        self.plan = plan
+        self.kind = kind
+        self.prefilter = prefilter
+        self._func = getattr(plan, kind)
+
+    def __call__(self, *args):
+        return self._func(*args)
+
+    def __reduce__(self):
+        return get_cleaner, (self.plan.profile.name, self.kind)
+
+    def __repr__(self):
+        return f"Cleaner({self.plan.profile.name!r}, {self.kind!r})"
+
+
+class ExecutionPlan:
+    """
+    由处理配置编译得到的执行计划：预编译的规则集、触发字符预判、带缓存的替换函数，
+    以及交给 新01 / 新02 的单元格处理函数（cleaners）
+
+    参数:
+        profile: 处理配置（见Profile）
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.clean_rules = [RuleSet(patterns, repl, name) for name, patterns, repl in profile.clean_rules]
+        self.replace_rules = [RuleSet(patterns, repl, name) for name, patterns, repl in profile.replace_rules]
+        self.replace_filter = TriggerFilter(*self.replace_rules)
+        # 考勤单元格大量重复（如 正常-正常），第二阶段的结果按文本做有上限的LRU缓存，
+        # 命中/未命中次数可通过 lookup.cache_info() 查看
+        self.lookup = lru_cache(maxsize=CACHE_SIZE)(self._lookup)
+        self.cleaners = {
+            "clean_cell": Cleaner(self, "clean_cell", TriggerFilter(*self.clean_rules)),
+            "clean_fused": Cleaner(self, "clean_fused", TriggerFilter(*self.clean_rules, *self.replace_rules)),
+            "replace_text": Cleaner(self, "replace_text", self.replace_filter),
+        }
+
+    @property
+    def day_start(self):
+        return self.profile.day_start
+
+    @property
+    def min_day_columns(self):
+        return self.profile.min_day_columns
+
+    @property
+    def protected_columns(self):
+        return self.profile.protected_columns
+
+    def load_directory(self, schedule_file, sources=None):
+        """
+        读取并校验员工信息文件，建立按姓名（和配置的第二匹配键）的索引（内容未变时从磁盘缓存加载）
+
+        参数:
+            sources: {填充列: 员工信息中的来源列}，覆盖配置中的同名列（如0.py的月份列名）
+        """
+        fields = {field: field for field in self.profile.join_fields}
+        fields.update(sources or {})
+        return load_directory(schedule_file, fields, ["姓名"] + list(fields.values()),
+                              label=self.profile.directory_label, secondary_key=self.profile.secondary_key,
+                              key_headers=self.profile.key_headers)
+
+    def clean_cell(self, cell_value, hits=None):
+        """第一阶段的单元格清洗（确保非单元格匹配），清洗后为空时返回原值；hits 用于统计规则命中"""
+        if pd.isna(cell_value):
+            return cell_value
+
+        # 强制转换为字符串
+        cell_str = str(cell_value)
+
+        # 按顺序应用预编译的规则（仅替换匹配的部分）
+        for rules in self.clean_rules:
+            cell_str = rules.apply(cell_str, hits)
+
+        # 处理替换后可能产生的空白
+        cleaned_str = cell_str.strip()
+        return cleaned_str if cleaned_str else cell_value
+
+    def apply_replace(self, text, hits=None):
+        """按顺序对文本应用第二阶段的各组规则，并去除首尾空白"""
+        for rules in self.replace_rules:
+            text = rules.apply(text, hits)
+        return text.strip()
+
+    def _lookup(self, text):
+        """apply_replace 的结果及该文本是否跳过了规则（没有触发字符）"""
+        return self.apply_replace(text), not self.replace_filter.needs(text)
+
+    def replace_text(self, text):
+        """单个文本的替换结果（使用缓存）"""
+        return self.lookup(text)[0]
+
+    def replace_cell(self, value):
+        """
+        replace_cell_value 的缓存版本，额外返回是否跳过了规则，用于统计
+
+        返回:
+            (新值, 是否发生变化, 是否跳过规则)；空单元格不计为跳过
+        """
+        if value is None:
+            return value, False, False
+        original_value = str(value)
+        cell_text, skipped = self.lookup(original_value)
+        if cell_text != original_value:
+            return (cell_text if cell_text else ""), True, skipped
+        return value, False, skipped
+
+    def replace_cell_value(self, value, hits=None):
+        """
+        第二阶段对单个单元格的值进行替换，与逐单元格处理时的写回规则一致
+
+        参数:
+            hits: 规则命中统计，传入时不使用缓存，逐条规则记录是否命中
+
+        返回:
+            (新值, 是否发生变化)；内容无变化时返回原值
+        """
+        if hits is None:
+            return self.replace_cell(value)[:2]
+        if value is None:
+            return value, False
+        original_value = str(value)
+        cell_text = self.apply_replace(original_value, hits)
+        if cell_text != original_value:
+            return (cell_text if cell_text else ""), True
+        return value, False
+
+    def clean_fused(self, text, hits=None):
+        """融合模式的清洗函数：依次应用两个阶段的规则"""
+        return self.replace_cell_value(self.clean_cell(text, hits), hits)[0]
+
+    def cleaner(self, kind):
+        """单元格处理函数：clean_cell（第一阶段）、clean_fused（两个阶段）或 replace_text（第二阶段）"""
+        return self.cleaners[kind]
+
+    def __repr__(self):
+        return f"ExecutionPlan({self.profile.name!r})"
+
+
+@lru_cache(maxsize=None)
+def compile_profile(name=DEFAULT_PROFILE):
+    """编译处理配置，每个配置只编译一次（同一进程内共用执行计划和其中的缓存）"""
+    if name not in PROFILES:
+        raise ValueError(f"未知的处理配置: {name}（可选 {', '.join(PROFILES)}）")
+    return ExecutionPlan(PROFILES[name])
+
+
+def get_cleaner(name, kind):
+    """按配置名称取得单元格处理函数（Cleaner在子进程中按此还原）"""
+    return compile_profile(name).cleaner(kind)
@@ -0,0 +1,212 @@
+import codecs
+import csv
+import os
+import re
+from io import BytesIO
+
+import pandas as pd
+
+
+# 按文件头识别输入格式（上传文件在工作目录中统一命名为 .xlsx，不能只看扩展名）
+XLSX_MAGIC = b"PK\x03\x04"
+XLS_MAGIC = b"\xd0\xcf\x11\xe0"
+
+# CSV按块读取的行数：每块独立匹配、清洗，峰值内存与总行数无关
+CSV_CHUNK_ROWS = 20000
+# 探测CSV列数时读取的行数（标题行、表头行和若干数据行）
+CSV_PROBE_LINES = 50
+# 探测编码时读取的字节数
+ENCODING_PROBE_BYTES = 1024 * 1024
+
+# 工作表名不能包含的字符
+_INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+def sniff_format(head):
+    """根据文件开头的字节判断格式：xlsx / xls / csv"""
+    if head.startswith(XLSX_MAGIC):
+        return "xlsx"
+    if head.startswith(XLS_MAGIC):
+        return "xls"
+    return "csv"
+
+
+def as_source(data):
+    """
+    输入可以是文件路径、文件对象或内存中的内容（bytes / memoryview），
+    内存中的内容包装为BytesIO（bytes不复制），文件对象回到开头（如刚写完的中间结果），
+    文件路径原样返回
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return BytesIO(data)
+    if is_file_object(data):
+        data.seek(0)
+    return data
+
+
+def is_file_object(source):
+    return hasattr(source, "read")
+
+
+def read_head(source, size):
+    """读取开头size个字节，文件对象读取后恢复原来的位置"""
+    if is_file_object(source):
+        position = source.tell()
+        try:
+            source.seek(0)
+            return source.read(size)
+        finally:
+            source.seek(position)
+    with open(source, "rb") as f:
+        return f.read(size)
+
+
+def read_bytes(source):
+    """读取全部内容"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, BytesIO):
+        return source.getvalue()
+    if is_file_object(source):
+        position = source.tell()
+        source.seek(0)
+        try:
+            return source.read()
+        finally:
+            source.seek(position)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def source_size(source):
+    """输入的字节数"""
+    if isinstance(source, BytesIO):
+        return source.getbuffer().nbytes
+    if is_file_object(source):
+        position = source.tell()
+        try:
+            return source.seek(0, os.SEEK_END)
+        finally:
+            source.seek(position)
+    return os.path.getsize(source)
+
+
+def source_name(source, default="月报"):
+    """输入的文件名（不含目录），内存中的内容没有文件名时返回default"""
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", None)
+    return os.path.basename(name) if isinstance(name, (str, os.PathLike)) else default
+
+
+def detect_format(source):
+    """读取文件头判断输入格式：xlsx / xls / csv"""
+    return sniff_format(read_head(source, 8))
+
+
+def require_xlrd():
+    """读取.xls需要xlrd，未安装时给出明确的提示"""
+    try:
+        import xlrd  # noqa: F401
+    except ImportError:
+        raise ImportError("读取.xls格式需要安装xlrd：pip install xlrd")
+
+
+def xls_supported():
+    """是否可以读取.xls（xlrd不是必需的依赖）"""
+    try:
+        require_xlrd()
+    except ImportError:
+        return False
+    return True
+
+
+def check_input_format(source):
+    """在开始处理之前检查输入格式所需的依赖：.xls需要xlrd，未安装时抛出ImportError"""
+    if detect_format(as_source(source)) == "xls":
+        require_xlrd()
+
+
+def detect_encoding(head):
+    """
+    判断CSV编码：能按UTF-8解码时为 utf-8-sig（兼容带BOM的文件），否则按GB18030
+    （GBK的超集，钉钉等国内系统导出的CSV常用GBK编码）
+    """
+    try:
+        # 按增量方式解码，末尾被截断的多字节字符不算错误
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+
+def csv_sheet_name(source):
+    """CSV没有工作表，用文件名（去掉扩展名）作为输出的工作表名"""
+    name = _INVALID_SHEET_CHARS.sub("_", os.path.splitext(source_name(source))[0])
+    return name[:31] or "Sheet1"
+
+
+def _head_rows(source):
+    """解析开头部分的CSV行（最多CSV_PROBE_LINES行），返回 (编码, 行列表)"""
+    head = read_head(source, ENCODING_PROBE_BYTES)
+    encoding = detect_encoding(head)
+    lines = head.decode(encoding, errors="ignore").splitlines(keepends=True)
+    if len(head) == ENCODING_PROBE_BYTES:
+        # 最后一行可能被截断
+        lines = lines[:-1]
+    rows = []
+    for index, row in enumerate(csv.reader(lines)):
+        if index >= CSV_PROBE_LINES:
+            break
+        rows.append(row)
+    return encoding, rows
+
+
+def probe_csv(source):
+    """
+    探测CSV的编码和列数（只读取开头部分）
+
+    返回:
+        (编码, 列数)
+    """
+    encoding, rows = _head_rows(source)
+    return encoding, max((len(row) for row in rows), default=0)
+
+
+def read_csv_head(source, rows):
+    """读取开头rows行（文本，用于识别表头布局）"""
+    return _head_rows(source)[1][:rows]
+
+
+def read_csv_chunks(path, encoding, width, columns=None, skip_rows=0, chunk_rows=CSV_CHUNK_ROWS,
+                    na_values=None):
+    """
+    按块读取CSV：只解析columns中的列（列序号，默认全部），跳过前skip_rows行，
+    所有值按文本读取（与Excel中的文本单元格一致）
+
+    na_values 为读成NaN的文本；默认与 pd.read_excel 相同（空单元格、"nan"、"NULL"等），
+    与openpyxl读取结果保持一致时传入 [""]（只有空单元格为NaN）
+
+    返回:
+        DataFrame迭代器，列名为列序号
+    """
+    return pd.read_csv(
+        path,
+        header=None,
+        names=range(width),
+        usecols=columns,
+        skiprows=skip_rows,
+        dtype=str,
+        encoding=encoding,
+        chunksize=chunk_rows,
+        na_values=na_values,
+        keep_default_na=na_values is None,
+    )
+
+
+def read_table(data):
+    """读取员工信息等小表格（bytes），支持xlsx、xls和CSV，第一行为表头"""
+    input_format = sniff_format(data[:8])
+    if input_format == "csv":
+        return pd.read_csv(BytesIO(data), encoding=detect_encoding(data[:ENCODING_PROBE_BYTES]))
+    if input_format == "xls":
+        require_xlrd()
+    return pd.read_excel(BytesIO(data))
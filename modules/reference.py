@@ -0,0 +1,247 @@
+import os
+import re
+import tempfile
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# 参考实现：冻结的 新01 replace_in_order + 新02 replace_excel_content 处理链（当前格式），
+# 以及 0.py + 1.py 处理链（旧格式）（逐个 re.sub、iterrows 匹配、逐单元格写回），
+# 只用于差异测试（见difftest.py），不参与实际处理。
+# 规则与处理逻辑都是原样复制，不引用rules.py等模块，优化后的代码改动不会影响这里；
+# 修改这里的行为（包括清洗后为空时返回原值这类特殊行为）需要同时确认所有快速路径的输出。
+
+# 新01的替换规则
+REFERENCE_PATTERNS_XIN01 = [
+    r'正常（未排班）',
+    r'缺卡\([^)]*\);',
+    r'缺卡\(.*?\);',
+    r'缺卡\([^)]*\)',
+    r'缺卡\(.*?\)',
+    r'补卡申请（[^）]*）',
+    r'补卡申请（.*?）',
+    r'正常\(补卡\)-',
+    r'正常-',
+    r'--',
+    r'— —',
+    r'——',
+    r'缺卡',
+    r'\r\n|\r|\n|\t',
+    r' +',
+    r'地点异常.*?;',
+    r'(补卡)-',
+]
+
+# 新02替换为空的规则
+REFERENCE_PATTERNS_XIN02 = [
+    r'正常（未排班）',
+    r'缺卡\([^)]*\);',
+    r'缺卡\(.*?\);',
+    r'缺卡\([^)]*\)',
+    r'缺卡\(.*?\)',
+    r'补卡申请（[^）]*）',
+    r'补卡申请（.*?）',
+    r'正常\(补卡\)-',
+    r'正常-',
+    r'--',
+    r'— —',
+    r'——',
+    r'缺卡',
+    r'\r\n|\r|\n|\t',
+    r' +',
+    r'地点异常.*?;',
+    r'\(补卡\)-',
+    r'正常\(管理员校准、补卡\)-',
+    r'正常\(休息\)',
+    r'正常（休息）',
+    r'正常\(管理员校准\)-',
+    r'迟到\s*[\d.]*\s*分钟-?;',
+    r'早退\s*[\d.]*\s*分钟-?;',
+    r'旷工\s*[\d.]*\s*分钟-?;',
+]
+
+# 新02替换为分号的规则
+REFERENCE_PATTERNS_XIN02_SEMICOLON = [
+    r'迟到\s*[\d.]*\s*分钟-?',
+    r'早退\s*[\d.]*\s*分钟-?',
+    r'旷工\s*[\d.]*\s*分钟-?',
+]
+
+
+# 0.py的替换规则
+REFERENCE_PATTERNS_0 = [
+    r'缺卡\([^)]*\);',
+    r'缺卡\(.*?\);',
+    r'缺卡\([^)]*\)',
+    r'缺卡\(.*?\)',
+    r'补卡申请（[^）]*）',
+    r'补卡申请（.*?）',
+    r'正常\(补卡\)-',
+    r'正常-',
+    r'--',
+    r'— —',
+    r'——',
+    r'缺卡',
+    r'\r\n|\r|\n|\t',
+    r' +',
+]
+
+# 1.py的替换规则（与0.py相同，没有替换为分号的规则）
+REFERENCE_PATTERNS_1 = list(REFERENCE_PATTERNS_0)
+
+
+def reference_replace_in_order(cell_value, patterns=REFERENCE_PATTERNS_XIN01):
+    """新01 / 0.py的单元格清洗：逐条规则替换为空，清洗后为空时返回原值"""
+    if pd.isna(cell_value):
+        return cell_value
+    cell_str = str(cell_value)
+    for pattern in patterns:
+        cell_str = re.sub(pattern, '', cell_str)
+    cleaned_str = cell_str.strip()
+    return cleaned_str if cleaned_str else cell_value
+
+
+def reference_xin01_cell(value, patterns=REFERENCE_PATTERNS_XIN01):
+    """新01 / 0.py处理一个日期列单元格：先转换为字符串（None为空字符串）再清洗"""
+    return reference_replace_in_order(str(value) if value is not None else '', patterns)
+
+
+def reference_xin02_cell(value, patterns=REFERENCE_PATTERNS_XIN02,
+                         semicolon_patterns=REFERENCE_PATTERNS_XIN02_SEMICOLON):
+    """新02 / 1.py处理一个单元格：内容变化时写回（替换后为空时写回空字符串），否则保持原值"""
+    if value is None:
+        return value
+    original_value = str(value)
+    cell_text = original_value
+    for pattern in patterns:
+        cell_text = re.sub(pattern, '', cell_text)
+    for pattern in semicolon_patterns:
+        cell_text = re.sub(pattern, ';', cell_text)
+    cell_text = cell_text.strip()
+    if cell_text != original_value:
+        return cell_text if cell_text else ""
+    return value
+
+
+def reference_clean(value, profile="current"):
+    """一个日期列单元格经过 新01 → 新02（profile 为 "legacy" 时为 0.py → 1.py）的最终结果"""
+    if profile == "legacy":
+        return reference_xin02_cell(reference_xin01_cell(value, REFERENCE_PATTERNS_0), REFERENCE_PATTERNS_1, [])
+    return reference_xin02_cell(reference_xin01_cell(value))
+
+
+def reference_xin01_excel(input_file, schedule_file, output_file, day_start=46):
+    """
+    新01的参考实现：删除前四行，保留第一列和day_start及以后的列，
+    按姓名逐行匹配员工ID和部门（重名时后一条覆盖前一条），逐单元格清洗
+    """
+    schedule_df = pd.read_excel(schedule_file)
+    excel_file = pd.ExcelFile(input_file)
+
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        for sheet_name in excel_file.sheet_names:
+            df = excel_file.parse(sheet_name, header=None)
+            if len(df) <= 4:
+                continue
+            df = df[4:].reset_index(drop=True)
+            if len(df.columns) < day_start:
+                continue
+            df = df.iloc[:, [0] + list(range(day_start, len(df.columns)))]
+            headers = list(range(0, len(df.columns)))
+            headers[0] = "姓名"
+            df.columns = headers
+            df.insert(1, "员工ID", "")
+            df.insert(2, "部门", "")
+
+            name_mapping = {}
+            for _, row in schedule_df.iterrows():
+                name_mapping[row['姓名']] = {'员工ID': row['员工ID'], '部门': row['部门']}
+            for idx, row in df.iterrows():
+                name = row['姓名']
+                if pd.notna(name) and name in name_mapping:
+                    df.at[idx, '员工ID'] = name_mapping[name]['员工ID']
+                    df.at[idx, '部门'] = name_mapping[name]['部门']
+
+            for col in df.columns:
+                if col not in ['姓名', '员工ID', '部门']:
+                    df[col] = df[col].apply(reference_xin01_cell)
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return output_file
+
+
+def reference_0_excel(input_file, schedule_file, output_file, month_column="班次"):
+    """
+    0.py的参考实现：删除前四行，至少27列时保留第一列和第27列及以后，
+    按姓名逐行匹配员工ID、部门和班次（班次取自month_column列，重名时后一条覆盖前一条），逐单元格清洗
+    """
+    schedule_df = pd.read_excel(schedule_file)
+    excel_file = pd.ExcelFile(input_file)
+
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        for sheet_name in excel_file.sheet_names:
+            df = excel_file.parse(sheet_name, header=None)
+            if len(df) <= 4:
+                continue
+            df = df[4:].reset_index(drop=True)
+            if len(df.columns) < 27:
+                continue
+            df = df.iloc[:, [0] + list(range(26, len(df.columns)))]
+            headers = list(range(0, len(df.columns)))
+            headers[0] = "姓名"
+            df.columns = headers
+            df.insert(1, "员工ID", "")
+            df.insert(2, "部门", "")
+            df.insert(3, "班次", "")
+
+            name_mapping = {}
+            for _, row in schedule_df.iterrows():
+                name_mapping[row['姓名']] = {'员工ID': row['员工ID'], '部门': row['部门'], '班次': row[month_column]}
+            for idx, row in df.iterrows():
+                name = row['姓名']
+                if pd.notna(name) and name in name_mapping:
+                    df.at[idx, '员工ID'] = name_mapping[name]['员工ID']
+                    df.at[idx, '部门'] = name_mapping[name]['部门']
+                    df.at[idx, '班次'] = name_mapping[name]['班次']
+
+            for col in df.columns:
+                if col not in ['姓名', '员工ID', '部门', '班次']:
+                    df[col] = df[col].apply(lambda x: reference_xin01_cell(x, REFERENCE_PATTERNS_0))
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return output_file
+
+
+def reference_xin02_excel(input_file, output_file, first_column=4, cell=reference_xin02_cell):
+    """
+    新02的参考实现：可见工作表第first_column列及以后的单元格逐个替换，保存为Excel
+    （1.py从第5列开始，cell 为 1.py 的单元格替换）
+    """
+    wb = load_workbook(input_file)
+    for sheet_name in wb.sheetnames:
+        ws = wb[sheet_name]
+        if ws.sheet_state != 'visible':
+            continue
+        for row in range(1, ws.max_row + 1):
+            for col in range(first_column, ws.max_column + 1):
+                cell_obj = ws.cell(row=row, column=col)
+                if cell_obj.value is not None:
+                    cell_obj.value = cell(cell_obj.value)
+    wb.save(output_file)
+    wb.close()
+    return output_file
+
+
+def reference_1_cell(value):
+    """1.py处理一个单元格"""
+    return reference_xin02_cell(value, REFERENCE_PATTERNS_1, [])
+
+
+def reference_process(input_file, schedule_file, output_file, profile="current"):
+    """参考处理链：新01 → 中间文件 → 新02（profile 为 "legacy" 时为 0.py → 1.py），输出最终文件"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        intermediate = os.path.join(work_dir, "reference_stage1.xlsx")
+        if profile == "legacy":
+            reference_0_excel(input_file, schedule_file, intermediate)
+            return reference_xin02_excel(intermediate, output_file, first_column=5, cell=reference_1_cell)
+        reference_xin01_excel(input_file, schedule_file, intermediate)
+        return reference_xin02_excel(intermediate, output_file)
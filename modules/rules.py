@@ -0,0 +1,362 @@
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+
+# 0.py / 1.py 使用的基础替换规则（非单元格匹配，按优先级排序）
+BASE_PATTERNS = [
+    # 1. 带分号的缺卡格式（增强匹配）
+    r'缺卡\([^)]*\);',  # 匹配"缺卡(任意内容);"
+    r'缺卡\(.*?\);',  # 备用模式，确保匹配
+    # 2. 不带分号的缺卡格式
+    r'缺卡\([^)]*\)',
+    r'缺卡\(.*?\)',
+    # 3. 补卡申请格式
+    r'补卡申请（[^）]*）',
+    r'补卡申请（.*?）',
+    # 4. 正常(补卡)格式
+    r'正常\(补卡\)-',
+    # 5. 正常格式
+    r'正常-',
+    # 6. 双横线格式（多种可能的横线）
+    r'--',
+    r'— —',  # 全角横线
+    r'——',  # 破折号
+    # 7. 单独的缺卡
+    r'缺卡',
+    # 8. 各种换行符和空白字符
+    r'\r\n|\r|\n|\t',
+    # 9. 空格（多个连续空格）
+    r' +',
+]
+
+# 0.py 和 1.py 的规则列表
+PATTERNS_0 = list(BASE_PATTERNS)
+PATTERNS_1 = list(BASE_PATTERNS)
+
+# 新01.py 的规则列表：在基础规则前后各增加了几条
+PATTERNS_XIN01 = [r'正常（未排班）'] + BASE_PATTERNS + [
+    r'地点异常.*?;',
+    r'(补卡)-',
+]
+
+# 新02.py 的规则列表（替换为空）
+PATTERNS_XIN02 = [r'正常（未排班）'] + BASE_PATTERNS + [
+    r'地点异常.*?;',
+    r'\(补卡\)-',
+    r'正常\(管理员校准、补卡\)-',
+    r'正常\(休息\)',
+    r'正常（休息）',
+    r'正常\(管理员校准\)-',
+    r'迟到\s*[\d.]*\s*分钟-?;',
+    r'早退\s*[\d.]*\s*分钟-?;',
+    r'旷工\s*[\d.]*\s*分钟-?;',
+]
+
+# 新02.py 的第二组规则（替换为";"）
+PATTERNS_XIN02_SEMICOLON = [
+    r'迟到\s*[\d.]*\s*分钟-?',
+    r'早退\s*[\d.]*\s*分钟-?',
+    r'旷工\s*[\d.]*\s*分钟-?',
+]
+
+
+def _literal_text(items):
+    """如果解析结果只由字面字符组成，返回对应的字符串，否则返回None"""
+    chars = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            chars.append(chr(av))
+        elif op is sre_parse.SUBPATTERN and not av[1] and not av[2]:
+            # 不带标志的分组，例如 (补卡)-，替换时等价于字面量
+            inner = _literal_text(av[3])
+            if inner is None:
+                return None
+            chars.append(inner)
+        else:
+            return None
+    return "".join(chars)
+
+
+def _literal_prefix(items):
+    """返回模式开头必须出现的字面前缀，用于快速跳过不可能匹配的文本"""
+    chars = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            chars.append(chr(av))
+        elif op is sre_parse.SUBPATTERN and not av[1] and not av[2]:
+            inner = _literal_text(av[3])
+            if inner is None:
+                chars.append(_literal_prefix(av[3]))
+                break
+            chars.append(inner)
+        else:
+            break
+    return "".join(chars)
+
+
+def _single_chars(op, av):
+    """返回单字符匹配项可匹配的字符集合，不是单字符字面量/字符集时返回None"""
+    if op is sre_parse.LITERAL:
+        return {chr(av)}
+    if op is sre_parse.IN:
+        chars = set()
+        for sub_op, sub_av in av:
+            if sub_op is not sre_parse.LITERAL:
+                return None
+            chars.add(chr(sub_av))
+        return chars
+    return None
+
+
+def _deleted_chars(items):
+    """
+    判断模式是否等价于"删除某个字符集合中的所有字符"，是则返回该集合
+
+    满足条件的模式（如 \\r\\n|\\r|\\n|\\t、 +）的每个分支都只由集合内的字符组成，
+    并且集合内每个字符都能被单独匹配，因此替换为空时恰好删除这些字符。
+    """
+    if len(items) == 1 and items[0][0] is sre_parse.BRANCH:
+        branches = items[0][1][1]
+    else:
+        branches = [items]
+
+    used = set()
+    single = set()
+    for branch in branches:
+        if not branch:
+            return None
+        for op, av in branch:
+            if op is sre_parse.MAX_REPEAT or op is sre_parse.MIN_REPEAT:
+                low, _, sub = av
+                if low < 1 or len(sub) != 1:
+                    return None
+                chars = _single_chars(*sub[0])
+                if chars is None:
+                    return None
+                used |= chars
+                if len(branch) == 1:
+                    single |= chars
+                continue
+            chars = _single_chars(op, av)
+            if chars is None:
+                return None
+            used |= chars
+            if len(branch) == 1:
+                single |= chars
+    if used != single:
+        return None
+    return used
+
+
+class _LiteralStep:
+    """字面量规则：使用 str.replace，文本中不含该字面量时直接跳过"""
+
+    def __init__(self, pattern, literal, repl):
+        self.patterns = [pattern]
+        self.literal = literal
+        self.repl = repl
+
+    def apply(self, text):
+        if self.literal not in text:
+            return text
+        return text.replace(self.literal, self.repl)
+
+    def matched_patterns(self, text):
+        return self.patterns if self.literal in text else []
+
+    def trigger_chars(self):
+        return {self.literal[0]}
+
+
+class _DeleteCharsStep:
+    """字符集删除规则：相邻的多条规则合并为一次 str.translate"""
+
+    def __init__(self, pattern, chars):
+        self.patterns = [pattern]
+        self.chars = set(chars)
+        # 合并后仍记录每条规则各自的字符集合，用于统计规则命中
+        self.pattern_chars = [(pattern, frozenset(chars))]
+        self._build()
+
+    def _build(self):
+        self.table = {ord(ch): None for ch in self.chars}
+        self.trigger = re.compile("[" + "".join(re.escape(ch) for ch in sorted(self.chars)) + "]")
+
+    def merge(self, other):
+        self.patterns.extend(other.patterns)
+        self.pattern_chars.extend(other.pattern_chars)
+        self.chars |= other.chars
+        self._build()
+
+    def apply(self, text):
+        if self.trigger.search(text) is None:
+            return text
+        return text.translate(self.table)
+
+    def matched_patterns(self, text):
+        present = set(text) & self.chars
+        return [pattern for pattern, chars in self.pattern_chars if chars & present]
+
+    def trigger_chars(self):
+        return set(self.chars)
+
+
+class _RegexStep:
+    """普通正则规则：预编译，并在缺少字面前缀时跳过"""
+
+    def __init__(self, pattern, regex, prefix, repl):
+        self.patterns = [pattern]
+        self.regex = regex
+        self.prefix = prefix
+        self.repl = repl
+
+    def apply(self, text):
+        if self.prefix and self.prefix not in text:
+            return text
+        return self.regex.sub(self.repl, text)
+
+    def matched_patterns(self, text):
+        return self.patterns if self.regex.search(text) else []
+
+    def trigger_chars(self):
+        # 没有字面前缀时无法确定必须出现的字符
+        return {self.prefix[0]} if self.prefix else None
+
+
+class RuleSet:
+    """
+    按顺序执行的替换规则集合，创建时一次性编译为优化后的执行步骤：
+
+    1. 纯字面量规则（如 正常-、——）改用 str.replace，不含该字面量时直接跳过
+    2. 等价于"删除某些字符"的规则（如 \\r\\n|\\r|\\n|\\t 和 空格）合并为一次 str.translate
+    3. 其余规则预编译，并用开头的字面前缀（如 缺卡(、迟到）快速排除不可能匹配的文本
+
+    此外，每个执行步骤都有匹配时必须出现的"触发字符"（字面量和字面前缀的首字符、
+    被删除的字符），所有步骤的触发字符合起来编译为一个字符集正则（trigger）。
+    文本中一个触发字符都没有时（如数字、nan、08:59、休息），任何步骤都不会匹配，
+    文本原样返回（不做strip），因此只需一次查找就可以跳过全部规则，结果与逐条执行一致。
+    含有触发字符的文本仍逐条执行，如 正常、正常（未排班）（正 是 正常- 的触发字符）
+    和日期（str()后含 - 和空格）。
+
+    只有相邻且都属于第2类的规则会被合并：一般的规则逐条替换时，前一条删除内容后
+    可能拼出后一条的新匹配（如 "—--—" 先删 -- 后得到 ——），合并成一个分支
+    正则会改变结果，因此其余规则保持逐条执行的顺序语义。
+
+    参数:
+        patterns: 按优先级排序的正则表达式列表
+        repl: 替换成的文本，默认为空
+        name: 规则集名称，用于规则命中统计
+    """
+
+    def __init__(self, patterns, repl='', name=None):
+        self.patterns = list(patterns)
+        self.repl = repl
+        self.name = name or f"RuleSet@{id(self):x}"
+        self.steps = []
+        for pattern in self.patterns:
+            self._add(pattern)
+        self.trigger_chars = _union_chars(step.trigger_chars() for step in self.steps)
+        self.trigger = _char_class(self.trigger_chars)
+
+    def _add(self, pattern):
+        items = list(sre_parse.parse(pattern).data)
+        plain_repl = '\\' not in self.repl
+
+        literal = _literal_text(items) if plain_repl else None
+        if literal:
+            self.steps.append(_LiteralStep(pattern, literal, self.repl))
+            return
+
+        chars = _deleted_chars(items) if self.repl == '' else None
+        if chars:
+            step = _DeleteCharsStep(pattern, chars)
+            if self.steps and isinstance(self.steps[-1], _DeleteCharsStep):
+                self.steps[-1].merge(step)
+            else:
+                self.steps.append(step)
+            return
+
+        self.steps.append(_RegexStep(pattern, re.compile(pattern), _literal_prefix(items), self.repl))
+
+    def apply(self, text, hits=None):
+        """
+        按顺序对文本应用所有规则
+
+        参数:
+            hits: 规则命中统计（见instrument.RuleHits），传入时记录每条规则是否匹配，
+                  会比不统计时慢，只在需要运行报告时使用
+        """
+        if self.trigger is not None and self.trigger.search(text) is None:
+            return text
+
+        if hits is None:
+            for step in self.steps:
+                text = step.apply(text)
+            return text
+
+        for step in self.steps:
+            for pattern in step.matched_patterns(text):
+                hits.add(self, pattern)
+            text = step.apply(text)
+        return text
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __repr__(self):
+        return f"RuleSet({len(self.patterns)} 条规则, {len(self.steps)} 个执行步骤, repl={self.repl!r})"
+
+
+def _union_chars(char_sets):
+    """合并各步骤的触发字符，任一步骤无法确定时返回None（不做预判）"""
+    chars = set()
+    for step_chars in char_sets:
+        if step_chars is None:
+            return None
+        chars |= step_chars
+    return chars
+
+
+def _char_class(chars):
+    if not chars:
+        return None
+    return re.compile("[" + "".join(re.escape(ch) for ch in sorted(chars)) + "]")
+
+
+class TriggerFilter:
+    """
+    多个规则集（如融合模式的新01+新02）的合并预判：文本中没有任何触发字符时，
+    这些规则集都不会改变文本，只剩去除首尾空白，用于统计跳过的单元格数
+
+    参数:
+        rulesets: 依次应用的规则集
+    """
+
+    def __init__(self, *rulesets):
+        self.rulesets = rulesets
+        self.chars = _union_chars(ruleset.trigger_chars for ruleset in rulesets)
+        self.regex = _char_class(self.chars)
+
+    def needs(self, text):
+        """文本是否可能被规则改变"""
+        return self.regex is None or self.regex.search(text) is not None
+
+    def mask(self, texts):
+        """对一组文本批量判断，返回布尔数组（True表示需要执行规则）"""
+        if self.regex is None:
+            return np.ones(len(texts), dtype=bool)
+        return pd.Series(texts, dtype=object).str.contains(self.regex, na=False).to_numpy(dtype=bool)
+
+
+# 规则集版本：任何规则变化都会改变该值，用于结果缓存的键
+RULES_VERSION = hashlib.sha256(repr([
+    PATTERNS_0, PATTERNS_1, PATTERNS_XIN01, PATTERNS_XIN02, PATTERNS_XIN02_SEMICOLON,
+]).encode("utf-8")).hexdigest()[:12]
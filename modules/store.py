@@ -0,0 +1,133 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+# 结果缓存默认上限：总大小和最长保存时间
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+# 后台清理的间隔（秒）
+DEFAULT_EVICT_INTERVAL = 600
+
+
+def content_key(*payloads, salt=""):
+    """
+    计算按内容寻址的键：各段内容哈希后再与salt（版本号、处理选项等）一起哈希
+
+    参数:
+        payloads: 文件内容（bytes或memoryview），顺序有意义
+        salt: 内容之外会影响结果的信息，变化时键随之变化
+    """
+    digest = hashlib.sha256()
+    for payload in payloads:
+        digest.update(hashlib.sha256(payload).digest())
+    digest.update(f"|{salt}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultStore:
+    """
+    按内容寻址的结果文件仓库：文件名即缓存键，保存在磁盘上，应用重启后仍然有效
+
+    读取命中时更新文件修改时间，清理时先删除超过 max_age 的文件，
+    再按修改时间从旧到新删除，直到总大小不超过 max_bytes（即按大小限制的LRU）。
+
+    参数:
+        root: 仓库目录
+        max_bytes: 总大小上限
+        max_age: 最长保存时间（秒）
+        suffix: 结果文件扩展名
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, suffix=".xlsx"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.root, key + self.suffix)
+
+    def get(self, key):
+        """返回缓存结果的路径，未命中返回None；命中时刷新LRU时间"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, source_path):
+        """把处理结果复制进仓库（先写临时文件再原子替换），返回仓库中的路径"""
+        path = self.path_for(key)
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def put_bytes(self, key, data):
+        """把内存中的内容写入仓库（先写临时文件再原子替换），返回仓库中的路径"""
+        path = self.path_for(key)
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def evict(self):
+        """
+        清理过期文件，并按LRU把总大小控制在上限以内
+
+        返回:
+            删除的文件数量
+        """
+        with self._lock:
+            now = time.time()
+            entries = []
+            removed = 0
+            for entry in os.scandir(self.root):
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                # 残留的临时文件超过1小时视为写入失败
+                is_stale_tmp = entry.name.endswith(".tmp") and now - stat.st_mtime > 3600
+                if is_stale_tmp or now - stat.st_mtime > self.max_age:
+                    removed += _remove(entry.path)
+                elif not entry.name.endswith(".tmp"):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                removed += _remove(path)
+                total -= size
+            return removed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+def run_periodically(func, interval=DEFAULT_EVICT_INTERVAL, name="result-store-evict"):
+    """在后台守护线程中定期执行func（如缓存清理），异常只打印不中断"""
+    def loop():
+        while True:
+            try:
+                func()
+            except Exception as e:
+                print(f"后台清理出错: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name=name, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,166 @@
+import datetime
+import re
+
+import pandas as pd
+
+
+# pandas读取Excel时默认视为缺失值的文本（与 pandas 默认的 na_values 一致）
+NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null',
+}
+
+# 流式处理时每批转换为DataFrame的行数，决定峰值内存，与总行数无关
+CHUNK_ROWS = 2000
+
+_NUMBER_TEXT = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+_INT_TEXT = re.compile(r'^[+-]?\d+$')
+
+
+def is_missing(value):
+    """判断单元格在pandas中是否会被读成缺失值"""
+    return value is None or (isinstance(value, str) and value in NA_VALUES)
+
+
+def normalize_cell(value):
+    """与pandas读取openpyxl单元格一致：整数值的浮点数转换为int"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class _ColumnKind:
+    """第一遍扫描时记录某一列的取值类型，用于还原pandas按整列推断出的类型"""
+
+    def __init__(self):
+        self.has_missing = False
+        self.seen = 0
+        self.count = 0
+        self.all_datetime = True
+        self.all_bool = True
+        self.all_numeric = True
+        self.all_int = True
+
+    def add(self, value):
+        self.seen += 1
+        if is_missing(value):
+            self.has_missing = True
+            return
+        self.count += 1
+        if not isinstance(value, datetime.datetime):
+            self.all_datetime = False
+        if not isinstance(value, bool):
+            self.all_bool = False
+        if isinstance(value, bool):
+            self.all_int = False
+        elif isinstance(value, int):
+            pass
+        elif isinstance(value, float):
+            self.all_int = False
+        elif isinstance(value, str) and _NUMBER_TEXT.match(value):
+            if not _INT_TEXT.match(value):
+                self.all_int = False
+        else:
+            self.all_numeric = False
+            self.all_int = False
+
+    def resolve(self):
+        """返回该列在pandas中的类型：datetime / bool / int / float / object"""
+        if self.count == 0:
+            return 'float'
+        if self.all_datetime:
+            return 'datetime'
+        if self.all_bool and not self.has_missing:
+            return 'bool'
+        if self.all_numeric:
+            return 'int' if self.all_int and not self.has_missing else 'float'
+        return 'object'
+
+
+def convert_value(value, kind):
+    """把单元格的值转换为pandas整表读取后同一位置的值"""
+    if is_missing(value):
+        return pd.NaT if kind == 'datetime' else float('nan')
+    if kind == 'int':
+        return int(value)
+    if kind == 'float':
+        return float(value)
+    return value
+
+
+def probe_sheet(ws, columns_from, first_column=0, extra_columns=()):
+    """
+    第一遍扫描工作表（只读模式，不保留数据）
+
+    参数:
+        ws: 只读模式打开的工作表
+        columns_from: 需要保留的数据列起点，first_column（姓名列）和该列之后的列会记录类型
+        extra_columns: 另外需要读取的列（如第二匹配键列），同样记录类型
+
+    返回:
+        (有效行数, 列数, {列序号: 类型})，行数和列数与pandas整表读取后的形状一致
+    """
+    row_count = 0
+    width = 0
+    kinds = {}
+    for row_number, row in enumerate(ws.iter_rows(values_only=True)):
+        row = [normalize_cell(value) for value in row]
+        while row and (row[-1] is None or row[-1] == ""):
+            row.pop()
+        if not row:
+            continue
+        row_count = row_number + 1
+        width = max(width, len(row))
+        for index, value in enumerate(row):
+            if index == first_column or index >= columns_from or index in extra_columns:
+                kinds.setdefault(index, _ColumnKind()).add(value)
+
+    result = {}
+    for index in [first_column] + list(range(columns_from, width)) + list(extra_columns):
+        kind = kinds.get(index)
+        if kind is None:
+            kind = _ColumnKind()
+        # 行长度不足（含中间的空行）时，pandas会补成空值
+        if kind.seen < row_count:
+            kind.has_missing = True
+        result[index] = kind.resolve()
+    return row_count, width, result
+
+
+def head_rows(ws, rows):
+    """读取开头rows行的值（用于识别表头布局）"""
+    return [list(row) for row in ws.iter_rows(max_row=rows, values_only=True)]
+
+
+def iter_row_chunks(ws, columns, kinds, skip_rows, row_count, chunk_rows=CHUNK_ROWS):
+    """
+    第二遍扫描：跳过前skip_rows行，只取columns中的列，按chunk_rows行一批返回
+
+    每一批是按pandas类型转换后的行列表，调用方处理完即可丢弃
+    """
+    chunk = []
+    for row_number, row in enumerate(ws.iter_rows(values_only=True)):
+        if row_number >= row_count:
+            break
+        if row_number < skip_rows:
+            continue
+        values = []
+        for index in columns:
+            value = normalize_cell(row[index]) if index < len(row) else None
+            values.append(convert_value(value, kinds[index]))
+        chunk.append(values)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def excel_value(value):
+    """与 DataFrame.to_excel 一致：缺失值写为空字符串"""
+    if value is None or value is pd.NaT:
+        return ''
+    if isinstance(value, float) and value != value:
+        return ''
+    return value
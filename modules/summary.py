@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from writers import open_writer
+
+
+# 考勤异常事件：迟到/早退/旷工 N分钟（与新02中替换掉的写法相同，分钟数可以省略或为小数）
+EVENT_PATTERN = r'(?P<kind>迟到|早退|旷工)\s*(?P<minutes>[\d.]*)\s*分钟'
+EVENT_KINDS = ["迟到", "早退", "旷工"]
+# 缺卡按出现次数统计（如 缺卡(08:30); 缺卡(18:00) 为两次）
+MISSING_PATTERN = '缺卡'
+
+# 汇总表的列：身份列 + 每类事件的次数和分钟数 + 缺卡次数
+ID_COLUMNS = ["姓名", "员工ID", "部门"]
+METRIC_COLUMNS = [f"{kind}{unit}" for kind in EVENT_KINDS for unit in ("次数", "分钟")] + ["缺卡次数"]
+SUMMARY_SUFFIX = "_异常汇总"
+
+
+def extract_metrics(texts):
+    """
+    从一组不同的单元格文本中提取异常统计（向量化的 str.extractall / str.count）
+
+    参数:
+        texts: 一维文本数组（object），通常是去重后的取值
+
+    返回:
+        len(texts) × len(METRIC_COLUMNS) 的数组（float）
+    """
+    series = pd.Series(texts, dtype=object).fillna("")
+    metrics = np.zeros((len(series), len(METRIC_COLUMNS)))
+    if not len(series):
+        return metrics
+
+    events = series.str.extractall(EVENT_PATTERN)
+    if len(events):
+        rows = events.index.get_level_values(0).to_numpy()
+        # "迟到 分钟" 这类没有分钟数的写法计一次，分钟数按0计
+        minutes = pd.to_numeric(events["minutes"], errors="coerce").fillna(0).to_numpy()
+        kinds = events["kind"].to_numpy()
+        for index, kind in enumerate(EVENT_KINDS):
+            selected = kinds == kind
+            np.add.at(metrics[:, 2 * index], rows[selected], 1)
+            np.add.at(metrics[:, 2 * index + 1], rows[selected], minutes[selected])
+    metrics[:, -1] = series.str.count(MISSING_PATTERN).to_numpy()
+    return metrics
+
+
+def column_metrics(texts):
+    """
+    统计每个单元格的异常：先按文本去重（factorize），每个不同取值只解析一次，再按编码映射回单元格
+
+    参数:
+        texts: 行数 × 列数 的文本数组（object）
+
+    返回:
+        行数 × 列数 × len(METRIC_COLUMNS) 的数组
+    """
+    if texts.size == 0:
+        return np.zeros((texts.shape[0], texts.shape[1], len(METRIC_COLUMNS)))
+    codes, uniques = pd.factorize(texts.ravel())
+    per_value = extract_metrics(uniques)
+    return per_value[codes].reshape(texts.shape[0], texts.shape[1], -1)
+
+
+def summarize_texts(texts):
+    """统计每一行的异常（各列之和），返回 行数 × len(METRIC_COLUMNS) 的数组"""
+    return column_metrics(texts).sum(axis=1)
+
+
+class ExceptionSummary:
+    """
+    按员工汇总每个工作表（月份）的考勤异常：迟到/早退/旷工的次数和分钟数、缺卡次数
+
+    在清洗的同一遍中对原始文本调用 add（清洗会删除这些内容），可多次调用（流式模式按批），
+    同一工作表中同名同ID的行合并为一行。
+    """
+
+    def __init__(self):
+        # {工作表名: [每批的汇总DataFrame]}
+        self.sheets = {}
+
+    def add(self, sheet_name, df, texts):
+        """
+        参数:
+            sheet_name: 工作表名称
+            df: 已填充员工ID、部门的DataFrame（只使用身份列）
+            texts: 与df的行对应的 行数 × 日期列数 文本数组（清洗前）
+        """
+        self.add_metrics(sheet_name, df, summarize_texts(texts))
+
+    def add_metrics(self, sheet_name, df, metrics):
+        """加入已经统计好的每行异常（行数 × len(METRIC_COLUMNS)，如增量处理时沿用的各列统计之和）"""
+        frame = df[ID_COLUMNS].reset_index(drop=True)
+        frame = pd.concat([frame, pd.DataFrame(metrics, columns=METRIC_COLUMNS)], axis=1)
+        self.sheets.setdefault(sheet_name, []).append(frame)
+
+    def merge(self, other):
+        """合并子进程中得到的汇总（按工作表并行时）"""
+        for sheet_name, frames in other.sheets.items():
+            self.sheets.setdefault(sheet_name, []).extend(frames)
+
+    def frame(self, sheet_name):
+        """一个工作表的员工汇总（按首次出现的顺序）"""
+        result = pd.concat(self.sheets[sheet_name], ignore_index=True)
+        result = result.groupby(ID_COLUMNS, sort=False, dropna=False, as_index=False)[METRIC_COLUMNS].sum()
+        counts = [column for column in METRIC_COLUMNS if column.endswith("次数")]
+        result[counts] = result[counts].astype(int)
+        return result
+
+    def write(self, output_file, output_format):
+        """每个工作表写为汇总文件中的同名工作表（没有可汇总的工作表时写出一个空表）"""
+        with open_writer(output_file, output_format) as writer:
+            for sheet_name in self.sheets:
+                writer.write_frame(sheet_name, self.frame(sheet_name))
+            if not self.sheets:
+                writer.write_frame("异常汇总", pd.DataFrame(columns=ID_COLUMNS + METRIC_COLUMNS))
+        return output_file
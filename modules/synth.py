@@ -0,0 +1,193 @@
+import datetime
+import os
+import random
+
+from openpyxl import Workbook
+
+
+# 两种钉钉月报布局：每日打卡结果之前的汇总列数
+LAYOUTS = {
+    "current": 46,  # 新01.py / 新02.py 处理的格式（保留第47列及以后）
+    "legacy": 26,   # 0.py / 1.py 处理的格式（保留第27列及以后）
+}
+
+WEEKDAYS = "一二三四五六日"
+
+# 工作日单次打卡结果及其权重
+PUNCH_RESULTS = [
+    ("正常", 60),
+    ("缺卡", 6),
+    ("迟到 {late}分钟", 6),
+    ("早退 {early}分钟", 3),
+    ("正常(补卡)", 3),
+    ("补卡", 2),
+    ("正常(管理员校准)", 2),
+    ("正常(管理员校准、补卡)", 1),
+    ("旷工 {absent}分钟", 1),
+]
+
+# 整天的特殊结果及其权重（其余情况为上下班两次打卡）
+DAY_RESULTS = [
+    ("正常（未排班）", 3),
+    ("正常(休息)", 2),
+    ("正常（休息）", 1),
+    ("缺卡(上班卡);缺卡(下班卡);", 2),
+    ("补卡申请（{approval}）", 2),
+    ("旷工 {absent}分钟;", 1),
+]
+
+APPROVALS = ["已通过", "审批中", "已撤销"]
+PLACES = ["公司", "客户现场", "仓库"]
+
+# 汇总列的表头（不足时用“统计项N”补齐）
+SUMMARY_HEADERS = [
+    "考勤组", "部门", "工号", "职位", "UserId", "出勤天数", "休息天数", "工作时长(分钟)",
+    "迟到次数", "迟到时长(分钟)", "严重迟到次数", "严重迟到时长(分钟)", "旷工迟到天数",
+    "早退次数", "早退时长(分钟)", "上班缺卡次数", "下班缺卡次数", "旷工天数",
+    "出差时长", "外出时长", "加班总时长", "工作日加班", "休息日加班", "节假日加班",
+]
+
+
+def _weighted(rng, choices):
+    items, weights = zip(*choices)
+    return rng.choices(items, weights=weights)[0]
+
+
+def _fill(rng, template):
+    return template.format(
+        late=rng.randint(1, 90),
+        early=rng.choice([1, 5, 10, 30, 45.5]),
+        absent=rng.choice([240, 480]),
+        approval=rng.choice(APPROVALS),
+    )
+
+
+def day_value(rng, weekend):
+    """生成一个每日打卡结果单元格，格式与钉钉导出的月报一致"""
+    if weekend:
+        r = rng.random()
+        if r < 0.8:
+            return "休息"
+        if r < 0.9:
+            return None
+    if rng.random() < 0.15:
+        value = _fill(rng, _weighted(rng, DAY_RESULTS))
+    else:
+        # 上下班两次打卡，用“-”连接，异常项后带“;”
+        first = _fill(rng, _weighted(rng, PUNCH_RESULTS))
+        second = _fill(rng, _weighted(rng, PUNCH_RESULTS))
+        value = f"{first}-{second}"
+        value = value.replace("缺卡-", "缺卡(上班卡);")
+        if rng.random() < 0.5:
+            value = value.replace("分钟-", "分钟-;", 1)
+    if rng.random() < 0.05:
+        value = f"地点异常 {rng.choice(PLACES)};" + value
+    if rng.random() < 0.05:
+        value = value.replace("-", "-\n", 1)
+    if rng.random() < 0.02:
+        value = value + " "
+    return value
+
+
+def employee_names(count):
+    return [f"员工{index:05d}" for index in range(count)]
+
+
+def generate_report(path, employees=200, days=31, sheets=1, layout="current", seed=0,
+                    month=datetime.date(2024, 7, 1), cell_value=day_value):
+    """
+    生成钉钉格式的合成月报：前四行为标题、生成时间、表头和星期，
+    之后每名员工一行，第一列为姓名，接着是汇总列和每日打卡结果列
+
+    参数:
+        path: 输出文件路径
+        employees: 每个工作表的员工数
+        days: 每日打卡结果的列数
+        sheets: 工作表数量
+        layout: "current"（46列汇总）或 "legacy"（26列汇总）
+        seed: 随机数种子，相同参数和种子生成的文件内容相同
+        cell_value: 生成每日打卡结果单元格的函数 (rng, 是否周末) -> 值，默认为 day_value
+    """
+    rng = random.Random(seed)
+    leading = LAYOUTS[layout]
+    names = employee_names(employees)
+    dates = [month + datetime.timedelta(days=offset) for offset in range(days)]
+    summary_headers = (SUMMARY_HEADERS + [f"统计项{index}" for index in range(leading)])[:leading - 1]
+
+    wb = Workbook(write_only=True)
+    for sheet_index in range(sheets):
+        ws = wb.create_sheet(f"{month.month}月" if sheets == 1 else f"{month.month}月_{sheet_index + 1}")
+        ws.append([f"考勤统计报表 统计日期：{dates[0]} 至 {dates[-1]}"])
+        ws.append([f"报表生成时间：{month:%Y-%m-%d} 09:00"])
+        ws.append(["姓名"] + summary_headers + [date.day for date in dates])
+        ws.append([None] * leading + [WEEKDAYS[date.weekday()] for date in dates])
+        for name in names:
+            summary = [f"第{rng.randint(1, 9)}组", f"部门{rng.randint(1, 20)}", rng.randint(10000, 99999)]
+            summary += [rng.randint(0, 30) for _ in range(leading - 1 - len(summary))]
+            ws.append([name] + summary + [cell_value(rng, date.weekday() >= 5) for date in dates])
+    wb.save(path)
+    return path
+
+
+def generate_employee_file(path, employees=200, missing=0.02, duplicates=2, month_column=None, seed=0):
+    """
+    生成与合成月报配套的员工信息文件（姓名、员工ID、部门，可选月份班次列）
+
+    参数:
+        path: 输出文件路径
+        employees: 月报中的员工数
+        missing: 不在员工信息中的员工比例（用于模拟匹配失败）
+        duplicates: 重名记录数
+        month_column: 班次列名（如 "班次"），legacy 布局的 0.py 需要
+        seed: 随机数种子
+    """
+    rng = random.Random(seed + 1)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("员工信息")
+    headers = ["姓名", "员工ID", "部门"] + ([month_column] if month_column else [])
+    ws.append(headers)
+    names = employee_names(employees)
+    for index, name in enumerate(names):
+        if rng.random() < missing:
+            continue
+        row = [name, 100000 + index, f"部门{rng.randint(1, 20)}"]
+        if month_column:
+            row.append(rng.choice(["早班", "晚班", "弹性"]))
+        ws.append(row)
+    for name in rng.sample(names, min(duplicates, len(names))):
+        row = [name, 900000 + rng.randint(0, 99999), "重名部门"]
+        if month_column:
+            row.append("早班")
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def generate_pair(output_dir, employees=200, days=31, sheets=1, layout="current", seed=0):
+    """生成一对月报和员工信息文件，返回 (月报路径, 员工信息路径)"""
+    os.makedirs(output_dir, exist_ok=True)
+    tag = f"{layout}_{employees}x{days}x{sheets}_s{seed}"
+    report = generate_report(os.path.join(output_dir, f"月报_{tag}.xlsx"), employees, days, sheets, layout, seed)
+    employee_file = generate_employee_file(
+        os.path.join(output_dir, f"员工信息_{tag}.xlsx"), employees,
+        month_column="班次" if layout == "legacy" else None, seed=seed,
+    )
+    return report, employee_file
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成钉钉格式的合成月报和员工信息文件")
+    parser.add_argument("output_dir", help="输出目录")
+    parser.add_argument("--employees", type=int, default=200, help="每个工作表的员工数，默认200")
+    parser.add_argument("--days", type=int, default=31, help="每日打卡结果列数，默认31")
+    parser.add_argument("--sheets", type=int, default=1, help="工作表数量，默认1")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="current", help="月报布局，默认current")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    args = parser.parse_args()
+
+    report, employee_file = generate_pair(args.output_dir, args.employees, args.days, args.sheets,
+                                          args.layout, args.seed)
+    print(f"已生成月报: {report}")
+    print(f"已生成员工信息: {employee_file}")
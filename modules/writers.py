@@ -0,0 +1,265 @@
+import csv
+import io
+import os
+import zipfile
+
+import pandas as pd
+from openpyxl import Workbook
+
+from streaming import excel_value
+
+
+# 输出格式 → (扩展名, 说明)
+OUTPUT_FORMATS = {
+    "xlsx": (".xlsx", "Excel（默认，保留表头样式）"),
+    "xlsx-fast": (".xlsx", "Excel快速写出（逐行写出，只含单元格的值）"),
+    "csv": (".zip", "CSV（每个工作表一个文件，打包为zip）"),
+    "parquet": (".parquet", "Parquet（单个文件，sheet列为工作表名，需要pyarrow）"),
+}
+DEFAULT_FORMAT = "xlsx"
+
+MIME_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".zip": "application/zip",
+    ".parquet": "application/vnd.apache.parquet",
+}
+
+
+def output_suffix(output_format):
+    """输出格式对应的文件扩展名"""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选 {', '.join(OUTPUT_FORMATS)}")
+    return OUTPUT_FORMATS[output_format][0]
+
+
+def require_pyarrow():
+    """输出Parquet需要pyarrow，未安装时给出明确的提示"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("输出Parquet格式需要安装pyarrow：pip install pyarrow")
+
+
+# 需要额外依赖的输出格式 → 检查依赖的函数
+FORMAT_REQUIREMENTS = {
+    "parquet": require_pyarrow,
+}
+
+
+def check_output_format(output_format):
+    """确认输出格式受支持且所需的依赖已安装（在开始处理之前调用），否则抛出ValueError或ImportError"""
+    output_suffix(output_format)
+    requirement = FORMAT_REQUIREMENTS.get(output_format)
+    if requirement is not None:
+        requirement()
+
+
+def available_formats():
+    """当前环境可以使用的输出格式（所需依赖未安装的格式不在其中）"""
+    formats = {}
+    for name, value in OUTPUT_FORMATS.items():
+        try:
+            check_output_format(name)
+        except ImportError:
+            continue
+        formats[name] = value
+    return formats
+
+
+def output_name(output_file):
+    """输出位置的描述（用于提示信息），写入内存时没有文件路径"""
+    return output_file if isinstance(output_file, (str, os.PathLike)) else "内存"
+
+
+def with_suffix(path, output_format):
+    """把输出路径的扩展名改为输出格式对应的扩展名"""
+    return os.path.splitext(path)[0] + output_suffix(output_format)
+
+
+class OutputWriter:
+    """
+    按工作表写出处理结果，用法与 pd.ExcelWriter 类似：
+
+        with open_writer(path, "csv") as writer:
+            writer.write_frame("7月", df)            # 整表写出
+            sheet = writer.add_sheet("8月", header)  # 或逐行写出
+            sheet.append(row)
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+
+    def add_sheet(self, sheet_name, header=None, sheet_state="visible"):
+        raise NotImplementedError
+
+    def write_frame(self, sheet_name, df):
+        sheet = self.add_sheet(sheet_name, list(df.columns))
+        for row in df.itertuples(index=False, name=None):
+            sheet.append([excel_value(value) for value in row])
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ExcelOutputWriter(OutputWriter):
+    """默认写出方式：pd.ExcelWriter（openpyxl），表头带样式，整个工作簿在内存中"""
+
+    def __init__(self, output_file):
+        super().__init__(output_file)
+        self._writer = pd.ExcelWriter(output_file, engine='openpyxl')
+
+    def write_frame(self, sheet_name, df):
+        df.to_excel(self._writer, sheet_name=sheet_name, index=False)
+
+    def add_sheet(self, sheet_name, header=None, sheet_state="visible"):
+        ws = self._writer.book.create_sheet(sheet_name)
+        ws.sheet_state = sheet_state
+        if header is not None:
+            ws.append(header)
+        return ws
+
+    def close(self):
+        self._writer.close()
+
+
+class FastExcelOutputWriter(OutputWriter):
+    """
+    快速写出：openpyxl 只写模式，行写出后即可释放，内存占用与行数无关；
+    所有工作表共用工作簿级别的共享字符串表，重复的考勤文本只保存一次
+    """
+
+    def __init__(self, output_file):
+        super().__init__(output_file)
+        self._wb = Workbook(write_only=True)
+
+    def add_sheet(self, sheet_name, header=None, sheet_state="visible"):
+        ws = self._wb.create_sheet(sheet_name)
+        ws.sheet_state = sheet_state
+        if header is not None:
+            ws.append(header)
+        return ws
+
+    def close(self):
+        if self._wb is not None:
+            self._wb.save(self.output_file)
+            self._wb = None
+
+
+class _CsvSheet:
+    def __init__(self, handle):
+        self._handle = handle
+        self._writer = csv.writer(handle)
+
+    def append(self, row):
+        self._writer.writerow(["" if value is None else value for value in row])
+
+    def close(self):
+        self._handle.close()
+
+
+class CsvOutputWriter(OutputWriter):
+    """每个工作表写为一个CSV（utf-8-sig，Excel可直接打开），逐行写入同一个zip文件"""
+
+    def __init__(self, output_file):
+        super().__init__(output_file)
+        self._zip = zipfile.ZipFile(output_file, "w", compression=zipfile.ZIP_DEFLATED)
+        self._sheet = None
+        self._names = set()
+
+    def add_sheet(self, sheet_name, header=None, sheet_state="visible"):
+        self._close_sheet()
+        name = f"{sheet_name}.csv"
+        if name in self._names:
+            raise ValueError(f"工作表名称重复: {sheet_name}")
+        self._names.add(name)
+        handle = io.TextIOWrapper(self._zip.open(name, "w"), encoding="utf-8-sig", newline="")
+        self._sheet = _CsvSheet(handle)
+        if header is not None:
+            self._sheet.append(header)
+        return self._sheet
+
+    def _close_sheet(self):
+        if self._sheet is not None:
+            self._sheet.close()
+            self._sheet = None
+
+    def close(self):
+        if self._zip is not None:
+            self._close_sheet()
+            self._zip.close()
+            self._zip = None
+
+
+def _parquet_value(value):
+    if value is None or value is pd.NaT or value == "":
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    return str(value)
+
+
+class _ParquetSheet:
+    def __init__(self, sheet_name, header):
+        self.sheet_name = sheet_name
+        self.header = header
+        self.rows = []
+        self.frame = None
+
+    def append(self, row):
+        self.rows.append(row)
+
+
+class ParquetOutputWriter(OutputWriter):
+    """
+    所有工作表写入同一个Parquet文件，第一列 sheet 为工作表名；
+    各工作表列数不同（天数不同）时按列名合并，所有值按文本保存，空单元格为null
+    """
+
+    def __init__(self, output_file):
+        require_pyarrow()
+        super().__init__(output_file)
+        self._sheets = []
+
+    def add_sheet(self, sheet_name, header=None, sheet_state="visible"):
+        if header is None:
+            raise ValueError("Parquet格式需要表头")
+        sheet = _ParquetSheet(sheet_name, [str(column) for column in header])
+        self._sheets.append(sheet)
+        return sheet
+
+    def write_frame(self, sheet_name, df):
+        # 表格已在内存中，直接保留，写出时再转换
+        self.add_sheet(sheet_name, list(df.columns)).frame = df
+
+    def close(self):
+        if self._sheets is None:
+            return
+        frames = []
+        for sheet in self._sheets:
+            frame = sheet.frame if sheet.frame is not None else pd.DataFrame(sheet.rows, columns=sheet.header)
+            frame = frame.set_axis(sheet.header, axis=1).map(_parquet_value)
+            frame.insert(0, "sheet", sheet.sheet_name)
+            frames.append(frame)
+        self._sheets = None
+        result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({"sheet": []})
+        result.to_parquet(self.output_file, index=False)
+
+
+_WRITERS = {
+    "xlsx": ExcelOutputWriter,
+    "xlsx-fast": FastExcelOutputWriter,
+    "csv": CsvOutputWriter,
+    "parquet": ParquetOutputWriter,
+}
+
+
+def open_writer(output_file, output_format=DEFAULT_FORMAT):
+    """按输出格式创建写出器（output_file 为文件路径或BytesIO，扩展名由调用方决定）"""
+    output_suffix(output_format)
+    return _WRITERS[output_format](output_file)
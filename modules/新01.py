@@ -1,149 +1,591 @@
+import numpy as np
 import pandas as pd
 import os
-import re
+from functools import lru_cache
+from openpyxl import load_workbook
 
+from employees import EmployeeDirectory, list_names
+from instrument import NULL_RECORDER, StageRecorder
+from layout import LAYOUT_PROBE_ROWS, default_layout, read_sheet, resolve_layout
+from preview import tee_writer
+from parallel import (
+    DEFAULT_CHUNK_ROWS, MIN_PARALLEL_BYTES, clean_text_blocks, create_pool, use_parallel,
+)
+from readers import (
+    as_source, csv_sheet_name, detect_format, probe_csv, read_csv_chunks, read_csv_head, require_xlrd, source_name,
+    source_size,
+)
+from options import RunOptions
+from profiles import CACHE_SIZE, DEFAULT_PROFILE, PROFILES, compile_profile
+from streaming import excel_value, head_rows, iter_row_chunks, probe_sheet
+from summary import ExceptionSummary
+from writers import open_writer, output_name
 
-def process_excel(input_file, schedule_file, output_file, month_column="部门"):
+
+# 默认处理配置的固定布局中第一个日期列的序号（保留第一列和第47列及以后），表头识别失败时使用
+DAY_START = PROFILES[DEFAULT_PROFILE].day_start
+
+
+def new_stats():
+    """处理统计：工作表数、数据行数、匹配到员工信息的行数、清洗的单元格数"""
+    return {"sheets": 0, "rows": 0, "matched": 0, "cells": 0}
+
+
+def add_stats(stats, sheets=0, rows=0, matched=0, cells=0):
+    """累加处理统计，stats为None时忽略"""
+    if stats is None:
+        return
+    stats["sheets"] += sheets
+    stats["rows"] += rows
+    stats["matched"] += matched
+    stats["cells"] += cells
+
+
+def load_employee_directory(schedule_file, profile=DEFAULT_PROFILE, sources=None):
+    """读取并校验员工信息文件，建立按姓名的索引（内容未变时从磁盘缓存加载），填充的列由处理配置决定"""
+    return compile_profile(profile).load_directory(schedule_file, sources)
+
+
+def id_columns(directory):
+    """姓名列和从员工信息中填充的列"""
+    return ["姓名"] + list(directory.fields)
+
+
+def insert_join_columns(df, directory):
+    """在姓名列之后依次插入需要填充的空白列（当前格式为员工ID、部门）"""
+    for index, field in enumerate(directory.fields, 1):
+        df.insert(index, field, "")
+
+
+def report_names(directory, names, sheet_name, log=print, recorder=NULL_RECORDER, key_values=None):
+    """提示工作表中未匹配到员工信息的姓名和匹配到重名员工的姓名（已按第二匹配键区分的除外），人数记入运行报告"""
+    unmatched, ambiguous = directory.check_names(names, key_values)
+    recorder.update_sheet(unmatched=len(unmatched), ambiguous=len(ambiguous))
+    if unmatched:
+        log(f"工作表 {sheet_name} 有 {len(unmatched)} 个姓名未匹配到员工信息: {list_names(unmatched)}")
+    if ambiguous:
+        log(f"工作表 {sheet_name} 有 {len(ambiguous)} 个姓名在员工信息中重名，已按最后一条记录匹配: "
+            f"{list_names(ambiguous)}")
+
+
+def clean_text_array(texts, clean, pool=None, block_size=DEFAULT_CHUNK_ROWS):
+    """
+    清洗一维文本数组：串行时先去重（factorize），每个不同取值只调用一次clean，
+    再按编码映射回原来的位置；数量足够多时按block_size个一块分给进程池
+
+    规则集在执行前先检查触发字符，没有触发字符的文本（数字、日期、nan、休息等）
+    不执行任何规则；这里按清洗函数的 prefilter（见profiles.Cleaner）统计这类单元格的数量。
+
+    返回:
+        (清洗结果数组, 不同取值个数, 跳过规则的单元格数)
+    """
+    prefilter = getattr(getattr(clean, "__wrapped__", clean), "prefilter", None)
+    codes = uniques = None
+    if use_parallel(pool, len(texts)):
+        result, distinct_count = clean_text_blocks(texts, clean, pool, block_size)
+    else:
+        codes, uniques = pd.factorize(texts)
+        cleaned = np.empty(len(uniques), dtype=object)
+        cleaned[:] = [clean(text) for text in uniques]
+        result, distinct_count = cleaned[codes], len(uniques)
+
+    skipped = 0
+    if prefilter is not None and len(texts):
+        if codes is None:
+            codes, uniques = pd.factorize(texts)
+        counts = np.bincount(codes, minlength=len(uniques))
+        skipped = int(counts[~prefilter.mask(uniques)].sum())
+    return result, distinct_count, skipped
+
+
+def clean_columns(df, columns, clean, pool=None, chunk_rows=DEFAULT_CHUNK_ROWS, recorder=NULL_RECORDER,
+                  sheet_name=None, summary=None):
+    """
+    按不同取值清洗指定列：先把所有单元格转为字符串并去重（factorize），
+    每个不同取值只调用一次clean，再按编码映射回原来的位置
+
+    参数:
+        df: 需要清洗的DataFrame（原地修改）
+        columns: 需要清洗的列
+        clean: 单个字符串的清洗函数
+        pool: 进程池；单元格足够多时按chunk_rows行一块分给子进程清洗
+        chunk_rows: 并行时每块的行数
+        recorder: 开启规则命中统计时，按不同取值及其出现次数统计
+        sheet_name: 工作表名称（异常汇总按工作表保存）
+        summary: 异常汇总（见summary.ExceptionSummary），清洗前从原始文本中提取
+                 迟到/早退/旷工分钟数和缺卡次数
+
+    返回:
+        (单元格总数, 清洗的不同取值个数)；跳过规则的单元格数记入 recorder 的 skipped
+    """
+    if not columns:
+        return 0, 0
+    values = df[columns].to_numpy(dtype=object).ravel()
+    # 先转换为字符串再去重，避免 1、1.0、True 这类相等的值被合并
+    texts = np.array([str(x) if x is not None else '' for x in values], dtype=object)
+    block_size = chunk_rows * len(columns)
+    if summary is not None:
+        summary.add(sheet_name, df, texts.reshape(len(df), len(columns)))
+    result, distinct_count, skipped = clean_text_array(texts, clean, pool, block_size)
+    df[columns] = result.reshape(len(df), len(columns))
+    recorder.update_sheet(skipped=skipped)
+
+    if recorder.hits is not None:
+        codes, uniques = pd.factorize(texts)
+        # 流式模式下clean带有lru_cache，统计时使用未缓存的原函数
+        recorder.count_rules(getattr(clean, "__wrapped__", clean), uniques,
+                             np.bincount(codes, minlength=len(uniques)))
+    return len(texts), distinct_count
+
+
+def process_sheet(df, sheet_name, directory, clean, log=print, pool=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                  stats=None, recorder=NULL_RECORDER, summary=None, layout=None, min_day_columns=0, reuse=None):
+    """
+    处理单个工作表：删除表头行、保留姓名列和日期列、匹配员工信息并清洗
+    （固定布局为删除前四行、保留第一列和第47列及以后）
+
+    参数:
+        df: 不设表头读取的工作表数据（列名为列序号，可以只包含布局需要的列）
+        sheet_name: 工作表名称（用于输出信息）
+        directory: 员工信息索引
+        clean: 单个字符串的清洗函数
+        log: 输出处理信息的函数
+        pool: 进程池，传给clean_columns
+        stats: 处理统计字典（见new_stats），处理成功时累加
+        recorder: 阶段计时记录器（见instrument.StageRecorder）
+        summary: 异常汇总，传给clean_columns
+        layout: 工作表布局（见layout.SheetLayout），默认为固定布局
+        min_day_columns: 至少需要的日期列数（见profiles.Profile），不足时跳过该工作表
+        reuse: {日期列的输出列名: 上次的清洗结果}，这些列不再清洗（增量处理，见incremental.IncrementalState.reuse）
+
+    返回:
+        处理后的DataFrame；行数或列数不足时返回None
+    """
+    layout = layout or default_layout(DAY_START)
+
+    # 删除表头行（固定布局为前四行）
+    if len(df) <= layout.data_start:
+        log(f"工作表 {sheet_name} 行数不足，已跳过")
+        return None
+    df = df[layout.data_start:].reset_index(drop=True)
+    # 第二匹配键列（如 工号）只用于匹配，不输出
+    key_values = df.pop(layout.key_column) if layout.key_column in df.columns else None
+
+    # 保留姓名列和日期列（固定布局为第一列和第47列及以后）
+    if df.columns[-1] + 1 < layout.day_start + min_day_columns:
+        log(f"工作表 {sheet_name} 列数不足{layout.day_start + min_day_columns}列，已跳过")
+        return None
+    df = df[[column for column in df.columns if layout.usecols(column)]]
+
+    # 设置表头
+    original_headers = list(range(0, len(df.columns)))
+    original_headers[0] = "姓名"
+    df.columns = original_headers
+
+    # 插入新列（当前格式为员工ID和部门）
+    insert_join_columns(df, directory)
+
+    # 按姓名向量化匹配并填充数据
+    with recorder.stage("join"):
+        matched_count = directory.fill(df, key_values=key_values)
+    recorder.update_sheet(rows=len(df), matched=matched_count)
+
+    log(f"工作表 {sheet_name} 已匹配并填充 {matched_count} 条记录")
+    report_names(directory, df["姓名"], sheet_name, log, recorder, key_values)
+
+    # 应用替换到相关列（每个不同取值只清洗一次），沿用的列直接使用上次的结果
+    reuse = reuse or {}
+    columns_to_clean = [col for col in df.columns if col not in id_columns(directory) and col not in reuse]
+    for col, values in reuse.items():
+        df[col] = values
+    reused_count = len(df) * len(reuse)
+    with recorder.stage("clean"):
+        cell_count, distinct_count = clean_columns(df, columns_to_clean, clean, pool, chunk_rows, recorder,
+                                                   sheet_name, summary)
+    recorder.update_sheet(cells=cell_count + reused_count, distinct=distinct_count)
+    log(f"工作表 {sheet_name} 共清洗 {cell_count} 个单元格，不同取值 {distinct_count} 个"
+        f"（缓存命中 {cell_count - distinct_count}，未命中 {distinct_count}）")
+    if reuse:
+        recorder.update_sheet(reused=reused_count)
+        log(f"工作表 {sheet_name} 有 {len(reuse)} 个日期列与上次相同，沿用上次的清洗结果（{reused_count} 个单元格）")
+    add_stats(stats, sheets=1, rows=len(df), matched=matched_count, cells=cell_count + reused_count)
+    return df
+
+
+def process_sheet_task(input_file, sheet_name, directory, clean, rule_hits=False, summarize=False,
+                       day_start=DAY_START, min_day_columns=0):
+    """
+    在子进程中读取并处理一个工作表
+
+    返回:
+        (处理结果, 输出信息列表, 处理统计, 规则命中统计或None, 工作表统计（行数、跳过规则的单元格数等）,
+         异常汇总或None)
+    """
+    logs = []
+    stats = new_stats()
+    recorder = StageRecorder(rule_hits=rule_hits)
+    summary = ExceptionSummary() if summarize else None
+    with recorder.sheet(sheet_name) as record:
+        with pd.ExcelFile(input_file) as excel_file:
+            df, layout = read_sheet(excel_file, sheet_name, day_start, log=logs.append,
+                                    key_headers=directory.key_headers)
+        df = process_sheet(df, sheet_name, directory, clean, log=logs.append, stats=stats, recorder=recorder,
+                           summary=summary, layout=layout, min_day_columns=min_day_columns)
+    counts = {key: value for key, value in record.items() if key not in ("sheet", "elapsed", "peak_rss")}
+    return df, logs, stats, recorder.hits.counts if recorder.hits is not None else None, counts, summary
+
+
+def stream_process_sheets(input_file, output_file, directory, clean, options):
+    """
+    流式处理所有工作表：只读模式逐行读取，边读边跳过前四行和被丢弃的列，
+    按批匹配、清洗后写入只写模式的工作簿，峰值内存与行数无关
+
+    每个工作表扫描两遍：第一遍只确定行数、列数和各列类型（与pandas整表读取的结果一致），
+    第二遍按批处理。输出只包含单元格的值，不保留表头样式。
+    逐行读取和写出交替进行，计时时合并记为 io 阶段（其中的 join、clean 单独计时）。
+    输出为Excel时使用只写模式（xlsx-fast），其他格式同样逐行写出。
+    """
+    # 跨批次共用的有上限缓存，每个不同取值只清洗一次
+    clean = lru_cache(maxsize=CACHE_SIZE)(clean)
+    recorder = options.recorder
+    output_format = options.output_format
+
+    with recorder.stage("read"):
+        wb = load_workbook(input_file, read_only=True, data_only=True)
+    out = tee_writer(open_writer(output_file, "xlsx-fast" if output_format == "xlsx" else output_format),
+                     options.preview)
+    try:
+        for index, sheet_name in enumerate(wb.sheetnames):
+            if options.progress is not None:
+                options.progress(index, len(wb.sheetnames), sheet_name)
+            ws = wb[sheet_name]
+            with recorder.sheet(sheet_name):
+                stream_process_sheet(ws, sheet_name, out, directory, clean, options.stats, recorder, options.summary,
+                                     options.plan.day_start, options.plan.min_day_columns)
+    finally:
+        wb.close()
+
+    with recorder.stage("write"):
+        out.close()
+
+
+def stream_process_sheet(ws, sheet_name, out, directory, clean, stats, recorder, summary=None, day_start=DAY_START,
+                         min_day_columns=0):
+    """流式处理单个工作表，逐行写入写出器out的同名工作表"""
+    with recorder.stage("read"):
+        layout = resolve_layout(head_rows(ws, LAYOUT_PROBE_ROWS), sheet_name, day_start,
+                                key_headers=directory.key_headers)
+        row_count, width, kinds = probe_sheet(ws, layout.day_start, layout.name_column,
+                                              [layout.key_column] if layout.key_column is not None else [])
+
+    # 删除表头行（固定布局为前四行）
+    if row_count <= layout.data_start:
+        print(f"工作表 {sheet_name} 行数不足，已跳过")
+        return
+    # 保留姓名列和日期列（固定布局为第一列和第47列及以后）
+    if width < layout.day_start + min_day_columns:
+        print(f"工作表 {sheet_name} 列数不足{layout.day_start + min_day_columns}列，已跳过")
+        return
+
+    columns_to_keep = layout.keep_columns(width)
+    headers = ["姓名"] + list(range(1, len(columns_to_keep)))
+    out_ws = out.add_sheet(sheet_name, id_columns(directory) + headers[1:])
+
+    matched_count = 0
+    cell_count = 0
+    names = []
+    keys = []
+    columns_to_read = layout.read_columns(width)
+    with recorder.stage("io"):
+        for rows in iter_row_chunks(ws, columns_to_read, kinds, layout.data_start, row_count):
+            df = pd.DataFrame(rows, columns=columns_to_read)
+            # 第二匹配键列（如 工号）只用于匹配，不输出
+            key_values = df.pop(layout.key_column) if layout.key_column is not None else None
+            df.columns = headers
+            insert_join_columns(df, directory)
+            with recorder.stage("join"):
+                matched_count += directory.fill(df, key_values=key_values)
+                names.append(df["姓名"])
+                if key_values is not None:
+                    keys.append(key_values)
+            with recorder.stage("clean"):
+                cell_count += clean_columns(df, headers[1:], clean, recorder=recorder, sheet_name=sheet_name,
+                                            summary=summary)[0]
+            for row in df.itertuples(index=False, name=None):
+                out_ws.append([excel_value(value) for value in row])
+
+    add_stats(stats, sheets=1, rows=row_count - layout.data_start, matched=matched_count, cells=cell_count)
+    recorder.update_sheet(rows=row_count - layout.data_start, matched=matched_count, cells=cell_count)
+    cache_info = clean.cache_info()
+    print(f"工作表 {sheet_name} 已匹配并填充 {matched_count} 条记录")
+    if names:
+        report_names(directory, pd.concat(names, ignore_index=True), sheet_name, recorder=recorder,
+                     key_values=pd.concat(keys, ignore_index=True) if keys else None)
+    print(f"工作表 {sheet_name} 共清洗 {cell_count} 个单元格"
+          f"（累计缓存命中 {cache_info.hits}，未命中 {cache_info.misses}）")
+    print(f"已处理工作表: {sheet_name}")
+
+
+def process_csv(input_file, output_file, directory, clean, options):
+    """
+    处理CSV格式的月报（布局与Excel月报相同，输出一个以文件名命名的工作表）：
+    按开头几行识别布局后按块读取，只解析姓名列和日期列，每块分别匹配、清洗
+
+    所有值按文本读取；options.streaming 为True时每块处理完立即写出（峰值内存与行数无关），
+    否则合并后整表写出（保留表头样式）
+    """
+    # 跨块共用的有上限缓存，每个不同取值只清洗一次
+    clean = lru_cache(maxsize=CACHE_SIZE)(clean)
+    recorder, summary, streaming = options.recorder, options.summary, options.streaming
+    sheet_name = csv_sheet_name(input_file)
+    if options.progress is not None:
+        options.progress(0, 1, sheet_name)
+
+    with recorder.stage("read"):
+        encoding, width = probe_csv(input_file)
+        layout = resolve_layout(read_csv_head(input_file, LAYOUT_PROBE_ROWS), sheet_name, options.plan.day_start,
+                                key_headers=directory.key_headers)
+    # 保留姓名列和日期列（固定布局为第一列和第47列及以后）
+    if width < layout.day_start + options.plan.min_day_columns:
+        raise ValueError(f"CSV文件 {source_name(input_file)} 列数不足，无法按月报格式处理")
+
+    columns_to_keep = layout.keep_columns(width)
+    headers = ["姓名"] + list(range(1, len(columns_to_keep)))
+    output_format = "xlsx-fast" if streaming and options.output_format == "xlsx" else options.output_format
+
+    row_count = matched_count = cell_count = 0
+    frames = []
+    names = []
+    keys = []
+    with recorder.sheet(sheet_name), recorder.stage("write"), \
+            tee_writer(open_writer(output_file, output_format), options.preview) as writer:
+        out_ws = writer.add_sheet(sheet_name, id_columns(directory) + headers[1:]) if streaming else None
+        with recorder.stage("io"):
+            # 删除表头行（固定布局为前四行）
+            for df in read_csv_chunks(input_file, encoding, width, layout.read_columns(width),
+                                      skip_rows=layout.data_start):
+                # 第二匹配键列（如 工号）只用于匹配，不输出
+                key_values = df.pop(layout.key_column) if layout.key_column is not None else None
+                df.columns = headers
+                insert_join_columns(df, directory)
+                with recorder.stage("join"):
+                    matched_count += directory.fill(df, key_values=key_values)
+                    names.append(df["姓名"])
+                    if key_values is not None:
+                        keys.append(key_values)
+                with recorder.stage("clean"):
+                    cell_count += clean_columns(df, headers[1:], clean, recorder=recorder, sheet_name=sheet_name,
+                                                summary=summary)[0]
+                row_count += len(df)
+                if streaming:
+                    for row in df.itertuples(index=False, name=None):
+                        out_ws.append([excel_value(value) for value in row])
+                else:
+                    frames.append(df)
+        if not streaming:
+            writer.write_frame(sheet_name, pd.concat(frames, ignore_index=True) if frames
+                               else pd.DataFrame(columns=id_columns(directory) + headers[1:]))
+        recorder.update_sheet(rows=row_count, matched=matched_count, cells=cell_count)
+        if names:
+            report_names(directory, pd.concat(names, ignore_index=True), sheet_name, recorder=recorder,
+                         key_values=pd.concat(keys, ignore_index=True) if keys else None)
+
+    add_stats(options.stats, sheets=1, rows=row_count, matched=matched_count, cells=cell_count)
+    cache_info = clean.cache_info()
+    print(f"工作表 {sheet_name} 已匹配并填充 {matched_count} 条记录")
+    print(f"工作表 {sheet_name} 共清洗 {cell_count} 个单元格"
+          f"（缓存命中 {cache_info.hits}，未命中 {cache_info.misses}）")
+    print(f"已处理工作表: {sheet_name}")
+
+
+def process_excel(input_file, schedule_file, output_file, month_column="部门", raise_errors=False, options=None):
     """
     处理Excel文件：
     1. 删除前四行
     2. 保留第一列和第27列开始的列
+       （按开头几行的表头识别姓名列、日期列和表头行数，见layout.py；识别失败时删除前四行、
+       保留第一列和第47列及以后）
     3. 第一列表头改为"姓名"
     4. 在第一列后插入两列空白列，表头为"员工ID"、"部门"
     5. 从班次.xlsx中根据姓名匹配并填充上述两列数据
     6. 按顺序将指定字段内容替换为空（支持*模糊匹配，非整单元格匹配）
+    以上为当前格式（profile="current"）；旧格式（"legacy"，0.py）保留第一列和第27列及以后，
+    另外填充"班次"，使用0.py的替换规则，见profiles.py
+
+    输入文件按文件头识别格式：xlsx、xls（需要xlrd，不支持流式读取）或CSV（按块读取，见process_csv）
 
     参数:
-        input_file: 输入Excel文件路径
-        schedule_file: 员工信息Excel文件路径
-        output_file: 输出Excel文件路径
+        input_file: 输入文件路径，也可以是内存中的内容（bytes或BytesIO）
+        schedule_file: 员工信息Excel文件路径，也可以是已建立的EmployeeDirectory（批量处理时复用）
+        output_file: 输出Excel文件路径，也可以是BytesIO（结果写入内存）
         month_column: 保留参数，用于兼容原有调用方式
+        raise_errors: 为True时出错直接抛出异常（供流水线调用），否则打印错误并返回None
+        options: 执行计划和处理选项（见options.RunOptions），默认为当前格式、串行整表处理。其中：
+            fused 为True时在内存中继续应用新02的替换规则，直接输出最终结果，省去中间文件的写入和重新读取；
+            workers 大于1时，文件较大且有多个工作表时按工作表并行，否则对大工作表按行分块并行
+            （流式模式始终串行）；
+            recorder 分别累计 read / join / clean / write 的耗时（按工作表并行时子进程内的耗时
+            合并记为 parallel），并记录每个工作表的耗时、内存、行数和规则命中；
+            state 为增量状态时，只读取和清洗新增或变化的日期列，其余日期列沿用上次的结果；
+            内容与上次相同的工作表不再读取，直接写出上次的结果，所有工作表都未变化且输出文件
+            仍在时不再写出（需要整表处理，不使用流式模式和按工作表并行，只支持xlsx月报）；
+            summary 为ExceptionSummary时，在清洗的同一遍中按员工汇总每个工作表的
+            迟到/早退/旷工次数和分钟数、缺卡次数
     """
     try:
+        options = options or RunOptions()
+        plan = options.plan
+        day_start = plan.day_start
+        recorder, stats, summary, progress = options.recorder, options.stats, options.summary, options.progress
+        streaming, state = options.streaming, options.state
+        # 登记本阶段应用的规则集，整个规则集都未命中时也出现在运行报告中
+        if recorder.hits is not None:
+            recorder.hits.register(*plan.clean_rules, *(plan.replace_rules if options.fused else []))
+
         # 读取员工信息
         try:
-            schedule_df = pd.read_excel(schedule_file)
-            required_columns = ['姓名', '员工ID', '部门']
-            if not set(required_columns).issubset(schedule_df.columns):
-                missing = [col for col in required_columns if col not in schedule_df.columns]
-                raise ValueError(f"员工信息文件缺少必要的列: {', '.join(missing)}")
+            # 员工信息索引只建立一次，所有工作表共用（传入已建立的索引时直接复用）
+            if isinstance(schedule_file, EmployeeDirectory):
+                directory = schedule_file
+            else:
+                directory = plan.load_directory(schedule_file, options.sources)
+                directory.report_duplicates()
         except Exception as e:
-            print(f"读取员工信息文件出错: {str(e)}")
+            print(f"读取{plan.profile.directory_label}出错: {str(e)}")
+            if raise_errors:
+                raise
             return None
 
-        # 读取主Excel文件
-        excel_file = pd.ExcelFile(input_file)
-        sheet_names = excel_file.sheet_names
-
-        # 替换模式列表（全部为非单元格匹配，按优先级排序）
-        patterns_to_replace = [
-            # 1. 带分号的缺卡格式（增强匹配）
-            r'正常（未排班）',
-            r'缺卡\([^)]*\);',  # 匹配"缺卡(任意内容);"
-            r'缺卡\(.*?\);',  # 备用模式，确保匹配
-            # 2. 不带分号的缺卡格式
-            r'缺卡\([^)]*\)',
-            r'缺卡\(.*?\)',
-            # 3. 补卡申请格式
-            r'补卡申请（[^）]*）',
-            r'补卡申请（.*?）',
-            # 4. 正常(补卡)格式
-            r'正常\(补卡\)-',
-            # 5. 正常格式
-            r'正常-',
-            # 6. 双横线格式（多种可能的横线）
-            r'--',
-            r'— —',  # 全角横线
-            r'——',  # 破折号
-            # 7. 单独的缺卡
-            r'缺卡',
-            # 8. 各种换行符和空白字符
-            r'\r\n|\r|\n|\t',
-            # 9. 空格（多个连续空格）
-            r' +',
-            r'地点异常.*?;',
-            r'(补卡)-'
-        ]
-
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            for sheet_name in sheet_names:
-                # 读取数据，不设表头
-                df = excel_file.parse(sheet_name, header=None)
-
-                # 删除前四行
-                if len(df) > 4:
-                    df = df[4:].reset_index(drop=True)
-
-                    # 保留第一列和第27列及以后
-                    if len(df.columns) >= 46:
-                        columns_to_keep = [0] + list(range(46, len(df.columns)))
-                        df = df.iloc[:, columns_to_keep]
-
-                        # 设置表头
-                        original_headers = list(range(0, len(df.columns)))
-                        original_headers[0] = "姓名"
-                        df.columns = original_headers
-
-                        # 插入新列（仅保留员工ID和部门）
-                        df.insert(1, "员工ID", "")
-                        df.insert(2, "部门", "")
-
-                        # 创建姓名映射（仅包含员工ID和部门）
-                        name_mapping = {}
-                        for _, row in schedule_df.iterrows():
-                            name = row['姓名']
-                            name_mapping[name] = {
-                                '员工ID': row['员工ID'],
-                                '部门': row['部门']
-                            }
-
-                        # 填充数据
-                        matched_count = 0
-                        for idx, row in df.iterrows():
-                            name = row['姓名']
-                            if pd.notna(name) and name in name_mapping:
-                                df.at[idx, '员工ID'] = name_mapping[name]['员工ID']
-                                df.at[idx, '部门'] = name_mapping[name]['部门']
-                                matched_count += 1
-
-                        print(f"工作表 {sheet_name} 已匹配并填充 {matched_count} 条记录")
-
-                        # 替换处理函数（确保非单元格匹配）
-                        def replace_in_order(cell_value):
-                            if pd.isna(cell_value):
-                                return cell_value
-
-                            # 强制转换为字符串
-                            cell_str = str(cell_value)
-
-                            # 逐个模式进行替换（仅替换匹配的部分）
-                            for pattern in patterns_to_replace:
-                                # 全局替换，只移除匹配的部分，保留其他内容
-                                cell_str = re.sub(pattern, '', cell_str)
-
-                            # 处理替换后可能产生的空白
-                            cleaned_str = cell_str.strip()
-                            return cleaned_str if cleaned_str else cell_value
-
-                        # 应用替换到相关列
-                        for col in df.columns:
-                            if col not in ['姓名', '员工ID', '部门']:
-                                # 先转换为字符串再处理，确保所有类型都能被正确匹配
-                                df[col] = df[col].apply(lambda x: replace_in_order(str(x) if x is not None else ''))
-
-                        # 保存处理后的工作表
-                        df.to_excel(writer, sheet_name=sheet_name, index=False)
-                        print(f"已处理工作表: {sheet_name}")
-                    else:
-                        print(f"工作表 {sheet_name} 列数不足27列，已跳过")
+        # 单元格清洗函数：融合模式下在内存中继续应用第二阶段（新02）的替换规则
+        clean = plan.cleaner("clean_fused" if options.fused else "clean_cell")
+
+        input_file = as_source(input_file)
+        input_format = detect_format(input_file)
+        if state is not None and input_format != "xlsx":
+            print("增量处理只支持xlsx月报，本次全部重新处理")
+            state = None
+        if input_format == "csv":
+            process_csv(input_file, output_file, directory, clean, options)
+            print(f"文件处理完成，已保存至: {output_name(output_file)}")
+            return output_file
+        if input_format == "xls":
+            require_xlrd()
+            if streaming:
+                print("xls格式不支持流式读取，改为整表读取")
+                streaming = False
+        if state is not None and streaming:
+            print("增量处理需要整表读取，不使用流式模式")
+            streaming = False
+
+        if streaming:
+            stream_process_sheets(input_file, output_file, directory, clean, options)
+            print(f"文件处理完成，已保存至: {output_name(output_file)}")
+            return output_file
+
+        # 增量处理：按工作表和各列的内容哈希判断能否沿用上次的结果，月报完全未变化时连输出文件也沿用
+        excel_file = None
+        sheet_names = None
+        if state is not None:
+            with recorder.stage("read"):
+                sheet_names = state.begin(input_file, directory)
+            if (state.unchanged(summary is not None) and options.preview is None
+                    and state.reuse_output(output_file, options.output_format)):
+                for sheet_name in sheet_names:
+                    with recorder.sheet(sheet_name):
+                        state.restore(sheet_name, state.lookup(sheet_name), stats, recorder, summary)
+                print(f"月报内容未变化，沿用上次的输出文件: {output_name(output_file)}")
+                return output_file
+
+        # 读取主Excel文件（增量处理时只在有工作表需要重新处理时才打开）
+        if sheet_names is None:
+            with recorder.stage("read"):
+                excel_file = pd.ExcelFile(input_file)
+            sheet_names = excel_file.sheet_names
+
+        pool = create_pool(options.workers)
+        try:
+            # write 阶段包住整个写出过程（含保存文件），其中的读取和清洗单独计时
+            with recorder.stage("write"), \
+                    tee_writer(open_writer(output_file, options.output_format), options.preview) as writer:
+                if (pool is not None and state is None and len(sheet_names) > 1
+                        and source_size(input_file) >= MIN_PARALLEL_BYTES):
+                    # 多个工作表分给子进程读取和处理，按原顺序写出
+                    futures = [
+                        pool.submit(process_sheet_task, input_file, sheet_name, directory, clean,
+                                    recorder.hits is not None, summary is not None, day_start,
+                                    plan.min_day_columns)
+                        for sheet_name in sheet_names
+                    ]
+                    for index, (sheet_name, future) in enumerate(zip(sheet_names, futures)):
+                        if progress is not None:
+                            progress(index, len(sheet_names), sheet_name)
+                        # 并行时工作表的耗时为等待结果和写入的时间
+                        with recorder.sheet(sheet_name):
+                            with recorder.stage("parallel"):
+                                df, logs, sheet_stats, sheet_hits, sheet_counts, sheet_summary = future.result()
+                            for line in logs:
+                                print(line)
+                            add_stats(stats, **sheet_stats)
+                            recorder.update_sheet(**sheet_counts)
+                            if sheet_hits is not None:
+                                recorder.hits.merge(sheet_hits)
+                            if sheet_summary is not None:
+                                summary.merge(sheet_summary)
+                            if df is not None:
+                                writer.write_frame(sheet_name, df)
+                                print(f"已处理工作表: {sheet_name}")
                 else:
-                    print(f"工作表 {sheet_name} 行数不足，已跳过")
+                    for index, sheet_name in enumerate(sheet_names):
+                        if progress is not None:
+                            progress(index, len(sheet_names), sheet_name)
+                        with recorder.sheet(sheet_name) as record:
+                            entry = state.lookup(sheet_name, summary is not None) if state is not None else None
+                            if entry is not None:
+                                df = state.restore(sheet_name, entry, stats, recorder, summary)
+                                print(f"工作表 {sheet_name} 内容未变化，沿用上次的处理结果")
+                            else:
+                                # 读取数据，不设表头（识别布局后只读取姓名列和日期列；
+                                # 增量处理时只解析新增或变化的日期列）
+                                reuse = None
+                                with recorder.stage("read"):
+                                    if excel_file is None:
+                                        excel_file = pd.ExcelFile(state.read_source(input_file, summary is not None)
+                                                                  if state is not None else input_file)
+                                    raw, layout = read_sheet(excel_file, sheet_name, day_start,
+                                                             key_headers=directory.key_headers)
+                                    if state is not None and state.partial(sheet_name):
+                                        reuse = state.reuse(sheet_name, raw, layout)
+                                        if reuse is None:
+                                            print(f"工作表 {sheet_name} 的布局或行列数与上次不同，重新读取整个工作表")
+                                            with pd.ExcelFile(input_file) as full_file:
+                                                raw, layout = read_sheet(full_file, sheet_name, day_start,
+                                                                         key_headers=directory.key_headers)
+                                sheet_stats = new_stats()
+                                # 增量处理时异常汇总由增量状态按列统计（沿用的列使用上次的统计）
+                                df = process_sheet(raw, sheet_name, directory, clean, pool=pool,
+                                                   chunk_rows=options.chunk_rows, stats=sheet_stats, recorder=recorder,
+                                                   summary=summary if state is None else None, layout=layout,
+                                                   min_day_columns=plan.min_day_columns, reuse=reuse)
+                                add_stats(stats, **sheet_stats)
+                                if state is not None:
+                                    state.record(sheet_name, df, sheet_stats, record, summary, raw, layout, reuse)
+                            if df is not None:
+                                # 保存处理后的工作表
+                                writer.write_frame(sheet_name, df)
+                                print(f"已处理工作表: {sheet_name}")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if state is not None:
+            state.record_output(output_file, options.output_format)
 
-        print(f"文件处理完成，已保存至: {output_file}")
+        print(f"文件处理完成，已保存至: {output_name(output_file)}")
         return output_file
 
     except Exception as e:
         print(f"处理文件时出错: {str(e)}")
+        if raise_errors:
+            raise
         return None
 
 
@@ -1,115 +1,290 @@
 import os
-import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
 from openpyxl import load_workbook
 
+from instrument import NULL_RECORDER
+from parallel import DEFAULT_CHUNK_ROWS, clean_text_blocks, create_pool, use_parallel
+from preview import tee_writer
+from options import RunOptions
+from profiles import DEFAULT_PROFILE, compile_profile
+from readers import as_source, csv_sheet_name, detect_format, probe_csv, read_csv_chunks, require_xlrd
+from writers import DEFAULT_FORMAT, open_writer, output_name
+
+
+def count_rule_hits(recorder, counter, plan):
+    """按 {单元格文本: 出现次数} 统计规则命中（未开启统计时counter为None）"""
+    if counter:
+        recorder.count_rules(plan.replace_cell_value, list(counter), list(counter.values()))
 
-def replace_excel_content(input_file, output_file):
+
+def replace_sheet_parallel(ws, pool, plan, chunk_rows=DEFAULT_CHUNK_ROWS, recorder=NULL_RECORDER):
     """
-    专门用于替换Excel文件中的指定内容
+    把工作表中受保护的列（姓名和填充的列）之后的非空单元格按行分块交给进程池清洗，再按原顺序写回
 
-    参数:
-        input_file: 输入Excel文件路径（如上下班打卡_7月报_processed.xlsx）
-        output_file: 输出Excel文件路径，默认为在输入文件名后加"_replaced"
+    返回:
+        发生变化的单元格数量
     """
-    try:
-        # 自动生成输出文件名
-        output_file = output_file
+    protected = plan.protected_columns
+    cells = [cell for row in ws.iter_rows(min_col=protected + 1) for cell in row if cell.value is not None]
+    texts = np.empty(len(cells), dtype=object)
+    texts[:] = [str(cell.value) for cell in cells]
+    block_size = chunk_rows * max(ws.max_column - protected, 1)
+    cleaned, _ = clean_text_blocks(texts, plan.cleaner("replace_text"), pool, block_size)
+    if len(texts):
+        codes, uniques = pd.factorize(texts)
+        counts = np.bincount(codes, minlength=len(uniques))
+        recorder.update_sheet(skipped=int(counts[~plan.replace_filter.mask(uniques)].sum()))
+        recorder.count_rules(plan.replace_cell_value, list(uniques), counts.tolist())
 
-        # 打开Excel文件
-        wb = load_workbook(input_file)
-
-        # 替换模式列表（非单元格匹配，按优先级排序）
-        patterns_to_replace = [
-            # 1. 带分号的缺卡格式（增强匹配）
-            r'正常（未排班）',
-            r'缺卡\([^)]*\);',  # 匹配"缺卡(任意内容);"
-            r'缺卡\(.*?\);',  # 备用模式，确保匹配
-            # 2. 不带分号的缺卡格式
-            r'缺卡\([^)]*\)',
-            r'缺卡\(.*?\)',
-            # 3. 补卡申请格式
-            r'补卡申请（[^）]*）',
-            r'补卡申请（.*?）',
-            # 4. 正常(补卡)格式
-            r'正常\(补卡\)-',
-            # 5. 正常格式
-            r'正常-',
-            # 6. 双横线格式（多种可能的横线）
-            r'--',
-            r'— —',  # 全角横线
-            r'——',  # 破折号
-            # 7. 单独的缺卡
-            r'缺卡',
-            # 8. 各种换行符和空白字符
-            r'\r\n|\r|\n|\t',
-            # 9. 空格（多个连续空格）
-            r' +',
-            r'地点异常.*?;',
-            r'\(补卡\)-',
-            r'正常\(管理员校准、补卡\)-',
-            r'正常\(休息\)',
-            r'正常（休息）',
-            r'正常\(管理员校准\)-',
-            r'迟到\s*[\d.]*\s*分钟-?;',
-            r'早退\s*[\d.]*\s*分钟-?;',
-            r'旷工\s*[\d.]*\s*分钟-?;',
-        ]
-        patterns_to_replace2 = [
-            r'迟到\s*[\d.]*\s*分钟-?',
-            r'早退\s*[\d.]*\s*分钟-?',
-            r'旷工\s*[\d.]*\s*分钟-?',
-        ]
+    replace_count = 0
+    for cell, original_value, cell_text in zip(cells, texts, cleaned):
+        if cell_text != original_value:
+            cell.value = cell_text if cell_text else ""
+            replace_count += 1
+    return replace_count
 
-        # 处理每个工作表
-        for sheet_name in wb.sheetnames:
+
+def replace_sheet(ws, sheet_name, pool=None, chunk_rows=DEFAULT_CHUNK_ROWS, recorder=NULL_RECORDER, plan=None):
+    """替换单个工作表中受保护的列之后的单元格（原地修改），plan 默认为当前格式的执行计划"""
+    plan = plan or compile_profile(DEFAULT_PROFILE)
+    protected = plan.protected_columns
+    # 单元格较多时交给进程池按行分块清洗
+    if use_parallel(pool, ws.max_row * max(ws.max_column - protected, 0)):
+        with recorder.stage("clean"):
+            replace_count = replace_sheet_parallel(ws, pool, plan, chunk_rows, recorder)
+        recorder.update_sheet(rows=ws.max_row, changed=replace_count)
+        print(f"工作表 {sheet_name} 完成替换，共处理 {replace_count} 个单元格（并行）")
+        return replace_count
+
+    # 记录替换数量和缓存命中情况
+    replace_count = 0
+    skipped_count = 0
+    counter = Counter() if recorder.hits is not None else None
+    cache_before = plan.lookup.cache_info()
+
+    # 遍历所有单元格进行替换
+    with recorder.stage("clean"):
+        for row in range(1, ws.max_row + 1):
+            for col in range(1, ws.max_column + 1):
+                # 跳过姓名和填充的列（当前格式为前3列：姓名、员工ID、部门）
+                if col <= protected:
+                    continue
+
+                cell = ws.cell(row=row, column=col)
+                if counter is not None and cell.value is not None:
+                    counter[str(cell.value)] += 1
+                new_value, changed, skipped = plan.replace_cell(cell.value)
+                skipped_count += skipped
+
+                # 如果内容有变化，更新单元格并计数
+                if changed:
+                    cell.value = new_value
+                    replace_count += 1
+        count_rule_hits(recorder, counter, plan)
+
+    recorder.update_sheet(rows=ws.max_row, changed=replace_count, skipped=skipped_count)
+    cache_after = plan.lookup.cache_info()
+    print(f"工作表 {sheet_name} 完成替换，共处理 {replace_count} 个单元格，{skipped_count} 个单元格无需执行规则"
+          f"（缓存命中 {cache_after.hits - cache_before.hits}，"
+          f"未命中 {cache_after.misses - cache_before.misses}）")
+    return replace_count
+
+
+def stream_replace_sheets(input_file, output_file, progress=None, recorder=NULL_RECORDER,
+                          output_format=DEFAULT_FORMAT, preview=None, plan=None):
+    """
+    流式替换：只读模式逐行读取，替换后写入只写模式的工作簿，峰值内存与行数无关
+
+    隐藏工作表原样写出并保持隐藏；输出只包含单元格的值，不保留原有样式。
+    逐行读取、替换和写出交替进行，计时时合并记为 io 阶段。
+    输出为Excel时使用只写模式（xlsx-fast），其他格式同样逐行写出。
+    """
+    with recorder.stage("read"):
+        wb = load_workbook(input_file, read_only=True)
+    out = tee_writer(open_writer(output_file, "xlsx-fast" if output_format == "xlsx" else output_format), preview)
+    try:
+        for sheet_index, sheet_name in enumerate(wb.sheetnames):
+            if progress is not None:
+                progress(sheet_index, len(wb.sheetnames), sheet_name)
             ws = wb[sheet_name]
+            out_ws = out.add_sheet(sheet_name, sheet_state=ws.sheet_state)
 
             # 只处理可见工作表
             if ws.sheet_state != 'visible':
+                for row in ws.iter_rows(values_only=True):
+                    out_ws.append(row)
                 print(f"工作表 {sheet_name} 是隐藏的，已跳过")
                 continue
 
-            # 记录替换数量
-            replace_count = 0
+            with recorder.sheet(sheet_name):
+                replace_rows(ws.iter_rows(values_only=True), out_ws, sheet_name, recorder, plan)
+    finally:
+        wb.close()
+
+    with recorder.stage("write"):
+        out.close()
 
-            # 遍历所有单元格进行替换
-            for row in range(1, ws.max_row + 1):
-                for col in range(1, ws.max_column + 1):
-                    # 跳过姓名、员工ID、部门（假设这些列是前3列）
-                    if col <= 3:
-                        continue
 
-                    cell = ws.cell(row=row, column=col)
-                    if cell.value is not None:
-                        original_value = str(cell.value)
-                        cell_text = original_value
+def replace_rows(rows, out_ws, sheet_name, recorder=NULL_RECORDER, plan=None):
+    """逐行替换受保护的列之后的单元格并写入out_ws，读取、替换和写出合并记为 io 阶段"""
+    plan = plan or compile_profile(DEFAULT_PROFILE)
+    replace_count = 0
+    skipped_count = 0
+    row_count = 0
+    counter = Counter() if recorder.hits is not None else None
+    cache_before = plan.lookup.cache_info()
+    with recorder.stage("io"):
+        for row in rows:
+            row = list(row)
+            row_count += 1
+            # 跳过姓名和填充的列
+            for index in range(plan.protected_columns, len(row)):
+                if counter is not None and row[index] is not None:
+                    counter[str(row[index])] += 1
+                new_value, changed, skipped = plan.replace_cell(row[index])
+                skipped_count += skipped
+                if changed:
+                    row[index] = new_value
+                    replace_count += 1
+            out_ws.append(row)
+        recorder.update_sheet(rows=row_count, changed=replace_count, skipped=skipped_count)
+        count_rule_hits(recorder, counter, plan)
 
-                        # 应用所有替换模式
-                        for pattern in patterns_to_replace:
-                            cell_text = re.sub(pattern, '', cell_text)
-                        # 应用所有替换模式
-                        for pattern in patterns_to_replace2:
-                            cell_text = re.sub(pattern, ';', cell_text)
+    cache_after = plan.lookup.cache_info()
+    print(f"工作表 {sheet_name} 完成替换，共处理 {replace_count} 个单元格，{skipped_count} 个单元格无需执行规则"
+          f"（缓存命中 {cache_after.hits - cache_before.hits}，"
+          f"未命中 {cache_after.misses - cache_before.misses}）")
+    return replace_count
 
-                        # 最终清理
-                        cell_text = cell_text.strip()
 
-                        # 如果内容有变化，更新单元格并计数
-                        if cell_text != original_value:
-                            cell.value = cell_text if cell_text else ""
-                            replace_count += 1
+def frame_rows(df):
+    """把pandas读取的表格转换为行（缺失值为None，与openpyxl读取的空单元格一致）"""
+    for row in df.itertuples(index=False, name=None):
+        yield [None if isinstance(value, float) and value != value else value for value in row]
+
+
+def replace_other_format(input_file, output_file, input_format, progress=None, recorder=NULL_RECORDER,
+                         output_format=DEFAULT_FORMAT, preview=None, plan=None):
+    """
+    替换CSV或.xls文件：CSV按块读取（所有值按文本读取），.xls用pandas按工作表读取，
+    替换后逐行写出（输出为Excel时使用xlsx-fast）
+    """
+    out = tee_writer(open_writer(output_file, "xlsx-fast" if output_format == "xlsx" else output_format), preview)
+    try:
+        if input_format == "csv":
+            sheet_name = csv_sheet_name(input_file)
+            if progress is not None:
+                progress(0, 1, sheet_name)
+            with recorder.stage("read"):
+                encoding, width = probe_csv(input_file)
+            # 与openpyxl读取一致，只有空单元格为None，"nan"等文本原样保留
+            chunks = read_csv_chunks(input_file, encoding, width, na_values=[""])
+            rows = (row for chunk in chunks for row in frame_rows(chunk))
+            with recorder.sheet(sheet_name):
+                replace_rows(rows, out.add_sheet(sheet_name), sheet_name, recorder, plan)
+        else:
+            require_xlrd()
+            with recorder.stage("read"):
+                sheets = pd.read_excel(input_file, sheet_name=None, header=None)
+            for sheet_index, (sheet_name, df) in enumerate(sheets.items()):
+                if progress is not None:
+                    progress(sheet_index, len(sheets), sheet_name)
+                with recorder.sheet(sheet_name):
+                    replace_rows(frame_rows(df), out.add_sheet(sheet_name), sheet_name, recorder, plan)
+    finally:
+        with recorder.stage("write"):
+            out.close()
+
+
+def write_values(wb, output_file, output_format, preview=None):
+    """把替换后的工作簿按输出格式逐行写出（只含单元格的值），隐藏工作表保持隐藏"""
+    with tee_writer(open_writer(output_file, output_format), preview) as out:
+        for ws in wb.worksheets:
+            out_ws = out.add_sheet(ws.title, sheet_state=ws.sheet_state)
+            for row in ws.iter_rows(values_only=True):
+                out_ws.append(row)
+
+
+def replace_excel_content(input_file, output_file, raise_errors=False, options=None):
+    """
+    专门用于替换Excel文件中的指定内容
+
+    输入为CSV或.xls时按文件头识别，见replace_other_format
+
+    参数:
+        input_file: 输入Excel文件路径（如上下班打卡_7月报_processed.xlsx），也可以是bytes或BytesIO
+        output_file: 输出Excel文件路径，默认为在输入文件名后加"_replaced"；也可以是BytesIO
+        raise_errors: 为True时出错直接抛出异常（供流水线调用），否则打印错误并返回None
+        options: 执行计划和处理选项（见options.RunOptions），使用其中的 streaming、workers、chunk_rows、
+                 progress、recorder、output_format 和 preview（fused、state、summary 只用于新01）；
+                 执行计划决定替换规则和不替换的前几列，单元格数较少的工作表固定走串行，
+                 默认保存为保留原有样式的Excel
+    """
+    try:
+        options = options or RunOptions()
+        plan = options.plan
+        progress, recorder, output_format, preview = (options.progress, options.recorder, options.output_format,
+                                                      options.preview)
+        # 登记本阶段应用的规则集，整个规则集都未命中时也出现在运行报告中
+        if recorder.hits is not None:
+            recorder.hits.register(*plan.replace_rules)
+
+        input_file = as_source(input_file)
+        input_format = detect_format(input_file)
+        if input_format != "xlsx":
+            replace_other_format(input_file, output_file, input_format, progress, recorder, output_format,
+                                 preview, plan)
+            print(f"替换完成，已保存至: {output_name(output_file)}")
+            return output_file
+
+        if options.streaming:
+            stream_replace_sheets(input_file, output_file, progress, recorder, output_format, preview, plan)
+            print(f"替换完成，已保存至: {output_name(output_file)}")
+            return output_file
+
+        # 打开Excel文件
+        with recorder.stage("read"):
+            wb = load_workbook(input_file)
+
+        # 处理每个工作表
+        pool = create_pool(options.workers)
+        try:
+            for index, sheet_name in enumerate(wb.sheetnames):
+                if progress is not None:
+                    progress(index, len(wb.sheetnames), sheet_name)
+                ws = wb[sheet_name]
+
+                # 只处理可见工作表
+                if ws.sheet_state != 'visible':
+                    print(f"工作表 {sheet_name} 是隐藏的，已跳过")
+                    continue
 
-            print(f"工作表 {sheet_name} 完成替换，共处理 {replace_count} 个单元格")
+                with recorder.sheet(sheet_name):
+                    replace_sheet(ws, sheet_name, pool, options.chunk_rows, recorder, plan)
+        finally:
+            if pool is not None:
+                pool.shutdown()
 
         # 保存处理后的文件
-        wb.save(output_file)
+        with recorder.stage("write"):
+            if output_format == DEFAULT_FORMAT:
+                wb.save(output_file)
+                if preview is not None:
+                    preview.add_workbook(wb)
+            else:
+                write_values(wb, output_file, output_format, preview)
         wb.close()
 
-        print(f"替换完成，已保存至: {output_file}")
+        print(f"替换完成，已保存至: {output_name(output_file)}")
         return output_file
 
     except Exception as e:
         print(f"替换过程出错: {str(e)}")
+        if raise_errors:
+            raise
         return None
 
 
@@ -0,0 +1,365 @@
+import json
+import os
+import re
+import shutil
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+from multipart import create_form_parser
+
+# modules目录下的脚本既可以命令行运行，也可以在app中直接导入
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+if MODULES_DIR not in sys.path:
+    sys.path.insert(0, MODULES_DIR)
+
+from jobs import JobManager, JobQueueFull, summary_key
+from pipeline import result_file_key
+from profiles import DEFAULT_PROFILE, PROFILES
+from readers import check_input_format
+from store import ResultStore, run_periodically
+from writers import DEFAULT_FORMAT, MIME_TYPES, available_formats, check_output_format, output_suffix
+
+# 与app共用结果仓库（相同的上传内容和选项互相命中缓存）
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_files", "results")
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+# 同时处理的任务数和最多排队的任务数
+MAX_RUNNING_JOBS = 2
+MAX_QUEUED_JOBS = 8
+# 单个请求的上传大小上限（与Streamlit默认的200MB一致）
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# 同步处理时最长等待时间（秒），超时后返回任务ID，改为轮询
+SYNC_TIMEOUT = 600
+# 返回结果文件时每次写出的字节数
+SEND_CHUNK_BYTES = 1024 * 1024
+
+_RESULT_KEY = re.compile(r'^[\w.-]+$')
+
+USAGE = {
+    "POST /process": "上传 report、employee 两个文件，处理完成后直接返回结果文件",
+    "POST /jobs": "上传 report、employee 两个文件，立即返回任务ID",
+    "POST /batch": "上传多个 report 文件和一个 employee 文件，每个月报一个任务",
+    "GET /jobs/<任务ID>": "查询任务状态",
+    "GET /results/<结果ID>": "下载结果文件",
+    "选项": "表单字段或查询参数：format（" + "/".join(available_formats()) + "）、profile（" + "/".join(PROFILES) + "）、streaming、summary（1/0）",
+}
+
+
+class RequestError(Exception):
+    """请求不合法等需要直接返回给调用方的错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Upload:
+    """表单中的一个上传文件"""
+
+    def __init__(self, field, file_name, data):
+        self.field = field
+        self.file_name = file_name
+        self.data = data
+
+
+def _text(value):
+    return value.decode("utf-8", errors="replace") if isinstance(value, bytes) else value
+
+
+def parse_multipart(headers, stream, content_length):
+    """
+    解析multipart表单（python-multipart），上传内容保存在内存中，直接交给流水线
+
+    返回:
+        ({字段名: 值}, [Upload])
+    """
+    fields = {}
+    uploads = []
+
+    def on_field(field):
+        fields[_text(field.field_name)] = _text(field.value or b"")
+
+    def on_file(file):
+        file.file_object.seek(0)
+        uploads.append(Upload(_text(file.field_name), _text(file.file_name), file.file_object.read()))
+
+    try:
+        parser = create_form_parser(
+            {"Content-Type": headers.get("Content-Type", "")}, on_field, on_file,
+            config={"MAX_MEMORY_FILE_SIZE": MAX_UPLOAD_BYTES},
+        )
+    except ValueError as e:
+        raise RequestError(400, f"需要multipart/form-data格式的上传: {str(e)}")
+    remaining = content_length
+    while remaining > 0:
+        chunk = stream.read(min(remaining, SEND_CHUNK_BYTES))
+        if not chunk:
+            break
+        parser.write(chunk)
+        remaining -= len(chunk)
+    parser.finalize()
+    return fields, uploads
+
+
+def flag(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def parse_options(fields, query):
+    """处理选项：表单字段优先，其次为查询参数"""
+    def get(name, default=None):
+        if name in fields:
+            return fields[name]
+        return query.get(name, [default])[0]
+
+    output_format = get("format", DEFAULT_FORMAT)
+    try:
+        check_output_format(output_format)
+    except (ValueError, ImportError) as e:
+        raise RequestError(400, str(e))
+    profile = get("profile", DEFAULT_PROFILE)
+    if profile not in PROFILES:
+        raise RequestError(400, f"未知的处理配置: {profile}，可选 {', '.join(PROFILES)}")
+    return {
+        "streaming": flag(get("streaming", "0")),
+        "summary": flag(get("summary", "0")),
+        "output_format": output_format,
+        "profile": profile,
+    }
+
+
+def check_uploads(uploads):
+    """上传时检查文件格式所需的依赖（.xls需要xlrd），不可用时直接拒绝，不提交任务"""
+    for upload in uploads:
+        try:
+            check_input_format(upload.data)
+        except ImportError as e:
+            raise RequestError(400, f"{upload.file_name or upload.field}: {str(e)}")
+
+
+def single_upload(uploads, field):
+    matches = [upload for upload in uploads if upload.field == field]
+    if len(matches) != 1:
+        raise RequestError(400, f"需要上传且只上传一个 {field} 文件")
+    return matches[0]
+
+
+def result_name(report_name, output_format):
+    """返回给调用方的文件名：<月报文件名>_原始数据<扩展名>"""
+    stem = os.path.splitext(os.path.basename(report_name or ""))[0] or "处理结果"
+    return f"{stem}_原始数据{output_suffix(output_format)}"
+
+
+class ProcessingService:
+    """
+    HTTP服务使用的处理引擎：与app相同，任务在 JobManager 中运行（内存中处理），
+    结果按上传内容和选项寻址保存在 ResultStore 中
+    """
+
+    def __init__(self, results_dir=RESULTS_DIR, max_running=MAX_RUNNING_JOBS, max_queued=MAX_QUEUED_JOBS,
+                 workers=1):
+        self.store = ResultStore(results_dir, suffix="")
+        self.jobs = JobManager(None, store=self.store, max_running=max_running, max_queued=max_queued)
+        self.workers = workers
+
+    def cleanup(self):
+        self.store.evict()
+        self.jobs.prune()
+
+    def submit(self, report, employee, streaming=False, summary=False, output_format=DEFAULT_FORMAT,
+               profile=DEFAULT_PROFILE):
+        """
+        提交一个月报；命中结果缓存时不再处理
+
+        返回:
+            (结果ID, Job或None)
+        """
+        key = result_file_key(report.data, employee.data, streaming=streaming, output_format=output_format,
+                              profile=profile)
+        if self.store.get(key) and (not summary or self.store.get(summary_key(key))):
+            return key, None
+        job = self.jobs.submit(
+            report.data, employee.data, key=key, fused=True, streaming=streaming, workers=self.workers,
+            output_format=output_format, summary=summary, profile=profile,
+        )
+        return key, job
+
+    def describe(self, key, job=None, summary=False):
+        """任务或缓存结果的状态字典（含结果下载地址）"""
+        if job is None:
+            info = {"status": "success", "cached": True}
+        else:
+            info = job.to_dict()
+            result = info.pop("result") or {}
+            for name in ("elapsed", "stats", "stage", "error"):
+                if result.get(name) is not None:
+                    info[name] = result[name]
+        if info["status"] == "success":
+            info["result_url"] = f"/results/{key}"
+            if summary:
+                info["summary_url"] = f"/results/{summary_key(key)}"
+        return info
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """处理HTTP请求，service 为ProcessingService（在创建服务时设置）"""
+
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._dispatch(self._get)
+
+    def do_POST(self):
+        self._dispatch(self._post)
+
+    def _dispatch(self, handler):
+        url = urlsplit(self.path)
+        try:
+            handler(url.path.rstrip("/") or "/", parse_qs(url.query))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            # 出错时请求体可能没有读完，返回错误后关闭连接
+            self.close_connection = True
+            if isinstance(e, RequestError):
+                self.send_json(e.status, {"status": "error", "error": str(e)})
+            elif isinstance(e, JobQueueFull):
+                self.send_json(503, {"status": "error", "error": str(e)})
+            else:
+                self.send_json(500, {"status": "error", "error": str(e)})
+
+    def _get(self, path, query):
+        if path in ("/", "/health"):
+            self.send_json(200, {"status": "ok", "active_jobs": self.service.jobs.active_count(), "usage": USAGE})
+        elif path.startswith("/jobs/"):
+            job = self.service.jobs.get(path[len("/jobs/"):])
+            if job is None:
+                raise RequestError(404, "任务不存在或已过期")
+            summary = "summary_file" in (job.result or {})
+            self.send_json(200, self.service.describe(job.key, job, summary))
+        elif path.startswith("/results/"):
+            self.send_result(path[len("/results/"):])
+        else:
+            raise RequestError(404, f"未知地址: {path}")
+
+    def _post(self, path, query):
+        if path not in ("/process", "/jobs", "/batch"):
+            raise RequestError(404, f"未知地址: {path}")
+        fields, uploads = self.read_form()
+        options = parse_options(fields, query)
+        employee = single_upload(uploads, "employee")
+        check_uploads(uploads)
+
+        if path == "/batch":
+            reports = [upload for upload in uploads if upload.field == "report"]
+            if not reports:
+                raise RequestError(400, "需要上传至少一个 report 文件")
+            items = []
+            for report in reports:
+                try:
+                    key, job = self.service.submit(report, employee, **options)
+                    item = self.service.describe(key, job, options["summary"])
+                    if job is not None:
+                        item["status_url"] = f"/jobs/{job.job_id}"
+                except JobQueueFull as e:
+                    item = {"status": "error", "error": str(e)}
+                items.append(dict(item, report=report.file_name))
+            self.send_json(202, {"jobs": items})
+            return
+
+        report = single_upload(uploads, "report")
+        key, job = self.service.submit(report, employee, **options)
+        if path == "/jobs":
+            info = self.service.describe(key, job, options["summary"])
+            if job is not None:
+                info["status_url"] = f"/jobs/{job.job_id}"
+            self.send_json(202 if job is not None else 200, info)
+            return
+
+        # 同步处理：等待任务结束后直接返回结果文件
+        if job is not None and not job.wait(SYNC_TIMEOUT):
+            info = self.service.describe(key, job, options["summary"])
+            info.update(status_url=f"/jobs/{job.job_id}", error="处理超时，请按任务ID查询结果")
+            self.send_json(504, info)
+            return
+        if job is not None and job.status != "success":
+            self.send_json(500, self.service.describe(key, job, options["summary"]))
+            return
+        headers = {}
+        if options["summary"]:
+            headers["X-Summary-Url"] = f"/results/{summary_key(key)}"
+        self.send_result(key, result_name(report.file_name, options["output_format"]), headers)
+
+    def read_form(self):
+        try:
+            content_length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise RequestError(411, "需要Content-Length")
+        if content_length > MAX_UPLOAD_BYTES:
+            raise RequestError(413, f"上传内容超过上限 {MAX_UPLOAD_BYTES // 1024 // 1024} MB")
+        return parse_multipart(self.headers, self.rfile, content_length)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_result(self, key, file_name=None, headers=None):
+        """按块写出结果仓库中的文件"""
+        path = self.service.store.get(key) if _RESULT_KEY.match(key) else None
+        if path is None:
+            raise RequestError(404, "结果不存在或已过期")
+        try:
+            f = open(path, "rb")
+        except OSError:
+            # 刚好被后台清理
+            raise RequestError(404, "结果不存在或已过期")
+        with f:
+            suffix = os.path.splitext(key)[1]
+            file_name = file_name or f"处理结果{suffix}"
+            self.send_response(200)
+            self.send_header("Content-Type", MIME_TYPES.get(suffix, "application/octet-stream"))
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(file_name)}")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, SEND_CHUNK_BYTES)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}")
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, service=None):
+    """创建HTTP服务（不启动），port为0时由系统分配端口"""
+    handler = type("Handler", (RequestHandler,), {"service": service or ProcessingService()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="月报处理HTTP服务（供定时任务等自动调用，与app使用相同的处理流程）")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"监听地址，默认 {DEFAULT_HOST}")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口，默认 {DEFAULT_PORT}")
+    parser.add_argument("--max-running", type=int, default=MAX_RUNNING_JOBS, help="同时处理的任务数")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED_JOBS, help="最多排队的任务数")
+    parser.add_argument("--workers", type=int, default=1, help="每个任务清洗使用的进程数，0为全部CPU核数")
+    args = parser.parse_args()
+
+    service = ProcessingService(max_running=args.max_running, max_queued=args.max_queued, workers=args.workers)
+    run_periodically(service.cleanup)
+    server = create_server(args.host, args.port, service)
+    print(f"处理服务已启动: http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.jobs.shutdown(wait=False)
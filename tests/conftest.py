@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# modules 下的脚本互相按文件名导入
+MODULES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modules")
+sys.path.insert(0, MODULES_DIR)
+
+# 员工信息缓存写到临时目录，不影响 temp_files（需在导入 employees 之前设置）
+os.environ.setdefault("CLEXCEL_DIRECTORY_CACHE", tempfile.mkdtemp(prefix="clexcel_cache_"))
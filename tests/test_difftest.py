@@ -0,0 +1,17 @@
+import pytest
+
+from difftest import check_cells, check_workbook
+from profiles import PROFILES
+
+
+@pytest.mark.parametrize("profile", list(PROFILES))
+def test_cells_match_reference(profile):
+    results = check_cells(2000, seed=0, profile=profile)
+    assert {name: diffs[:5] for name, (_, diffs) in results.items() if diffs} == {}
+
+
+@pytest.mark.parametrize("profile", list(PROFILES))
+def test_workbook_matches_reference(profile):
+    results = check_workbook(employees=30, days=31, sheets=2, seed=0, profile=profile)
+    assert {name: diffs if isinstance(diffs, str) else diffs[:5]
+            for name, (_, diffs) in results.items() if diffs} == {}
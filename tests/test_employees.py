@@ -0,0 +1,76 @@
+import csv
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from employees import EmployeeDirectory
+from pipeline import run_pipeline
+
+
+DAYS = [1, 2, 3, 4, 5]
+
+
+def write_report(path, rows):
+    """钉钉格式的小月报：汇总列中有工号列；同时写出内容相同的CSV"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "7月"
+    ws.append(["考勤统计报表"])
+    ws.append(["报表生成时间"])
+    ws.append(["姓名", "考勤组", "部门", "工号"] + ["统计项"] * 10 + DAYS)
+    ws.append([None] * 14 + ["一", "二", "三", "四", "五"])
+    for name, number in rows:
+        ws.append([name, "A组", "x", number] + [1] * 10 + ["正常-正常", "迟到5分钟-正常", "休息", "正常", "正常"])
+    wb.save(path)
+    csv_path = os.path.splitext(path)[0] + ".csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for row in ws.iter_rows(values_only=True):
+            writer.writerow(["" if value is None else value for value in row])
+    return path, csv_path
+
+
+def write_employees(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["姓名", "员工ID", "部门"])
+    for row in [["张三", 1001, "销售部"], ["李四", 1002, "财务部"], ["张三", 1003, "技术部"]]:
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def test_secondary_key_separates_same_name():
+    schedule_df = pd.DataFrame({"姓名": ["张三", "李四", "张三"], "员工ID": [1001, 1002, 1003],
+                                "部门": ["销售部", "财务部", "技术部"]})
+    directory = EmployeeDirectory(schedule_df, ["员工ID", "部门"], secondary_key="员工ID")
+    df = pd.DataFrame({"姓名": ["张三", "张三", "张三"], "员工ID": "", "部门": ""})
+    # Excel中含空值的数字列读成float
+    assert directory.fill(df, key_values=pd.Series([1001.0, 1003.0, None])) == 3
+    assert df["部门"].tolist() == ["销售部", "技术部", "技术部"]
+    assert directory.check_names(df["姓名"], pd.Series([1001, 1003, None])) == ([], ["张三"])
+    assert directory.check_names(df["姓名"][:2], pd.Series([1001, 1003])) == ([], [])
+
+
+@pytest.mark.parametrize("source", ["xlsx", "csv"])
+@pytest.mark.parametrize("options", [{"fused": True}, {"fused": False}, {"fused": True, "streaming": True}])
+def test_same_name_employees_match_by_report_key(tmp_path, source, options):
+    report, csv_report = write_report(str(tmp_path / "7月.xlsx"),
+                                      [("张三", 1001), ("李四", 1002), ("张三", 1003), ("张三", None)])
+    employee_file = write_employees(str(tmp_path / "员工信息.xlsx"))
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+
+    result = run_pipeline(report if source == "xlsx" else csv_report, employee_file, str(output_dir), **options)
+
+    assert result["status"] == "success", result.get("error")
+    df = pd.read_excel(result["output_file"])
+    assert df[["姓名", "员工ID", "部门"]].values.tolist() == [
+        ["张三", 1001, "销售部"], ["李四", 1002, "财务部"], ["张三", 1003, "技术部"],
+        # 月报中没有工号时按最后一条记录匹配
+        ["张三", 1003, "技术部"],
+    ]
+    # 工号列只用于匹配，不输出
+    assert list(df.columns) == ["姓名", "员工ID", "部门"] + DAYS
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+from openpyxl import load_workbook
+
+from difftest import compare_workbooks, read_values
+from pipeline import run_pipeline
+from synth import generate_employee_file, generate_report
+
+EMPLOYEES = 20
+DAYS = 5
+
+
+def add_day(source, path, correct=False):
+    """月初至今月报的下一天：每个工作表末尾增加一个日期列；correct 为True时同时更正第一天的一个单元格"""
+    wb = load_workbook(source)
+    for ws in wb.worksheets:
+        column = ws.max_column + 1
+        ws.cell(row=3, column=column).value = DAYS + 1
+        ws.cell(row=4, column=column).value = "六"
+        for row in range(5, ws.max_row + 1):
+            ws.cell(row=row, column=column).value = "迟到5分钟-正常" if row % 3 else "缺卡(09:00);正常"
+        if correct:
+            ws.cell(row=6, column=column - DAYS).value = "正常(补卡)-正常"
+    wb.save(path)
+    return path
+
+
+@pytest.mark.parametrize("correct", [False, True])
+def test_new_day_column_reuses_earlier_columns(tmp_path, correct):
+    generated = generate_report(str(tmp_path / "生成.xlsx"), EMPLOYEES, DAYS, sheets=2, seed=2)
+    # 与下一天的月报由同一写出方式保存
+    report = str(tmp_path / "月报.xlsx")
+    load_workbook(generated).save(report)
+    next_report = add_day(report, str(tmp_path / "月报_次日.xlsx"), correct)
+    employee_file = generate_employee_file(str(tmp_path / "员工信息.xlsx"), EMPLOYEES, seed=2)
+    state_file = str(tmp_path / "state.pkl")
+    work_dir, full_dir = tmp_path / "out", tmp_path / "full"
+    work_dir.mkdir()
+    full_dir.mkdir()
+
+    first = run_pipeline(report, employee_file, str(work_dir), fused=True, summary=True, incremental=state_file)
+    result = run_pipeline(next_report, employee_file, str(work_dir), fused=True, summary=True,
+                          incremental=state_file)
+    full = run_pipeline(next_report, employee_file, str(full_dir), fused=True, summary=True)
+
+    assert first["status"] == result["status"] == full["status"] == "success"
+    # 已有的日期列沿用上次的结果（更正过的列重新清洗），只清洗新增的日期列
+    reused_columns = DAYS - 1 if correct else DAYS
+    assert [sheet.get("reused") for sheet in result["report"]["stages"]["新01"]["sheets"]] == \
+        [EMPLOYEES * reused_columns] * 2
+    for name in ("原始数据.xlsx", "原始数据_异常汇总.xlsx"):
+        assert compare_workbooks(read_values(os.path.join(full_dir, name)),
+                                 read_values(os.path.join(work_dir, name))) == []
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from employees import EmployeeDirectory
+from layout import default_layout
+from profiles import compile_profile
+from 新01 import process_sheet
+
+
+def fixed_layout_sheet(width):
+    """固定布局的工作表：前四行为表头，之后两名员工，共width列"""
+    rows = [["标题"] + [None] * (width - 1), ["生成时间"] + [None] * (width - 1),
+            ["姓名"] + [f"统计项{index}" for index in range(1, width)], [None] * width]
+    rows += [[name] + ["正常"] * (width - 1) for name in ["张三", "李四"]]
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("profile, width, processed", [
+    # 0.py 要求至少27列（至少一个日期列）
+    ("legacy", 26, False),
+    ("legacy", 27, True),
+    # 新01 只要求46列
+    ("current", 45, False),
+    ("current", 46, True),
+])
+def test_fixed_layout_width_threshold(profile, width, processed):
+    plan = compile_profile(profile)
+    schedule_df = pd.DataFrame({"姓名": ["张三"], "员工ID": [1], "部门": ["销售部"], "班次": ["早班"]})
+    directory = EmployeeDirectory(schedule_df, plan.profile.join_fields)
+    logs = []
+    df = process_sheet(fixed_layout_sheet(width), "7月", directory, plan.cleaner("clean_cell"), log=logs.append,
+                       layout=default_layout(plan.day_start), min_day_columns=plan.min_day_columns)
+    assert (df is not None) == processed
+    if not processed:
+        assert logs == [f"工作表 7月 列数不足{plan.day_start + plan.min_day_columns}列，已跳过"]
@@ -0,0 +1,20 @@
+import importlib
+
+from difftest import compare_workbooks, read_values
+from reference import reference_process
+from synth import generate_employee_file, generate_report
+
+
+def test_legacy_scripts_match_reference(tmp_path):
+    report = generate_report(str(tmp_path / "月报.xlsx"), 20, 31, 2, layout="legacy", seed=1)
+    employee_file = generate_employee_file(str(tmp_path / "班次.xlsx"), 20, month_column="班次", seed=1)
+    processed = str(tmp_path / "月报_processed.xlsx")
+    replaced = str(tmp_path / "月报_replaced.xlsx")
+    expected = str(tmp_path / "参考结果.xlsx")
+
+    # 0.py / 1.py 的文件名不是合法标识符，只能按名称导入
+    importlib.import_module("0").process_excel(report, employee_file, processed, month_column="班次")
+    importlib.import_module("1").replace_excel_content(processed, replaced)
+
+    reference_process(report, employee_file, expected, "legacy")
+    assert compare_workbooks(read_values(expected), read_values(replaced)) == []
@@ -0,0 +1,20 @@
+import pytest
+
+from pipeline import run_pipeline
+from synth import generate_employee_file, generate_report
+
+
+@pytest.mark.parametrize("fused", [False, True])
+def test_rule_sets_without_hits_are_reported(tmp_path, fused):
+    # 所有日期列都是 正常-正常：只命中 正常-，迟到/早退/旷工 的分号规则一条都不命中
+    report = generate_report(str(tmp_path / "月报.xlsx"), 5, 3, cell_value=lambda rng, weekend: "正常-正常")
+    employee_file = generate_employee_file(str(tmp_path / "员工信息.xlsx"), 5)
+
+    result = run_pipeline(report, employee_file, str(tmp_path), fused=fused, rule_hits=True)
+
+    assert result["status"] == "success", result.get("error")
+    hits = {name: counts for stage in result["report"]["stages"].values() for name, counts in
+            (stage["rule_hits"] or {}).items()}
+    assert set(hits) == {"新01.patterns_to_replace", "新02.patterns_to_replace", "新02.patterns_to_replace2"}
+    assert set(hits["新02.patterns_to_replace2"].values()) == {0}
+    assert hits["新01.patterns_to_replace"][r'正常-'] == 15